@@ -0,0 +1,157 @@
+
+import multiprocessing
+import threading
+
+import pygame
+
+from board import ChessBoard
+from cache import PositionCache
+from engine import Searcher, format_score, MAX_DEPTH, MATE_BOUND
+from tablebase import Tablebases
+
+# Posted to the pygame event queue whenever a new analysis result arrives,
+# so an idle main loop blocked in pygame.event.wait wakes up to show it
+ANALYSIS_EVENT = pygame.event.custom_type()
+
+# Longest principal variation sent back to the UI, in plies
+PV_LENGTH = 8
+
+
+class AnalysisInfo:
+
+    def __init__(self, fen, depth, score, pv, nodes, elapsed):
+        self.fen = fen
+        self.depth = depth
+        self.score = score  # Formatted from White's point of view, e.g. '+0.35' or '-M2'
+        self.pv = pv  # SAN moves of the principal variation
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def get_summary(self):
+        return f"d{self.depth} {self.score} {' '.join(self.pv)}"
+
+
+def _analysis_worker(jobs, results, generation, max_depth, cache_path):
+    """Worker process: deepen on each submitted position until it is superseded."""
+    board = ChessBoard()
+    tablebases = Tablebases()
+    # Positions recur across games and history steps, so results found
+    # earlier, in this or a previous session, are shown at once
+    cache = PositionCache(path=cache_path)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_generation, fen = job
+        if job_generation != generation.value:
+            continue  # A newer position was submitted while this one was queued
+
+        cache.sync()
+        board.set_fen(fen)
+        cached_depth = 0
+        cached = cache.get_search(board)
+        if cached is not None:
+            cached_depth, score, line = cached
+            _post_result(results, job_generation, board, fen, cached_depth, score, line, 0, 0.0)
+            if cached_depth >= max_depth or not line or abs(score) >= MATE_BOUND:
+                continue
+            
+        searcher = Searcher(board, should_stop=lambda: generation.value != job_generation,
+                            tablebases=tablebases)
+        for depth, score, line in searcher.iterate(max_depth):
+            cache.store_search(board, depth, score, line)
+            if depth > cached_depth:
+                _post_result(results, job_generation, board, fen, depth, score, line,
+                             searcher.nodes, searcher.elapsed())
+    cache.close()
+
+
+def _post_result(results, job_generation, board, fen, depth, score, line, nodes, elapsed):
+    color = board.side_to_move
+    pv = []
+    for move in line[:PV_LENGTH]:
+        pv.append(board.get_san(*move))
+        board._apply_move(*move)
+    board.set_fen(fen)
+    results.put((job_generation, AnalysisInfo(fen, depth, format_score(score, color), pv,
+                                              nodes, elapsed)))
+
+
+class AnalysisService:
+    """Analyses positions in a separate process without blocking the pygame loop.
+
+    Each call to ``analyse`` cancels the running search, which notices the
+    change within a few nodes. Results for the current position are kept in
+    ``latest`` and announced with an ANALYSIS_EVENT.
+    """
+
+    def __init__(self, max_depth=MAX_DEPTH, cache_path=None):
+        self.max_depth = max_depth
+        self.cache_path = cache_path  # Persistent result cache, or None to keep it in memory
+        self.latest = None
+        self._process = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._process is not None:
+            return
+        # A fresh interpreter keeps SDL state from the parent out of the worker
+        context = multiprocessing.get_context('spawn')
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self._generation = context.Value('i', 0, lock=False)
+        self._process = context.Process(target=_analysis_worker,
+                                        args=(self._jobs, self._results, self._generation,
+                                              self.max_depth, self.cache_path),
+                                        daemon=True)
+        self._process.start()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def analyse(self, fen):
+        """Start analysing ``fen``, abandoning whatever was being analysed."""
+        self.start()
+        with self._lock:
+            self._generation.value += 1
+            self.latest = None
+            self._jobs.put((self._generation.value, fen))
+
+    def stop(self):
+        """Abandon the current analysis."""
+        if self._process is None:
+            return
+        with self._lock:
+            self._generation.value += 1
+            self.latest = None
+
+    def close(self):
+        if self._process is None:
+            return
+        self.stop()
+        self._jobs.put(None)
+        self._results.put(None)
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._listener.join(timeout=1.0)
+        self._process = None
+
+    def _listen(self):
+        """Move results from the worker into ``latest`` and wake the UI."""
+        while True:
+            try:
+                result = self._results.get()
+            except (EOFError, OSError):
+                return
+            if result is None:
+                return
+            job_generation, info = result
+            with self._lock:
+                if job_generation != self._generation.value:
+                    continue
+                self.latest = info
+            try:
+                pygame.event.post(pygame.event.Event(ANALYSIS_EVENT))
+            except pygame.error:
+                pass  # Display already shut down
@@ -0,0 +1,201 @@
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from board import ChessBoard
+from move import RECORD_TYPECODE
+from pgn import read_games, RESULTS
+from constants import *
+
+# An archive is two files side by side:
+#   <path>.moves  every game's packed move records (see move.py), back to back
+#   <path>.index  one fixed-width entry per game: first record, ply count, result
+# Both are in native byte order, as MoveHistory's record array is, so move
+# lists can be viewed in place without decoding.
+MOVES_SUFFIX = '.moves'
+INDEX_SUFFIX = '.index'
+INDEX_ENTRY = struct.Struct('=QIB3x')
+RECORD_SIZE = array(RECORD_TYPECODE).itemsize
+
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+
+def _map(path):
+    with open(path, 'rb') as fp:
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return b''
+
+
+class GameArchive:
+    """Append-only store of games as packed move records.
+
+    Both files are memory-mapped, so game ``n`` or any one of its plies is
+    found with a single index lookup and no parsing. ``moves`` hands out
+    memoryview slices of the mapping rather than copies. A mapping that
+    still has such views when the archive is flushed or closed is left to
+    be unmapped once the last of them is released. Games appended after
+    opening become visible once they are flushed.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self._moves_file = self._index_file = None
+        if writable:
+            # Created if missing; appends always go to the end of both files
+            self._moves_file = open(path + MOVES_SUFFIX, 'ab')
+            self._index_file = open(path + INDEX_SUFFIX, 'ab')
+            # Records left behind by an interrupted append are never indexed,
+            # so new games start after them rather than after the last entry
+            end = self._moves_file.tell()
+            records_on_disk = end // RECORD_SIZE
+            if end % RECORD_SIZE:
+                self._moves_file.write(bytes(RECORD_SIZE - end % RECORD_SIZE))
+            self._next_record = -(-end // RECORD_SIZE)
+            # Likewise a partly written index entry is cut off, so the next
+            # entry lands on an entry boundary, and so are whole entries whose
+            # records never reached the moves file: new games would otherwise
+            # be written into the range they claim
+            index_end = self._index_file.seek(0, os.SEEK_END)
+            index_end -= index_end % INDEX_ENTRY.size
+            with open(path + INDEX_SUFFIX, 'rb') as fp:
+                while index_end:
+                    fp.seek(index_end - INDEX_ENTRY.size)
+                    start, plies, _ = INDEX_ENTRY.unpack(fp.read(INDEX_ENTRY.size))
+                    if start + plies <= records_on_disk:
+                        break
+                    index_end -= INDEX_ENTRY.size
+            if index_end != self._index_file.tell():
+                self._index_file.truncate(index_end)
+                self._index_file.seek(index_end)
+            self._next_game = index_end // INDEX_ENTRY.size
+        self._moves_map = self._index_map = b''
+        self._records = memoryview(b'').cast(RECORD_TYPECODE)
+        self._size = 0
+        self._remap()
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        for game in range(self._size):
+            yield self.moves(game)
+
+    def _remap(self):
+        self._unmap()
+        self._moves_map = _map(self.path + MOVES_SUFFIX)
+        self._index_map = _map(self.path + INDEX_SUFFIX)
+        usable = len(self._moves_map) // RECORD_SIZE * RECORD_SIZE
+        self._records = memoryview(self._moves_map)[:usable].cast(RECORD_TYPECODE)
+        self._size = len(self._index_map) // INDEX_ENTRY.size
+
+    def _unmap(self):
+        self._records.release()
+        for data in (self._moves_map, self._index_map):
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    pass  # Views from moves() still use it; it goes with the last of them
+
+    def _entry(self, game):
+        if not 0 <= game < self._size:
+            raise IndexError(f"game {game} out of range for {self._size} games")
+        return INDEX_ENTRY.unpack_from(self._index_map, game * INDEX_ENTRY.size)
+
+    def moves(self, game):
+        """Return game ``game``'s move records as a memoryview of unsigned 64-bit ints."""
+        start, plies, _ = self._entry(game)
+        return self._records[start:start + plies]
+
+    def move(self, game, ply):
+        """Return the packed record of ``ply`` (0-based) in game ``game``."""
+        start, plies, _ = self._entry(game)
+        if not 0 <= ply < plies:
+            raise IndexError(f"ply {ply} out of range for a game of {plies} plies")
+        return self._records[start + ply]
+
+    def ply_count(self, game):
+        return self._entry(game)[1]
+
+    def result(self, game):
+        return RESULTS[self._entry(game)[2]]
+
+    def append(self, records, result='*'):
+        """Add a game, given its move records, and return its number."""
+        if self._moves_file is None:
+            raise ValueError("archive was opened read-only")
+        records = array(RECORD_TYPECODE, records)
+        self._moves_file.write(records.tobytes())
+        self._index_file.write(INDEX_ENTRY.pack(self._next_record, len(records),
+                                                RESULT_CODES.get(result, RESULT_CODES['*'])))
+        self._next_record += len(records)
+        self._next_game += 1
+        return self._next_game - 1
+
+    def flush(self):
+        """Write appended games out and make them readable through this archive."""
+        self._write_out()
+        self._remap()
+
+    def _write_out(self):
+        # Moves reach the disk before the index entries that point at them
+        if self._moves_file is not None:
+            self._moves_file.flush()
+            os.fsync(self._moves_file.fileno())
+            self._index_file.flush()
+
+    def replay(self, game, ply=None, board=None):
+        """Return a board showing game ``game`` after ``ply`` plies (all by default)."""
+        board = board or ChessBoard()
+        board.reset()
+        for record in self.moves(game)[:ply]:
+            board.replay_move(record)
+        return board
+
+    def close(self):
+        self._unmap()
+        self._moves_map = self._index_map = b''
+        self._records = memoryview(b'').cast(RECORD_TYPECODE)
+        self._size = 0
+        if self._moves_file is not None:
+            self._write_out()
+            self._moves_file.close()
+            self._index_file.close()
+            self._moves_file = self._index_file = None
+
+
+def import_pgn(pgn_paths, archive_path):
+    """Append the games of PGN files to an archive; returns (imported, skipped).
+
+    Only games from the standard start position whose moves all resolve are
+    kept, since records are replayed from the initial position.
+    """
+    imported = skipped = 0
+    with GameArchive(archive_path, writable=True) as archive:
+        for path in pgn_paths:
+            for game in read_games(path):
+                if not game.is_valid() or game.get_start_fen() != INITIAL_FEN:
+                    skipped += 1
+                    continue
+                archive.append(game.records, game.result)
+                imported += 1
+    return imported, skipped
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python archive.py GAMES.pgn [MORE.pgn ...] ARCHIVE")
+        sys.exit(1)
+    imported, skipped = import_pgn(sys.argv[1:-1], sys.argv[-1])
+    print(f"Archived {imported} games to {sys.argv[-1]} ({skipped} skipped)")
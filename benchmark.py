@@ -0,0 +1,258 @@
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from board import ChessBoard
+from move_history import MoveHistory
+from constants import *
+
+BASELINE_PATH = 'bench_baseline.json'
+
+# Median slowdown against the baseline that counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+WARMUP_SECONDS = 0.05
+SAMPLE_SECONDS = 0.02
+REPEATS = 21
+
+# Fixed positions every benchmark runs over: opening, middlegames with
+# castling and pins, en passant, checks, a promotion race and a mate
+CORPUS = [
+    INITIAL_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bq1rk1/pp2bppp/2n1pn2/2pp4/3P4/2PBPN2/PP1N1PPP/R2QK2R w KQ - 0 8",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/P6k/8/8/8/8/6p1/K7 w - - 0 1",
+]
+
+# Moves replayed into the history for get_move_pairs
+HISTORY_GAME = ("e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8 d4 Nbd7 "
+                "c4 c6 cxb5 axb5 Nc3 Bb7 Bg5 b4 Nb1 h6 Bh4 c5 dxe5 Nxe4 Bxe7 Qxe7 exd6 Qf6 "
+                "Nbd2 Nxd6 Nc4 Nxc4 Bxc4 Nb6 Ne5 Rae8 Bxf7+ Rxf7 Nxf7 Rxe1+ Qxe1 Kxf7").split()
+
+
+def _load_corpus():
+    boards = []
+    for fen in CORPUS:
+        board = ChessBoard()
+        board.set_fen(fen)
+        boards.append(board)
+    return boards
+
+
+def _first_quiet_move(board):
+    for from_square, to_square, promotion in sorted(board._legal_move_list()):
+        if promotion is None and to_square not in board.pieces:
+            return from_square, to_square
+    return None
+
+
+def bench_get_piece_at_square(boards):
+    bitboards = [board.bitboard for board in boards]
+
+    def run():
+        for bitboard in bitboards:
+            for square in range(64):
+                bitboard.get_piece_at_square(square)
+    return run
+
+
+def bench_move_piece(boards):
+    cases = [(board.bitboard, _first_quiet_move(board)) for board in boards]
+    cases = [(bitboard, move) for bitboard, move in cases if move]
+
+    def run():
+        for bitboard, (from_square, to_square) in cases:
+            bitboard.move_piece(from_square, to_square)
+            bitboard.move_piece(to_square, from_square)
+    return run
+
+
+def bench_bitboard_is_king_in_check(boards):
+    bitboards = [board.bitboard for board in boards]
+
+    def run():
+        for bitboard in bitboards:
+            bitboard.is_king_in_check(WHITE)
+            bitboard.is_king_in_check(BLACK)
+    return run
+
+
+def bench_bitboard_copy(boards):
+    bitboards = [board.bitboard for board in boards]
+
+    def run():
+        for bitboard in bitboards:
+            bitboard.copy()
+    return run
+
+
+def bench_get_legal_moves(boards):
+    # The move cache is dropped first so every call measures generation
+    cases = [(board, [square for square, piece in board.pieces.items()
+                      if piece.color == board.side_to_move]) for board in boards]
+
+    def run():
+        for board, squares in cases:
+            board._invalidate_move_cache()
+            for square in squares:
+                board.get_legal_moves(square)
+    return run
+
+
+def bench_make_move(boards):
+    cases = [(board, _first_quiet_move(board)) for board in boards]
+    cases = [(board, move) for board, move in cases if move]
+
+    def run():
+        for board, (from_square, to_square) in cases:
+            board.make_move(from_square, to_square)
+            board.unmake_move(board.last_move)
+    return run
+
+
+def bench_is_checkmate(boards):
+    def run():
+        for board in boards:
+            board._invalidate_move_cache()
+            board.is_checkmate(board.side_to_move)
+    return run
+
+
+def bench_get_move_pairs(boards):
+    board = ChessBoard()
+    history = MoveHistory()
+    for san in HISTORY_GAME:
+        color = board.side_to_move
+        history.add_move(san, color, board.make_san_move(san), board)
+
+    def run():
+        history.get_move_pairs()
+    return run
+
+
+BENCHMARKS = {
+    'Bitboard.get_piece_at_square': bench_get_piece_at_square,
+    'Bitboard.move_piece': bench_move_piece,
+    'Bitboard.is_king_in_check': bench_bitboard_is_king_in_check,
+    'Bitboard.copy': bench_bitboard_copy,
+    'ChessBoard.get_legal_moves': bench_get_legal_moves,
+    'ChessBoard.make_move': bench_make_move,
+    'ChessBoard.is_checkmate': bench_is_checkmate,
+    'MoveHistory.get_move_pairs': bench_get_move_pairs,
+}
+
+
+def measure(run, repeats=REPEATS):
+    """Time ``run`` and return per-call statistics in microseconds."""
+    # Warm up caches and find how many calls fill one sample
+    number = 1
+    start = time.perf_counter()
+    while time.perf_counter() - start < WARMUP_SECONDS:
+        run()
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if time.perf_counter() - start >= SAMPLE_SECONDS:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    samples.sort()
+    return {
+        'median_us': round(statistics.median(samples), 3),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_us': round(samples[0], 3),
+        'calls_per_sample': number,
+    }
+
+
+def run_benchmarks(names=None, repeats=REPEATS):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        # Fresh boards per benchmark so one benchmark's caches cannot help another
+        results[name] = measure(setup(_load_corpus()), repeats)
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return [(name, baseline_us, current_us, change)] for benchmarks slower than allowed."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        change = result['median_us'] / previous['median_us'] - 1
+        if change > threshold:
+            regressions.append((name, previous['median_us'], result['median_us'], change))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    baseline = {'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results}
+    with open(path, 'w') as fp:
+        json.dump(baseline, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
+def format_results(results, baseline=None):
+    lines = [f"{'benchmark':<32}{'median us':>12}{'p95 us':>12}{'vs base':>10}"]
+    for name, result in results.items():
+        previous = (baseline or {}).get('results', {}).get(name)
+        change = f"{result['median_us'] / previous['median_us'] - 1:+.1%}" if previous else '-'
+        lines.append(f"{name:<32}{result['median_us']:>12.2f}{result['p95_us']:>12.2f}{change:>10}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the board primitives over a fixed corpus.")
+    parser.add_argument('names', nargs='*', help="only run benchmarks whose name contains one of these")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('--save', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="allowed median slowdown, as a fraction")
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names, args.repeats)
+    baseline = load_baseline(args.baseline)
+    print(format_results(results, baseline))
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+    for name, previous, current, change in regressions:
+        print(f"REGRESSION {name}: {previous:.2f} us -> {current:.2f} us ({change:+.1%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
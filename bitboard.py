@@ -1,6 +1,77 @@
 
+from profiling import profiled
 from constants import *
 
+KING_OFFSETS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+# Rook directions first, then bishop directions
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _build_attack_tables():
+    king_targets, king_masks, knight_masks, rays = [], [], [], []
+    pawn_masks = {WHITE: [], BLACK: []}
+    for square in range(64):
+        file, rank = square % 8, square // 8
+
+        def steps(offsets):
+            return [(rank + dr) * 8 + file + df for df, dr in offsets
+                    if 0 <= file + df < 8 and 0 <= rank + dr < 8]
+
+        king_targets.append(steps(KING_OFFSETS))
+        king_masks.append(sum(1 << s for s in king_targets[-1]))
+        knight_masks.append(sum(1 << s for s in steps(KNIGHT_OFFSETS)))
+        pawn_masks[WHITE].append(sum(1 << s for s in steps([(-1, 1), (1, 1)])))
+        pawn_masks[BLACK].append(sum(1 << s for s in steps([(-1, -1), (1, -1)])))
+
+        square_rays = []
+        for df, dr in DIRECTIONS:
+            ray = []
+            f, r = file + df, rank + dr
+            while 0 <= f < 8 and 0 <= r < 8:
+                ray.append(r * 8 + f)
+                f, r = f + df, r + dr
+            square_rays.append(ray)
+        rays.append(square_rays)
+    return king_targets, king_masks, knight_masks, pawn_masks, rays
+
+
+# Per-square lookup tables: king target lists, attack masks (pawn masks are
+# per colour) and the squares along each of the eight directions
+KING_TARGETS, KING_MASKS, KNIGHT_MASKS, PAWN_MASKS, RAYS = _build_attack_tables()
+
+
+def attacks_from(piece_type, color, square, occupied):
+    """Bitmask of the squares a piece on ``square`` attacks given the occupied squares."""
+    if piece_type == KNIGHT:
+        return KNIGHT_MASKS[square]
+    if piece_type == KING:
+        return KING_MASKS[square]
+    if piece_type == PAWN:
+        return PAWN_MASKS[color][square]
+
+    rays = RAYS[square]
+    if piece_type == ROOK:
+        rays = rays[:4]
+    elif piece_type == BISHOP:
+        rays = rays[4:]
+    mask = 0
+    for ray in rays:
+        for target in ray:
+            mask |= 1 << target
+            if occupied >> target & 1:
+                break
+    return mask
+
+
+def iter_squares(mask):
+    """Yield the squares of the set bits in ``mask``, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
 class Bitboard:
     
     def __init__(self):
@@ -112,6 +183,7 @@ class Bitboard:
         pieces = self.white_pieces if color == WHITE else self.black_pieces
         return bool(pieces & square_bit)
         
+    @profiled('Bitboard.get_attacks_to_square')
     def get_attacks_to_square(self, square, attacking_color):
         attacks = []
         square_bit = 1 << square
@@ -122,20 +194,27 @@ class Bitboard:
                 
         return attacks
         
+    @profiled('Bitboard.attack_map')
+    def attack_map(self, color, occupied=None):
+        """Bitmask of every square attacked by ``color``'s pieces."""
+        if occupied is None:
+            occupied = self.all_pieces
+        attacks = 0
+        for piece_type, board in self.boards[color].items():
+            for square in iter_squares(board):
+                attacks |= attacks_from(piece_type, color, square, occupied)
+        return attacks
+        
+    @profiled('Bitboard.is_king_in_check')
     def is_king_in_check(self, color):
-        king_square = None
-        for square in range(64):
-            piece = self.get_piece_at_square(square)
-            if piece and piece == (color, KING):
-                king_square = square
-                break
-                
+        king_square = self._bit_scan_forward(self.boards[color][KING])
         if king_square is None:
             return False
             
         enemy_color = BLACK if color == WHITE else WHITE
         return self._square_under_attack(king_square, enemy_color)
         
+    @profiled('Bitboard.square_under_attack')
     def _square_under_attack(self, square, attacking_color):
         return (self._pawn_attacks_square(square, attacking_color) or
                 self._rook_attacks_square(square, attacking_color) or
@@ -191,7 +270,8 @@ class Bitboard:
         return attacks
         
     def _rook_attacks_square(self, square, attacking_color):
-        rook_board = self.boards[attacking_color][ROOK]
+        # Queens attack along the same lines
+        rook_board = self.boards[attacking_color][ROOK] | self.boards[attacking_color][QUEEN]
         if not rook_board:
             return False
             
@@ -212,7 +292,7 @@ class Bitboard:
         return False
         
     def _bishop_attacks_square(self, square, attacking_color):
-        bishop_board = self.boards[attacking_color][BISHOP]
+        bishop_board = self.boards[attacking_color][BISHOP] | self.boards[attacking_color][QUEEN]
         if not bishop_board:
             return False
             
@@ -295,6 +375,7 @@ class Bitboard:
                 pieces.append((square, piece[1]))
         return pieces
         
+    @profiled('Bitboard.copy')
     def copy(self):
         new_bb = Bitboard()
         new_bb.boards = {
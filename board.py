@@ -1,8 +1,79 @@
 
-from bitboard import Bitboard
+from bitboard import Bitboard, KING_MASKS, KNIGHT_MASKS, PAWN_MASKS, RAYS, attacks_from, iter_squares
 from piece import Pawn, Rook, Knight, Bishop, Queen, King
+from move import (encode_move, decode_move, move_to, set_promotion, NO_PIECE,
+                  FLAG_CASTLING, FLAG_EN_PASSANT, FLAG_FIRST_MOVE, FLAG_CAPTURED_MOVED)
+from profiling import profiled
 from constants import *
 
+PIECE_CLASSES = {PAWN: Pawn, ROOK: Rook, KNIGHT: Knight,
+                 BISHOP: Bishop, QUEEN: Queen, KING: King}
+
+FEN_PIECES = {symbol: (color, piece_type)
+              for color, symbols in PIECE_SYMBOLS.items()
+              for piece_type, symbol in symbols.items()}
+FEN_CASTLING = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE,
+                'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+CASTLING_SQUARES = {WHITE_KINGSIDE: (E1, H1), WHITE_QUEENSIDE: (E1, A1),
+                    BLACK_KINGSIDE: (E8, H8), BLACK_QUEENSIDE: (E8, A8)}
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+PROMOTION_PIECES = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+ALL_SQUARES = (1 << 64) - 1
+
+# Whatever the start squares, castling puts the king on the g- or c-file and
+# the rook next to it on the f- or d-file
+CASTLING_TARGETS = {WHITE_KINGSIDE: (G1, F1), WHITE_QUEENSIDE: (C1, D1),
+                    BLACK_KINGSIDE: (G8, F8), BLACK_QUEENSIDE: (C8, D8)}
+CASTLING_COLORS = {WHITE_KINGSIDE: WHITE, WHITE_QUEENSIDE: WHITE,
+                   BLACK_KINGSIDE: BLACK, BLACK_QUEENSIDE: BLACK}
+KINGSIDE_RIGHTS = WHITE_KINGSIDE | BLACK_KINGSIDE
+
+# Rough piece values for deciding whether an attacked piece is hanging
+THREAT_VALUES = {PAWN: 1, KNIGHT: 3, BISHOP: 3, ROOK: 5, QUEEN: 9, KING: 100}
+
+
+def _span(first, last):
+    """Mask of the squares from ``first`` to ``last`` inclusive, along one rank."""
+    low, high = min(first, last), max(first, last)
+    return ((1 << (high + 1)) - 1) & ~((1 << low) - 1)
+
+
+def chess960_fen(number):
+    """Return the FEN of Chess960 start position ``number`` (0-959; 518 is standard)."""
+    if not 0 <= number < 960:
+        raise ValueError(f"Chess960 positions are numbered 0-959, not {number}")
+    rank = [None] * 8
+    number, light = divmod(number, 4)
+    number, dark = divmod(number, 4)
+    rank[light * 2 + 1] = 'b'
+    rank[dark * 2] = 'b'
+    number, queen = divmod(number, 6)
+    empty = [file for file in range(8) if rank[file] is None]
+    rank[empty[queen]] = 'q'
+    knights = [(0, 1), (0, 2), (0, 3), (0, 4), (1, 2), (1, 3), (1, 4), (2, 3), (2, 4), (3, 4)]
+    empty = [file for file in range(8) if rank[file] is None]
+    for index in knights[number]:
+        rank[empty[index]] = 'n'
+    # The king always sits between the two rooks
+    for file, symbol in zip([file for file in range(8) if rank[file] is None], 'rkr'):
+        rank[file] = symbol
+    black = ''.join(rank)
+    return f"{black}/pppppppp/8/8/8/8/PPPPPPPP/{black.upper()} w KQkq - 0 1"
+
+
+class Threats:
+    """Attacks in one position, as square masks covering both sides."""
+
+    def __init__(self, attacked, hanging, pinned):
+        self.attacked = attacked  # Color -> squares its pieces attack or defend
+        self.hanging = hanging  # Pieces attacked and undefended, or attacked by a cheaper piece
+        self.pinned = pinned  # Pieces pinned to their own king
+
+    def key(self):
+        return (self.attacked[WHITE], self.attacked[BLACK], self.hanging, self.pinned)
+
+
 class ChessBoard:
     
     
@@ -12,12 +83,50 @@ class ChessBoard:
         self.pieces = {}  # Square -> Piece mapping
         self.en_passant_target = None  # En passant target square
         self.castling_rights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.side_to_move = WHITE
+        self.last_move = None  # Packed record of the most recent move
+        # Per-position move cache for the side to move, filled on demand by a
+        # single generation pass and dropped whenever the position changes
+        self._legal_moves = None  # [(from, to, promotion)]
+        self._moves_by_square = None  # from square -> [to squares]
+        self._game_status = None  # 'ongoing', 'check', 'checkmate' or 'stalemate'
+        self._san_moves = None  # SAN -> move lookup table
+        self._threats = None  # Threats, for the overlay
         self.set_initial_position()
         
     def set_initial_position(self):
         
         self.bitboard.set_initial_position()
         self._create_pieces()
+        self._setup_castling(CASTLING_SQUARES)
+        
+    def _setup_castling(self, castling_squares):
+        """Precompute castling for ``castling_squares``, {right: (king square, rook square)}.
+
+        Called once per setup, so generating castling moves takes two mask
+        tests per right. Rights whose king and rook start on the standard
+        squares castle by moving the king two squares; any other (Chess960)
+        right castles by moving the king onto its own rook.
+        """
+        self.castling_squares = dict(castling_squares)
+        # Per colour: [(right, king from, move destination, king to, rook from,
+        # rook to, squares that must be empty, squares that must not be attacked)]
+        self.castling_paths = {WHITE: [], BLACK: []}
+        self._castling_moves = {}  # (king from, move destination) -> path entry
+        self._castling_masks = {}  # Square -> rights lost when a move touches it
+        for right, (king_from, rook_from) in self.castling_squares.items():
+            king_to, rook_to = CASTLING_TARGETS[right]
+            destination = king_to if CASTLING_SQUARES[right] == (king_from, rook_from) else rook_from
+            empty = (_span(king_from, king_to) | _span(rook_from, rook_to)) & \
+                ~(1 << king_from | 1 << rook_from)
+            safe = _span(king_from, king_to) & ~(1 << king_from)
+            entry = (right, king_from, destination, king_to, rook_from, rook_to, empty, safe)
+            self.castling_paths[CASTLING_COLORS[right]].append(entry)
+            self._castling_moves[(king_from, destination)] = entry
+            color_rights = (WHITE_KINGSIDE | WHITE_QUEENSIDE if CASTLING_COLORS[right] == WHITE
+                            else BLACK_KINGSIDE | BLACK_QUEENSIDE)
+            self._castling_masks[king_from] = color_rights
+            self._castling_masks[rook_from] = self._castling_masks.get(rook_from, 0) | right
         
     def _create_pieces(self):
     
@@ -57,19 +166,124 @@ class ChessBoard:
         piece = self.get_piece(square)
         return piece is not None and piece.color == color
         
+    @profiled('ChessBoard.get_legal_moves')
     def get_legal_moves(self, square):
         piece = self.get_piece(square)
         if not piece:
             return []
             
-        possible_moves = piece.get_legal_moves(square, self)
-        legal_moves = []
-        for move in possible_moves:
-            if self._is_legal_move(square, move):
-                legal_moves.append(move)
+        if piece.color == self.side_to_move:
+            self._legal_move_list()
+            return list(self._moves_by_square.get(square, ()))
+        return list(dict.fromkeys(to_square for from_square, to_square, _
+                                  in self.all_legal_moves(piece.color) if from_square == square))
+        
+    @profiled('ChessBoard.all_legal_moves')
+    def all_legal_moves(self, color):
+        """Return every legal (from, to, promotion) move for ``color``.
+
+        The king square, checking pieces, pins and the enemy attack map are
+        worked out once, so apart from en passant no move needs a trial board.
+        Promotions are expanded into one move per promotion piece.
+        """
+        bitboard = self.bitboard
+        enemy = BLACK if color == WHITE else WHITE
+        boards = bitboard.boards[color]
+        enemy_boards = bitboard.boards[enemy]
+        own = bitboard.white_pieces if color == WHITE else bitboard.black_pieces
+        occupied = bitboard.all_pieces
+        # The enemy king can never be captured
+        capturable = occupied & ~own & ~enemy_boards[KING]
+        moves = []
+        
+        check_mask = ALL_SQUARES  # Destinations that answer a check
+        pins = {}  # Pinned square -> the line it may move along
+        king_square = bitboard._bit_scan_forward(boards[KING])
+        if king_square is not None:
+            # Squares behind the king on a checking line stay attacked once it steps away
+            enemy_attacks = bitboard.attack_map(enemy, occupied & ~boards[KING])
+            checkers = ((KNIGHT_MASKS[king_square] & enemy_boards[KNIGHT]) |
+                        (PAWN_MASKS[color][king_square] & enemy_boards[PAWN]))
+            checks = bin(checkers).count('1')
+            if checks:
+                check_mask = checkers
+                
+            straight = enemy_boards[ROOK] | enemy_boards[QUEEN]
+            diagonal = enemy_boards[BISHOP] | enemy_boards[QUEEN]
+            for direction, ray in enumerate(RAYS[king_square]):
+                sliders = straight if direction < 4 else diagonal
+                line = 0
+                shield = None
+                for square in ray:
+                    line |= 1 << square
+                    if not occupied >> square & 1:
+                        continue
+                    if own >> square & 1:
+                        if shield is not None:
+                            break
+                        shield = square
+                        continue
+                    if sliders >> square & 1:
+                        if shield is None:
+                            checks += 1
+                            check_mask = line
+                        else:
+                            pins[shield] = line
+                    break
+                    
+            for target in iter_squares(KING_MASKS[king_square] & ~own & ~enemy_attacks &
+                                       ~enemy_boards[KING]):
+                moves.append((king_square, target, None))
+            if checks > 1:
+                return moves  # Only the king can answer a double check
                 
-        return legal_moves
+            if not checks and not self.pieces[king_square].has_moved:
+                for (right, king_from, destination, king_to, rook_from, rook_to,
+                     empty, safe) in self.castling_paths[color]:
+                    if (self.castling_rights & right and king_square == king_from and
+                            not occupied & empty and not enemy_attacks & safe):
+                        # A Chess960 rook may be all that shields the king's
+                        # destination from a rook or queen along the back rank
+                        if destination != king_to and attacks_from(
+                                ROOK, color, king_to, occupied & ~(1 << king_from | 1 << rook_from)
+                        ) & (enemy_boards[ROOK] | enemy_boards[QUEEN]):
+                            continue
+                        moves.append((king_from, destination, None))
+                        
+        forward = 8 if color == WHITE else -8
+        start_rank = 1 if color == WHITE else 6
+        for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+            for square in iter_squares(boards[piece_type]):
+                if piece_type == PAWN:
+                    targets = PAWN_MASKS[color][square] & capturable
+                    push = square + forward
+                    if 0 <= push < 64 and not occupied >> push & 1:
+                        targets |= 1 << push
+                        if square // 8 == start_rank and not occupied >> (push + forward) & 1:
+                            targets |= 1 << (push + forward)
+                else:
+                    targets = attacks_from(piece_type, color, square, occupied) & ~own
+                    targets &= ~enemy_boards[KING]
+                targets &= check_mask
+                if square in pins:
+                    targets &= pins[square]
+                    
+                for target in iter_squares(targets):
+                    if piece_type == PAWN and target // 8 in (0, 7):
+                        moves.extend((square, target, promotion) for promotion in PROMOTION_PIECES)
+                    else:
+                        moves.append((square, target, None))
+                        
+        # En passant can uncover the king along the rank of both pawns, so it
+        # is checked on a trial board
+        target = self.en_passant_target
+        if target is not None and target // 8 == (5 if color == WHITE else 2):
+            for square in iter_squares(PAWN_MASKS[enemy][target] & boards[PAWN]):
+                if self._is_legal_move(square, target):
+                    moves.append((square, target, None))
+        return moves
         
+    @profiled('ChessBoard.is_legal_move')
     def _is_legal_move(self, from_square, to_square):
         piece = self.get_piece(from_square)
         if not piece:
@@ -80,12 +294,22 @@ class ChessBoard:
         
         return not king_in_check
         
+    @profiled('ChessBoard.make_temp_move')
     def _make_temp_move(self, from_square, to_square):
-        temp_board = ChessBoard()
+        # Skip __init__: setting up the initial position only to overwrite it
+        # dominated the cost of every legality check
+        temp_board = ChessBoard.__new__(ChessBoard)
         temp_board.bitboard = self.bitboard.copy()
         temp_board.pieces = self.pieces.copy()
         temp_board.en_passant_target = self.en_passant_target
         temp_board.castling_rights = self.castling_rights
+        temp_board.castling_squares = self.castling_squares
+        temp_board.castling_paths = self.castling_paths
+        temp_board._castling_moves = self._castling_moves
+        temp_board._castling_masks = self._castling_masks
+        temp_board.side_to_move = self.side_to_move
+        temp_board.last_move = None
+        temp_board._invalidate_move_cache()
         
         piece = temp_board.pieces.get(from_square)
         if piece:
@@ -93,38 +317,24 @@ class ChessBoard:
                 del temp_board.pieces[from_square]
             temp_board.pieces[to_square] = piece
             
+            if piece.type == PAWN and to_square == self.en_passant_target:
+                captured_square = to_square + (-8 if piece.color == WHITE else 8)
+                temp_board.pieces.pop(captured_square, None)
+                temp_board.bitboard.clear_square(captured_square)
+            
         temp_board.bitboard.move_piece(from_square, to_square)
         
         return temp_board
         
-    def _update_castling_rights(self, from_square, to_square, piece, captured_piece):
-        if piece.type == KING:
-            if piece.color == WHITE:
-                self.castling_rights &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
-            else:
-                self.castling_rights &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
-
-        elif piece.type == ROOK:
-            if from_square == 0:  # A1
-                self.castling_rights &= ~WHITE_QUEENSIDE
-            elif from_square == 7:  # H1
-                self.castling_rights &= ~WHITE_KINGSIDE
-            elif from_square == 56:  # A8
-                self.castling_rights &= ~BLACK_QUEENSIDE
-            elif from_square == 63:  # H8
-                self.castling_rights &= ~BLACK_KINGSIDE
-
-        if captured_piece and captured_piece.type == ROOK:
-            if to_square == 0:  # A1
-                self.castling_rights &= ~WHITE_QUEENSIDE
-            elif to_square == 7:  # H1
-                self.castling_rights &= ~WHITE_KINGSIDE
-            elif to_square == 56:  # A8
-                self.castling_rights &= ~BLACK_QUEENSIDE
-            elif to_square == 63:  # H8
-                self.castling_rights &= ~BLACK_KINGSIDE
-        
-    def make_move(self, from_square, to_square):
+    def _update_castling_rights(self, from_square, to_square):
+        # Moving the king, or a rook leaving or being captured on its start
+        # square, gives up the matching rights
+        masks = self._castling_masks
+        if from_square in masks or to_square in masks:
+            self.castling_rights &= ~(masks.get(from_square, 0) | masks.get(to_square, 0))
+        
+    @profiled('ChessBoard.make_move')
+    def make_move(self, from_square, to_square, promotion=None):
         piece = self.get_piece(from_square)
         if not piece:
             return None
@@ -133,59 +343,169 @@ class ChessBoard:
         if target_piece and target_piece.type == KING:
             return None
 
-        if to_square not in self.get_legal_moves(from_square):
+        # Without a promotion piece a pawn may still be moved to the last rank
+        # and promoted afterwards with promote_pawn
+        legal_moves = self._legal_move_list()
+        if promotion is None:
+            if not any(move[0] == from_square and move[1] == to_square for move in legal_moves):
+                return None
+        elif (from_square, to_square, promotion) not in legal_moves:
             return None
             
+        move_notation = self._get_move_notation(from_square, to_square, piece,
+                                                promotion, legal_moves)
+        
+        self.last_move = self._apply_move(from_square, to_square, promotion)
+        
+        return move_notation + self._check_suffix()
+        
+    def _castling_move(self, from_square, to_square, piece):
+        """Return the castling path entry if the move castles, else None."""
+        if piece.type != KING:
+            return None
+        castling = self._castling_moves.get((from_square, to_square))
+        # Once the right is gone the same squares can make an ordinary king move
+        if castling and self.castling_rights & castling[0]:
+            return castling
+        return None
+        
+    def _apply_move(self, from_square, to_square, promotion=None):
+        """Play a move without legality checks and return its packed record."""
+        self._invalidate_move_cache()
+        piece = self.pieces[from_square]
         captured_piece = self.get_piece(to_square)
         
-        move_notation = self._get_move_notation(from_square, to_square, piece)
+        castling = self._castling_move(from_square, to_square, piece)
+        flags = 0
+        if not piece.has_moved:
+            flags |= FLAG_FIRST_MOVE
+        if castling:
+            captured_piece = None  # A Chess960 king moves onto its own rook
+            flags |= FLAG_CASTLING
+        elif piece.type == PAWN and to_square == self.en_passant_target:
+            flags |= FLAG_EN_PASSANT
+            captured_piece = self.get_piece(to_square + (-8 if piece.color == WHITE else 8))
+        if captured_piece and captured_piece.has_moved:
+            flags |= FLAG_CAPTURED_MOVED
+            
+        record = encode_move(from_square, to_square, promotion or PAWN,
+                             captured_piece.type if captured_piece else NO_PIECE,
+                             flags, self.castling_rights, self.en_passant_target,
+                             self.bitboard.halfmove_clock)
         
         self._handle_special_moves(from_square, to_square, piece)
         
-        self.pieces[to_square] = piece
-        if from_square in self.pieces:
-            del self.pieces[from_square]
-            
-        self.bitboard.move_piece(from_square, to_square)
+        if castling:
+            self._handle_castling(castling)
+        else:
+            self.pieces[to_square] = piece
+            if from_square in self.pieces:
+                del self.pieces[from_square]
+                
+            self.bitboard.move_piece(from_square, to_square)
         
         piece.has_moved = True
         
-        self._update_castling_rights(from_square, to_square, piece, captured_piece)
+        self._update_castling_rights(from_square, to_square)
+        
+        if piece.type == PAWN or captured_piece:
+            self.bitboard.halfmove_clock = 0
+        else:
+            self.bitboard.halfmove_clock += 1
+        if piece.color == BLACK:
+            self.bitboard.fullmove_number += 1
+        self.side_to_move = BLACK if piece.color == WHITE else WHITE
         
-        return move_notation
+        if promotion:
+            self.pieces[to_square] = PIECE_CLASSES[promotion](piece.color)
+            self.pieces[to_square].has_moved = True
+            self.bitboard.set_piece(to_square, piece.color, promotion)
+            
+        return record
+        
+    def replay_move(self, record):
+        """Re-apply a move previously returned in ``last_move``."""
+        from_square, to_square, promotion = decode_move(record)[:3]
+        self.last_move = self._apply_move(from_square, to_square, promotion)
+        return self.last_move
+        
+    def unmake_move(self, record):
+        """Take back the move described by ``record``, restoring the prior state."""
+        (from_square, to_square, promotion, captured, flags,
+         castling_rights, en_passant_target, halfmove_clock) = decode_move(record)
+        self._invalidate_move_cache()
+        
+        if flags & FLAG_CASTLING:
+            castling = self._castling_moves[(from_square, to_square)]
+            _, king_from, _, king_to, rook_from, rook_to = castling[:6]
+            self._move_castling_pieces(king_to, rook_to, king_from, rook_from)
+            piece = self.pieces[king_from]
+            piece.has_moved = False
+            self.pieces[rook_from].has_moved = False
+        else:
+            piece = self.pieces.pop(to_square)
+            if promotion:
+                piece = Pawn(piece.color)
+                piece.has_moved = True
+            if flags & FLAG_FIRST_MOVE:
+                piece.has_moved = False
+            self.pieces[from_square] = piece
+            self.bitboard.clear_square(to_square)
+            self.bitboard.set_piece(from_square, piece.color, piece.type)
+        color = piece.color
+        
+        if captured != NO_PIECE:
+            enemy_color = BLACK if color == WHITE else WHITE
+            captured_square = to_square
+            if flags & FLAG_EN_PASSANT:
+                captured_square = to_square + (-8 if color == WHITE else 8)
+            captured_piece = PIECE_CLASSES[captured](enemy_color)
+            captured_piece.has_moved = bool(flags & FLAG_CAPTURED_MOVED)
+            self.pieces[captured_square] = captured_piece
+            self.bitboard.set_piece(captured_square, enemy_color, captured)
+            
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.bitboard.en_passant_target = en_passant_target
+        self.bitboard.halfmove_clock = halfmove_clock
+        if color == BLACK:
+            self.bitboard.fullmove_number -= 1
+        self.side_to_move = color
+        self.last_move = None
         
     def _handle_special_moves(self, from_square, to_square, piece):
 
-        if piece.type == KING and abs(to_square - from_square) == 2:
-            self._handle_castling(from_square, to_square)
-            
-        elif (piece.type == PAWN and 
-              to_square == self.bitboard.en_passant_target):
+        if (piece.type == PAWN and 
+            to_square == self.en_passant_target):
             self._handle_en_passant(from_square, to_square)
             
         if (piece.type == PAWN and 
             abs(to_square - from_square) == 16):
-            self.bitboard.en_passant_target = (from_square + to_square) // 2
+            self.en_passant_target = (from_square + to_square) // 2
         else:
-            self.bitboard.en_passant_target = None
-            
-    def _handle_castling(self, from_square, to_square):
-        """Handle castling moves."""
-        if to_square > from_square:  # Kingside
-            rook_from = to_square + 1
-            rook_to = to_square - 1
-        else:  # Queenside
-            rook_from = to_square - 2
-            rook_to = to_square + 1
+            self.en_passant_target = None
+        self.bitboard.en_passant_target = self.en_passant_target
             
-        rook = self.pieces.get(rook_from)
-        if rook:
-            self.pieces[rook_to] = rook
-            del self.pieces[rook_from]
-            self.bitboard.move_piece(rook_from, rook_to)
+    def _handle_castling(self, castling):
+        """Handle castling moves, given their castling path entry."""
+        _, king_from, _, king_to, rook_from, rook_to = castling[:6]
+        self._move_castling_pieces(king_from, rook_from, king_to, rook_to)
+        self.pieces[rook_to].has_moved = True
+        
+    def _move_castling_pieces(self, king_from, rook_from, king_to, rook_to):
+        # Both pieces are lifted before either is placed, since in Chess960
+        # the king and rook may land on each other's squares
+        king = self.pieces.pop(king_from)
+        rook = self.pieces.pop(rook_from)
+        self.bitboard.clear_square(king_from)
+        self.bitboard.clear_square(rook_from)
+        self.pieces[king_to] = king
+        self.pieces[rook_to] = rook
+        self.bitboard.set_piece(king_to, king.color, KING)
+        self.bitboard.set_piece(rook_to, rook.color, ROOK)
             
     def _handle_en_passant(self, from_square, to_square):
-        captured_square = to_square + (8 if self.get_piece(from_square).color == WHITE else -8)
+        captured_square = to_square + (8 if self.get_piece(from_square).color == BLACK else -8)
         if captured_square in self.pieces:
             del self.pieces[captured_square]
             self.bitboard.clear_square(captured_square)
@@ -193,23 +513,150 @@ class ChessBoard:
     def promote_pawn(self, square, piece_type):
         piece = self.get_piece(square)
         if piece and piece.type == PAWN:
+            self._invalidate_move_cache()
             color = piece.color
-            if piece_type == QUEEN:
-                self.pieces[square] = Queen(color)
-            elif piece_type == ROOK:
-                self.pieces[square] = Rook(color)
-            elif piece_type == BISHOP:
-                self.pieces[square] = Bishop(color)
-            elif piece_type == KNIGHT:
-                self.pieces[square] = Knight(color)
+            if piece_type in (QUEEN, ROOK, BISHOP, KNIGHT):
+                self.pieces[square] = PIECE_CLASSES[piece_type](color)
+                self.pieces[square].has_moved = True
                 
             self.bitboard.clear_square(square)
             self.bitboard.set_piece(square, color, piece_type)
             
+            if self.last_move is not None and move_to(self.last_move) == square:
+                self.last_move = set_promotion(self.last_move, piece_type)
+                
+    def snapshot(self):
+        """Return an immutable copy of the position, for use with ``restore``."""
+        pieces = {square: (piece.color, piece.type, piece.has_moved)
+                  for square, piece in self.pieces.items()}
+        return (self.bitboard.copy(), pieces, self.castling_rights,
+                self.en_passant_target, self.side_to_move, self.last_move)
+                
+    def restore(self, snapshot):
+        bitboard, pieces, castling_rights, en_passant_target, side_to_move, last_move = snapshot
+        self.bitboard = bitboard.copy()
+        self.pieces = {}
+        for square, (color, piece_type, has_moved) in pieces.items():
+            piece = PIECE_CLASSES[piece_type](color)
+            piece.has_moved = has_moved
+            self.pieces[square] = piece
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.side_to_move = side_to_move
+        self.last_move = last_move
+        self._invalidate_move_cache()
+            
+    def _invalidate_move_cache(self):
+        self._legal_moves = None
+        self._moves_by_square = None
+        self._game_status = None
+        self._san_moves = None
+        self._threats = None
+        
+    @profiled('ChessBoard.legal_move_list')
+    def _legal_move_list(self):
+        """Return (from, to, promotion) legal moves for the side to move.
+
+        The list is generated once per position and shared by move validation,
+        SAN disambiguation, the check/mate suffix and the game-state checks.
+        """
+        if self._legal_moves is None:
+            moves = self.all_legal_moves(self.side_to_move)
+            moves_by_square = {}
+            for from_square, to_square, _ in moves:
+                targets = moves_by_square.setdefault(from_square, [])
+                # Promotions repeat the same destination once per piece
+                if not targets or targets[-1] != to_square:
+                    targets.append(to_square)
+            self._legal_moves = moves
+            self._moves_by_square = moves_by_square
+        return self._legal_moves
+        
+    @profiled('ChessBoard.get_threats')
+    def get_threats(self):
+        """Return the Threats of this position, built from one attack map per piece type."""
+        if self._threats is None:
+            bitboard = self.bitboard
+            occupied = bitboard.all_pieces
+            attacks = {}  # Color -> {piece type: squares attacked by those pieces}
+            for color in (WHITE, BLACK):
+                attacks[color] = {}
+                for piece_type, board in bitboard.boards[color].items():
+                    mask = 0
+                    for square in iter_squares(board):
+                        mask |= attacks_from(piece_type, color, square, occupied)
+                    attacks[color][piece_type] = mask
+            attacked = {color: 0 for color in (WHITE, BLACK)}
+            for color in (WHITE, BLACK):
+                for mask in attacks[color].values():
+                    attacked[color] |= mask
+                    
+            hanging = 0
+            for color in (WHITE, BLACK):
+                enemy = BLACK if color == WHITE else WHITE
+                for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+                    targets = bitboard.boards[color][piece_type] & attacked[enemy]
+                    if not targets:
+                        continue
+                    cheaper = 0
+                    for attacker, mask in attacks[enemy].items():
+                        if THREAT_VALUES[attacker] < THREAT_VALUES[piece_type]:
+                            cheaper |= mask
+                    hanging |= targets & (~attacked[color] | cheaper)
+                    
+            self._threats = Threats(attacked, hanging,
+                                    self._pinned_pieces(WHITE) | self._pinned_pieces(BLACK))
+        return self._threats
+        
+    def _pinned_pieces(self, color):
+        """Mask of ``color``'s pieces that shield their king from an enemy slider."""
+        bitboard = self.bitboard
+        king_square = bitboard._bit_scan_forward(bitboard.boards[color][KING])
+        if king_square is None:
+            return 0
+        enemy_boards = bitboard.boards[BLACK if color == WHITE else WHITE]
+        own = bitboard.white_pieces if color == WHITE else bitboard.black_pieces
+        straight = enemy_boards[ROOK] | enemy_boards[QUEEN]
+        diagonal = enemy_boards[BISHOP] | enemy_boards[QUEEN]
+        pinned = 0
+        for direction, ray in enumerate(RAYS[king_square]):
+            sliders = straight if direction < 4 else diagonal
+            shield = None
+            for square in ray:
+                if not bitboard.all_pieces >> square & 1:
+                    continue
+                if own >> square & 1 and shield is None:
+                    shield = square
+                    continue
+                if shield is not None and sliders >> square & 1:
+                    pinned |= 1 << shield
+                break
+        return pinned
+        
+    def get_movable_squares(self):
+        """Return the squares of the side to move's pieces that have a legal move."""
+        self._legal_move_list()
+        return list(self._moves_by_square)
+        
+    @profiled('ChessBoard.get_game_status')
+    def get_game_status(self):
+        """Return 'ongoing', 'check', 'checkmate' or 'stalemate' for the side to move."""
+        if self._game_status is None:
+            in_check = self.bitboard.is_king_in_check(self.side_to_move)
+            if self._legal_move_list():
+                self._game_status = 'check' if in_check else 'ongoing'
+            else:
+                self._game_status = 'checkmate' if in_check else 'stalemate'
+        return self._game_status
+        
+    @profiled('ChessBoard.is_checkmate')
     def is_checkmate(self, color):
         if not self.bitboard.is_king_in_check(color):
             return False
             
+        if color == self.side_to_move:
+            return self.get_game_status() == 'checkmate'
+            
         for square in range(64):
             piece = self.get_piece(square)
             if piece and piece.color == color:
@@ -218,10 +665,14 @@ class ChessBoard:
                     
         return True
         
+    @profiled('ChessBoard.is_stalemate')
     def is_stalemate(self, color):
         if self.bitboard.is_king_in_check(color):
             return False
             
+        if color == self.side_to_move:
+            return self.get_game_status() == 'stalemate'
+            
         for square in range(64):
             piece = self.get_piece(square)
             if piece and piece.color == color:
@@ -230,49 +681,300 @@ class ChessBoard:
                     
         return True
         
+    @profiled('ChessBoard.is_king_in_check')
     def is_king_in_check(self, color):
-        king_square = None
-        for square in range(64):
-            piece = self.get_piece(square)
-            if piece and piece.color == color and piece.type == KING:
-                king_square = square
-                break
-                
+        king_square = self.bitboard._bit_scan_forward(self.bitboard.boards[color][KING])
         if king_square is None:
             return False
             
         enemy_color = BLACK if color == WHITE else WHITE
         return self._square_under_attack(king_square, enemy_color)
         
+    @profiled('ChessBoard.square_under_attack')
     def _square_under_attack(self, square, attacking_color):
-        for piece_square in range(64):
-            piece = self.get_piece(piece_square)
-            if piece and piece.color == attacking_color:
-                legal_moves = piece.get_legal_moves(piece_square, self)
-                if square in legal_moves:
-                    return True
-        return False
-        
-    def _get_move_notation(self, from_square, to_square, piece):
-        from_file = FILES[from_square % 8]
-        # square // 8 gives rank index where 0 is rank 1 (bottom), so add 1
-        from_rank = str((from_square // 8) + 1)
-        to_file = FILES[to_square % 8]
-        to_rank = str((to_square // 8) + 1)
+        # Pseudo-legal move lists are not attack sets (pawn pushes, castling),
+        # and recursing into the enemy king's castling check never terminates.
+        return self.bitboard._square_under_attack(square, attacking_color)
         
-        if piece.type == PAWN:
-            notation = f"{to_file}{to_rank}"
-        else:
-            notation = f"{piece.get_symbol()}{to_file}{to_rank}"
+    def _get_move_notation(self, from_square, to_square, piece, promotion=None, legal_moves=None):
+        """Return the SAN of a move in the current position, without check suffix.
+
+        Disambiguation is worked out from ``legal_moves``, the position's
+        already generated move list.
+        """
+        to_name = FILES[to_square % 8] + str(to_square // 8 + 1)
+        
+        castling = self._castling_move(from_square, to_square, piece)
+        if castling:
+            return "O-O" if castling[0] & KINGSIDE_RIGHTS else "O-O-O"
             
-        if self.bitboard.is_king_in_check(BLACK if piece.color == WHITE else WHITE):
-            notation += "+"
+        is_capture = (to_square in self.pieces or
+                      (piece.type == PAWN and to_square == self.en_passant_target))
+                      
+        if piece.type == PAWN:
+            notation = f"{FILES[from_square % 8]}x{to_name}" if is_capture else to_name
+            if promotion:
+                notation += "=" + PIECE_SYMBOLS[WHITE][promotion]
+            return notation
             
+        if legal_moves is None:
+            legal_moves = self._legal_move_list()
+        rivals = [move[0] for move in legal_moves
+                  if move[1] == to_square and move[0] != from_square and
+                  self.pieces[move[0]].type == piece.type]
+                  
+        disambiguation = ""
+        if rivals:
+            if all(square % 8 != from_square % 8 for square in rivals):
+                disambiguation = FILES[from_square % 8]
+            elif all(square // 8 != from_square // 8 for square in rivals):
+                disambiguation = str(from_square // 8 + 1)
+            else:
+                disambiguation = FILES[from_square % 8] + str(from_square // 8 + 1)
+                
+        return (f"{PIECE_SYMBOLS[WHITE][piece.type]}{disambiguation}"
+                f"{'x' if is_capture else ''}{to_name}")
+                
+    def _check_suffix(self):
+        """Return '+' or '#' for the side to move, reusing its cached game status."""
+        if not self.bitboard.is_king_in_check(self.side_to_move):
+            return ""
+        return "#" if self.get_game_status() == 'checkmate' else "+"
+        
+    def get_san(self, from_square, to_square, promotion=None):
+        """Return the full SAN, including check or mate suffix, of a legal move."""
+        piece = self.get_piece(from_square)
+        notation = self._get_move_notation(from_square, to_square, piece, promotion)
+        saved = (self.last_move, self._legal_moves, self._moves_by_square,
+                 self._game_status, self._san_moves, self._threats)
+        record = self._apply_move(from_square, to_square, promotion)
+        notation += self._check_suffix()
+        self.unmake_move(record)
+        (self.last_move, self._legal_moves, self._moves_by_square,
+         self._game_status, self._san_moves, self._threats) = saved
         return notation
         
+    def _san_table(self):
+        """Return the SAN -> (from, to, promotion) lookup table for this position."""
+        if self._san_moves is None:
+            legal_moves = self._legal_move_list()
+            self._san_moves = {
+                self._get_move_notation(move[0], move[1], self.pieces[move[0]],
+                                        move[2], legal_moves): move
+                for move in legal_moves
+            }
+        return self._san_moves
+        
+    def parse_san(self, san):
+        """Resolve a SAN move for the side to move to (from, to, promotion), or None."""
+        move = self._san_table().get(san.rstrip('+#!?'))
+        if move is not None:
+            return move
+        return self._parse_san_loosely(san)
+        
+    def _parse_san_loosely(self, san):
+        # Fallback for notation outside the table: 0-0, e8Q, redundant disambiguation
+        color = self.side_to_move
+        san = san.rstrip('+#!?')
+        
+        if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            kingside = len(san) == 3
+            for right, king_square, to_square in (entry[:3] for entry in self.castling_paths[color]):
+                if (bool(right & KINGSIDE_RIGHTS) == kingside and
+                        to_square in self.get_legal_moves(king_square)):
+                    return (king_square, to_square, None)
+            return None
+            
+        promotion = None
+        if '=' in san:
+            san, promotion_symbol = san.split('=', 1)
+            promotion = SAN_PIECES.get(promotion_symbol[:1])
+            if promotion in (None, KING):
+                return None
+        elif san[-1:] in 'NBRQ' and len(san) > 2 and san[-2].isdigit():
+            promotion = SAN_PIECES[san[-1]]
+            san = san[:-1]
+            
+        if len(san) < 2:
+            return None
+        if san[0] in SAN_PIECES:
+            piece_type = SAN_PIECES[san[0]]
+            san = san[1:]
+        else:
+            piece_type = PAWN
+            
+        destination, qualifier = san[-2:], san[:-2].replace('x', '')
+        if destination[0] not in FILES or destination[1] not in '12345678':
+            return None
+        to_square = FILES.index(destination[0]) + (int(destination[1]) - 1) * 8
+        if (piece_type == PAWN and to_square // 8 in (0, 7)) != (promotion is not None):
+            return None
+        
+        match = None
+        for from_square, piece in self.pieces.items():
+            if piece.color != color or piece.type != piece_type:
+                continue
+            from_name = FILES[from_square % 8] + str(from_square // 8 + 1)
+            if any(char not in from_name for char in qualifier):
+                continue
+            if to_square in self.get_legal_moves(from_square):
+                if match is not None:
+                    return None  # Ambiguous
+                match = (from_square, to_square, promotion)
+                
+        return match
+        
+    def make_san_move(self, san):
+        """Play a SAN move for the side to move and return its record, or None if illegal."""
+        move = self.parse_san(san)
+        if move is None:
+            return None
+        self.last_move = self._apply_move(*move)
+        return self.last_move
+        
     def reset(self):
         self.bitboard = Bitboard()
         self.bitboard.set_initial_position()
         self.en_passant_target = None
         self.castling_rights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.side_to_move = WHITE
+        self.last_move = None
+        self._invalidate_move_cache()
         self._create_pieces()
+        self._setup_castling(CASTLING_SQUARES)
+        
+    def set_fen(self, fen):
+        """Set up the position described by a FEN string."""
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        placement, side, castling, en_passant = fields[:4]
+        
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError(f"Invalid FEN placement: {placement!r}")
+            
+        self.bitboard = Bitboard()
+        self.pieces = {}
+        for row_index, row in enumerate(rows):
+            rank = 7 - row_index
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                if char not in FEN_PIECES or file > 7:
+                    raise ValueError(f"Invalid FEN placement: {placement!r}")
+                color, piece_type = FEN_PIECES[char]
+                square = rank * 8 + file
+                piece = PIECE_CLASSES[piece_type](color)
+                piece.has_moved = True
+                self.pieces[square] = piece
+                self.bitboard.set_piece(square, color, piece_type)
+                file += 1
+            if file != 8:
+                raise ValueError(f"Invalid FEN placement: rank {rank + 1} of {placement!r} "
+                                 f"is not 8 squares")
+                
+        self.side_to_move = WHITE if side == 'w' else BLACK
+        
+        self.castling_rights = 0
+        castling_squares = {}
+        for char in castling:
+            parsed = self._parse_castling_char(char)
+            if parsed:
+                right, king_square, rook_square = parsed
+                self.castling_rights |= right
+                castling_squares[right] = (king_square, rook_square)
+        # Kings and rooks that still hold a castling right have not moved
+        for king_square, rook_square in castling_squares.values():
+            self.pieces[king_square].has_moved = False
+            self.pieces[rook_square].has_moved = False
+        self._setup_castling(castling_squares)
+        self.bitboard.castling_rights = self.castling_rights
+        
+        self.en_passant_target = None
+        if en_passant != '-':
+            self.en_passant_target = FILES.index(en_passant[0]) + (int(en_passant[1]) - 1) * 8
+        self.bitboard.en_passant_target = self.en_passant_target
+        
+        self.bitboard.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        self.bitboard.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        self.last_move = None
+        self._invalidate_move_cache()
+        
+    def _parse_castling_char(self, char):
+        """Resolve a FEN castling letter to (right, king square, rook square), or None.
+
+        Besides KQkq, which name the outermost rook on that side (X-FEN), the
+        rook's file letter is accepted (Shredder-FEN), as Chess960 needs.
+        """
+        color = WHITE if char.isupper() else BLACK
+        back_rank = 0 if color == WHITE else 56
+        king_square = self.bitboard._bit_scan_forward(
+            self.bitboard.boards[color][KING] & (0xFF << back_rank))
+        if king_square is None:
+            return None
+        rook_files = [square - back_rank for square, piece in self.pieces.items()
+                      if back_rank <= square < back_rank + 8 and
+                      piece.type == ROOK and piece.color == color]
+        king_file = king_square - back_rank
+        
+        if char in 'Kk':
+            files = [file for file in rook_files if file > king_file]
+            rook_file = max(files) if files else None
+        elif char in 'Qq':
+            files = [file for file in rook_files if file < king_file]
+            rook_file = min(files) if files else None
+        elif char.lower() in FILES and FILES.index(char.lower()) in rook_files:
+            rook_file = FILES.index(char.lower())
+        else:
+            rook_file = None
+        if rook_file is None or rook_file == king_file:
+            return None
+            
+        if color == WHITE:
+            right = WHITE_KINGSIDE if rook_file > king_file else WHITE_QUEENSIDE
+        else:
+            right = BLACK_KINGSIDE if rook_file > king_file else BLACK_QUEENSIDE
+        return right, king_square, back_rank + rook_file
+        
+    def _castling_char(self, char, right):
+        # KQkq unless another rook of the same colour stands further out on
+        # that side, in which case the rook's file is named
+        king_square, rook_square = self.castling_squares[right]
+        for square in range(rook_square + 1, rook_square // 8 * 8 + 8) if right & KINGSIDE_RIGHTS \
+                else range(rook_square // 8 * 8, rook_square):
+            piece = self.pieces.get(square)
+            if piece and piece.type == ROOK and piece.color == CASTLING_COLORS[right]:
+                file = FILES[rook_square % 8]
+                return file.upper() if char.isupper() else file
+        return char
+        
+    def get_fen(self):
+        rows = []
+        for rank in range(7, -1, -1):
+            row = ''
+            empty = 0
+            for file in range(8):
+                piece = self.pieces.get(rank * 8 + file)
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += piece.get_symbol()
+            if empty:
+                row += str(empty)
+            rows.append(row)
+            
+        castling = ''.join(self._castling_char(char, right) for char, right in FEN_CASTLING.items()
+                           if self.castling_rights & right) or '-'
+        if self.en_passant_target is None:
+            en_passant = '-'
+        else:
+            en_passant = FILES[self.en_passant_target % 8] + str(self.en_passant_target // 8 + 1)
+            
+        return (f"{'/'.join(rows)} {'w' if self.side_to_move == WHITE else 'b'} {castling} "
+                f"{en_passant} {self.bitboard.halfmove_clock} {self.bitboard.fullmove_number}")
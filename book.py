@@ -0,0 +1,172 @@
+
+import mmap
+import random
+import struct
+import sys
+
+from board import ChessBoard
+from pgn import read_games
+from zobrist import polyglot_hash
+from constants import *
+
+# Polyglot entries: key (u64), move (u16), weight (u16), learn (u32), big-endian,
+# sorted by key so a position's moves sit next to each other
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+
+# Plies per game taken into a built book
+BOOK_DEPTH = 24
+
+# Polyglot numbers promotion pieces knight=1 .. queen=4
+POLYGLOT_PROMOTIONS = {KNIGHT: 1, BISHOP: 2, ROOK: 3, QUEEN: 4}
+PROMOTIONS_FROM_POLYGLOT = {v: k for k, v in POLYGLOT_PROMOTIONS.items()}
+
+# Polyglot writes castling as the king taking its own rook
+CASTLING_TO_ROOK = {(E1, G1): H1, (E1, C1): A1, (E8, G8): H8, (E8, C8): A8}
+CASTLING_FROM_ROOK = {(f, rook): to for (f, to), rook in CASTLING_TO_ROOK.items()}
+
+
+def encode_book_move(from_square, to_square, promotion=None, is_king=False):
+    if is_king:
+        to_square = CASTLING_TO_ROOK.get((from_square, to_square), to_square)
+    return to_square | (from_square << 6) | (POLYGLOT_PROMOTIONS.get(promotion, 0) << 12)
+
+
+def decode_book_move(move, board):
+    """Return (from, to, promotion) for a Polyglot move on ``board``."""
+    from_square = (move >> 6) & 0x3F
+    to_square = move & 0x3F
+    promotion = PROMOTIONS_FROM_POLYGLOT.get((move >> 12) & 0x7)
+    piece = board.pieces.get(from_square)
+    if piece and piece.type == KING:
+        to_square = CASTLING_FROM_ROOK.get((from_square, to_square), to_square)
+    return from_square, to_square, promotion
+
+
+class OpeningBook:
+    """Read-only Polyglot opening book.
+
+    The file is memory-mapped and never parsed up front; each lookup is a
+    binary search over the sorted 16-byte entries, so opening a large book
+    costs nothing and a probe touches only O(log n) entries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            try:
+                self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty files cannot be mapped
+                self._data = b''
+        self._size = len(self._data) // ENTRY.size
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def get_entries(self, board):
+        """Return the (from, to, promotion, weight) book moves for ``board``.
+
+        Entries that are not legal in the position, e.g. from a hash
+        collision, are left out.
+        """
+        key = polyglot_hash(board)
+        legal_moves = board._legal_move_list()
+        entries = []
+        index = self._lower_bound(key)
+        while index < self._size:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self._data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            decoded = decode_book_move(move, board)
+            if decoded in legal_moves:
+                entries.append(decoded + (weight,))
+            index += 1
+        return entries
+
+    def choose_move(self, board, rng=random):
+        """Pick a book move for ``board`` in proportion to its weight, or None."""
+        entries = [entry for entry in self.get_entries(board) if entry[3] > 0]
+        if not entries:
+            return None
+        entry = rng.choices(entries, weights=[entry[3] for entry in entries])[0]
+        return entry[:3]
+
+    def _lower_bound(self, key):
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self._data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def build_book(pgn_paths, book_path, depth=BOOK_DEPTH, min_games=1):
+    """Compile the opening moves of PGN games into a Polyglot book.
+
+    Moves are weighted 2 for a win, 1 for a draw or unfinished game and 0 for
+    a loss of the side that played them (the usual Polyglot scoring), and
+    moves seen in fewer than ``min_games`` games are dropped. Returns the
+    number of entries written.
+    """
+    weights = {}
+    counts = {}
+    board = ChessBoard()
+    for path in pgn_paths:
+        for game in read_games(path, resolve=False):
+            try:
+                board.set_fen(game.get_start_fen())
+            except ValueError:
+                continue
+            for san in game.moves[:depth]:
+                color = board.side_to_move
+                key = polyglot_hash(board)
+                move = board.parse_san(san)
+                if move is None:
+                    break
+                from_square, to_square, promotion = move
+                is_king = board.pieces[from_square].type == KING
+                board._apply_move(from_square, to_square, promotion)
+
+                entry = (key, encode_book_move(from_square, to_square, promotion, is_king))
+                counts[entry] = counts.get(entry, 0) + 1
+                weights[entry] = weights.get(entry, 0) + _score_result(game.result, color)
+
+    entries = [(key, move, weight) for (key, move), weight in weights.items()
+               if counts[(key, move)] >= min_games]
+    # Weights are 16-bit, so scale them down if the busiest move overflows
+    heaviest = max((weight for _, _, weight in entries), default=0)
+    scale = 0xFFFF / heaviest if heaviest > 0xFFFF else 1
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+
+    with open(book_path, 'wb') as fp:
+        for key, move, weight in entries:
+            fp.write(ENTRY.pack(key, move, int(weight * scale), 0))
+    return len(entries)
+
+
+def _score_result(result, color):
+    if result in ('1/2-1/2', '*'):
+        return 1
+    if result == ('1-0' if color == WHITE else '0-1'):
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python book.py GAMES.pgn [MORE.pgn ...] BOOK.bin")
+        sys.exit(1)
+    count = build_book(sys.argv[1:-1], sys.argv[-1])
+    print(f"Wrote {count} book entries to {sys.argv[-1]}")
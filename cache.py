@@ -0,0 +1,171 @@
+
+import shelve
+from collections import OrderedDict
+
+from engine import evaluate
+from zobrist import polyglot_hash
+
+# Positions kept in memory before the least recently used ones are dropped
+CACHE_SIZE = 50000
+
+# Default file for the persistent tier; dbm may add an extension or two
+CACHE_PATH = 'analysis_cache'
+
+# Bumped whenever evaluation or search changes, so stale results on disk are
+# thrown away instead of being served
+CACHE_VERSION = 1
+VERSION_KEY = 'version'
+
+
+def position_key(board):
+    """Identity of a position: equal for the same position reached by any move order."""
+    return polyglot_hash(board)
+
+
+class PositionCache:
+    """Results per position, held in an LRU in memory with an optional shelve file behind it.
+
+    Each entry may hold the game status, the legal move list, the static
+    evaluation and the deepest search result seen for the position. An
+    entry missing from memory is looked up on disk and promoted back into
+    memory; every update is written through to disk.
+    """
+
+    def __init__(self, capacity=CACHE_SIZE, path=None):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # Position key -> {field: value}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shelf = None
+        if path:
+            self.shelf = shelve.open(path)
+            if self.shelf.get(VERSION_KEY) != CACHE_VERSION:
+                self.shelf.close()
+                self.shelf = shelve.open(path, flag='n')
+                self.shelf[VERSION_KEY] = CACHE_VERSION
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get(self, key, field):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            if field in entry:
+                self.hits += 1
+                return entry[field]
+        elif self.shelf is not None:
+            entry = self.shelf.get(f"{key:016x}")
+            if entry is not None:
+                self._remember(key, entry)
+                if field in entry:
+                    self.disk_hits += 1
+                    return entry[field]
+        self.misses += 1
+        return None
+
+    def _entry(self, key):
+        # Like _get, but without counting a probe
+        entry = self.entries.get(key)
+        if entry is None and self.shelf is not None:
+            entry = self.shelf.get(f"{key:016x}")
+        return entry
+
+    def _put(self, key, field, value):
+        entry = self._entry(key)
+        if entry is None:
+            entry = {}
+        entry[field] = value
+        self._remember(key, entry)
+        if self.shelf is not None:
+            self.shelf[f"{key:016x}"] = entry
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def legal_moves(self, board):
+        """Return the side to move's legal (from, to, promotion) moves."""
+        key = position_key(board)
+        moves = self._get(key, 'moves')
+        if moves is None:
+            moves = list(board._legal_move_list())
+            self._put(key, 'moves', moves)
+        return list(moves)
+
+    def get_legal_moves(self, board, square):
+        """Cached stand-in for ``board.get_legal_moves(square)``."""
+        piece = board.get_piece(square)
+        if not piece or piece.color != board.side_to_move:
+            return board.get_legal_moves(square)
+        return list(dict.fromkeys(to_square for from_square, to_square, _
+                                  in self.legal_moves(board) if from_square == square))
+
+    def game_status(self, board):
+        """Return 'ongoing', 'check', 'checkmate' or 'stalemate' for the side to move."""
+        key = position_key(board)
+        status = self._get(key, 'status')
+        if status is None:
+            status = board.get_game_status()
+            self._put(key, 'status', status)
+        return status
+
+    def is_checkmate(self, board):
+        return self.game_status(board) == 'checkmate'
+
+    def evaluate(self, board):
+        key = position_key(board)
+        score = self._get(key, 'eval')
+        if score is None:
+            score = evaluate(board)
+            self._put(key, 'eval', score)
+        return score
+
+    def get_search(self, board, depth=1):
+        """Return the cached (depth, score, line) if it was searched at least ``depth`` deep."""
+        result = self._get(position_key(board), 'search')
+        if result is not None and result[0] >= depth:
+            return result
+        return None
+
+    def store_search(self, board, depth, score, line):
+        """Remember a search result, unless a deeper one is already known."""
+        key = position_key(board)
+        entry = self._entry(key)
+        previous = entry.get('search') if entry else None
+        if previous is None or previous[0] < depth:
+            self._put(key, 'search', (depth, score, list(line)))
+
+    def hit_rate(self):
+        probes = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / probes if probes else 0.0
+
+    def get_stats(self):
+        return {'entries': len(self.entries), 'capacity': self.capacity,
+                'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': round(self.hit_rate(), 4)}
+
+    def clear(self):
+        """Empty the memory tier and reset the statistics; the disk tier is kept."""
+        self.entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def sync(self):
+        if self.shelf is not None:
+            self.shelf.sync()
+
+    def close(self):
+        if self.shelf is not None:
+            self.shelf.close()
+            self.shelf = None
@@ -0,0 +1,76 @@
+
+import time
+
+from constants import *
+
+# Default time control: minutes per side and a Fischer increment per move
+CLOCK_TIME = 5 * 60.0
+CLOCK_INCREMENT = 3.0
+
+# Below this many seconds the clock is shown in tenths
+LOW_TIME = 10.0
+
+
+def format_clock(seconds):
+    """Format remaining time as 'm:ss', or 's.t' once it runs low."""
+    seconds = max(0.0, seconds)
+    if seconds < LOW_TIME:
+        return f"{int(seconds * 10) / 10:.1f}"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class GameClock:
+    """Remaining time for both sides, with an increment added after each move.
+
+    At most one side's clock runs at a time. It starts when the first move
+    is made and is paused with ``stop``.
+    """
+
+    def __init__(self, initial=CLOCK_TIME, increment=CLOCK_INCREMENT):
+        self.initial = initial
+        self.increment = increment
+        self.reset()
+
+    def reset(self):
+        self._remaining = {WHITE: self.initial, BLACK: self.initial}
+        self.running = None  # Color whose clock is running, if any
+        self._started = None
+
+    def remaining(self, color):
+        """Seconds left for ``color``, counting the time of a running clock."""
+        remaining = self._remaining[color]
+        if color == self.running:
+            remaining -= time.perf_counter() - self._started
+        return max(0.0, remaining)
+
+    def start(self, color):
+        """Stop whichever clock is running and start ``color``'s."""
+        self.stop()
+        self.running = color
+        self._started = time.perf_counter()
+
+    def stop(self):
+        if self.running is not None:
+            self._remaining[self.running] = self.remaining(self.running)
+            self.running = None
+
+    def press(self, color):
+        """``color`` has moved: credit its increment and start the opponent's clock."""
+        if self.running == color:
+            self.stop()
+            self._remaining[color] += self.increment
+        self.start(BLACK if color == WHITE else WHITE)
+
+    def flagged(self):
+        """Return the color whose time has run out, or None."""
+        if self.running is not None and self.remaining(self.running) <= 0.0:
+            return self.running
+        return None
+
+    def get_display(self):
+        """Return (white text, black text, running color) for the clock display."""
+        return (format_clock(self.remaining(WHITE)), format_clock(self.remaining(BLACK)),
+                self.running)
@@ -6,6 +6,13 @@ HIGHLIGHT_SELECTED = (30, 144, 255)
 BACKGROUND_COLOR = (0, 0, 0)     
 PROMOTION_BG = (128, 128, 128)     
 PROMOTION_HOVER = (160, 160, 160)   
+# Threat overlay: translucent tints for squares attacked by White, Black or
+# both, and outlines for hanging and pinned pieces
+THREAT_WHITE = (255, 255, 255, 70)
+THREAT_BLACK = (200, 40, 40, 70)
+THREAT_BOTH = (170, 60, 200, 80)
+THREAT_HANGING = (255, 60, 60)
+THREAT_PINNED = (255, 200, 0)
 
 
 WHITE = 0
@@ -34,6 +41,7 @@ HISTORY_X = BOARD_X + BOARD_SIZE + 20
 HISTORY_Y = BOARD_Y
 HISTORY_WIDTH = 300
 HISTORY_HEIGHT = BOARD_SIZE
+HISTORY_ROW_HEIGHT = 28
 
 # File and rank labels
 FILES = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
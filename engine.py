@@ -0,0 +1,359 @@
+
+import time
+
+from pawns import PawnHashTable
+from zobrist import polyglot_hash
+from constants import *
+
+INFINITY = 1000000
+MATE_SCORE = 100000
+MAX_DEPTH = 64
+# Scores beyond this are mates; tablebase mates can lie deeper than the search
+MATE_BOUND = MATE_SCORE - 1000
+
+PIECE_VALUES = {PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900, KING: 0}
+
+# Piece-square tables from White's point of view, written rank 8 first
+# so they read like a board diagram
+PIECE_SQUARE_TABLES = {
+    PAWN: [
+        0,   0,   0,   0,   0,   0,   0,   0,
+        50,  50,  50,  50,  50,  50,  50,  50,
+        10,  10,  20,  30,  30,  20,  10,  10,
+        5,   5,  10,  25,  25,  10,   5,   5,
+        0,   0,   0,  20,  20,   0,   0,   0,
+        5,  -5, -10,   0,   0, -10,  -5,   5,
+        5,  10,  10, -20, -20,  10,  10,   5,
+        0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    ROOK: [
+        0,   0,   0,   0,   0,   0,   0,   0,
+        5,  10,  10,  10,  10,  10,  10,   5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        -5,   0,   0,   0,   0,   0,   0,  -5,
+        0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    QUEEN: [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+        -5,   0,   5,   5,   5,   5,   0,  -5,
+        0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20,  20,   0,   0,   0,   0,  20,  20,
+        20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+# Node interval between checks of the stop callback
+STOP_CHECK_INTERVAL = 64
+
+# Time management: the share of the remaining clock planned for one move,
+# how much of the increment is spent at once, and the hard limit as a
+# multiple of the planned time and as a share of the whole clock
+MOVES_TO_GO = 30
+INCREMENT_SHARE = 0.8
+MAXIMUM_RATIO = 4.0
+MAXIMUM_SHARE = 0.25
+# Seconds kept in hand for the move to travel back and be played
+MOVE_OVERHEAD = 0.05
+# Legal move count of a typical middlegame position, for scaling by complexity
+AVERAGE_MOBILITY = 35
+# Planned time multiplier by how many depths running the best move has held
+STABILITY_FACTORS = (1.6, 1.25, 1.0, 0.8, 0.65)
+# A score falling by more than this between depths earns extra time
+SCORE_DROP = 30
+SCORE_DROP_FACTOR = 1.5
+
+# Transposition table bounds: the stored score is exact, at least or at most
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+# Pawn structure changes on few moves, so evaluation caches it by pawn placement
+PAWN_TABLE = PawnHashTable()
+
+
+class SearchAborted(Exception):
+    pass
+
+
+def evaluate(board):
+    """Static evaluation in centipawns from the side to move's point of view."""
+    score = 0
+    for square, piece in board.pieces.items():
+        # The tables are laid out rank 8 first, which is White's square ^ 56
+        table_index = square ^ 56 if piece.color == WHITE else square
+        value = PIECE_VALUES[piece.type] + PIECE_SQUARE_TABLES[piece.type][table_index]
+        score += value if piece.color == WHITE else -value
+    score += PAWN_TABLE.probe(board.bitboard).score
+    return score if board.side_to_move == WHITE else -score
+
+
+def format_score(score, color):
+    """Format a side-to-move score from White's point of view, e.g. '+0.35' or '-M3'."""
+    if color == BLACK:
+        score = -score
+    if abs(score) >= MATE_BOUND:
+        plies = MATE_SCORE - abs(score)
+        return f"{'+' if score > 0 else '-'}M{(plies + 1) // 2}"
+    return f"{score / 100:+.2f}"
+
+
+class Searcher:
+    """Iterative-deepening alpha-beta search on a ChessBoard.
+
+    The board is searched in place with make/unmake and is left in its
+    original position when the search returns or is aborted. With
+    ``tablebases`` positions they cover are scored exactly instead of searched.
+    A ``transposition_table`` (anything with ``probe(key)`` returning
+    (depth, score, bound, move) or None, and ``store(key, depth, score,
+    bound, move)``) lets searches share results between transpositions.
+    """
+
+    def __init__(self, board, should_stop=None, tablebases=None, transposition_table=None):
+        self.board = board
+        self.should_stop = should_stop
+        self.tablebases = tablebases
+        self.transposition_table = transposition_table
+        self.nodes = 0
+        self.start_time = None
+
+    def iterate(self, max_depth=MAX_DEPTH):
+        """Yield (depth, score, principal_variation) after each completed depth."""
+        self.nodes = 0
+        self.start_time = time.perf_counter()
+        best_line = []
+        for depth in range(1, max_depth + 1):
+            try:
+                score, best_line = self._search(depth, -INFINITY, INFINITY, 0, best_line)
+            except SearchAborted:
+                return
+            yield depth, score, best_line
+            if not best_line or abs(score) >= MATE_BOUND:
+                return
+
+    def search(self, depth):
+        """Search to a fixed depth and return (score, principal_variation)."""
+        result = (0, [])
+        for _, score, line in self.iterate(depth):
+            result = (score, line)
+        return result
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time if self.start_time else 0.0
+
+    def _search(self, depth, alpha, beta, ply, previous_line=()):
+        self.nodes += 1
+        if (self.should_stop is not None and self.nodes % STOP_CHECK_INTERVAL == 0 and
+                self.should_stop()):
+            raise SearchAborted()
+
+        board = self.board
+        if ply > 0 and self.tablebases is not None and len(board.pieces) <= 4:
+            result = self.tablebases.probe(board)
+            if result is not None:
+                wdl, plies = result
+                return (wdl * (MATE_SCORE - ply - plies) if wdl else 0), []
+
+        moves = board._legal_move_list()
+        if not moves:
+            if board.bitboard.is_king_in_check(board.side_to_move):
+                return -MATE_SCORE + ply, []
+            return 0, []
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply), []
+
+        table = self.transposition_table
+        first = previous_line[:1]
+        if table is not None:
+            key = polyglot_hash(board)
+            entry = table.probe(key)
+            if entry is not None:
+                entry_depth, score, bound, move = entry
+                # Mates are stored relative to the node, not the root
+                if score >= MATE_BOUND:
+                    score -= ply
+                elif score <= -MATE_BOUND:
+                    score += ply
+                if ply > 0 and entry_depth >= depth and (
+                        bound == EXACT or
+                        (bound == LOWER_BOUND and score >= beta) or
+                        (bound == UPPER_BOUND and score <= alpha)):
+                    return score, [move] if move in moves else []
+                if not first and move in moves:
+                    first = [move]
+            original_alpha = alpha
+
+        best_line = []
+        for move in self._order_moves(moves, first):
+            # Only the previous iteration's best move carries its line down
+            child_line = previous_line[1:] if previous_line and move == previous_line[0] else ()
+            record = board._apply_move(*move)
+            try:
+                score, line = self._search(depth - 1, -beta, -alpha, ply + 1, child_line)
+            finally:
+                board.unmake_move(record)
+            score = -score
+            if score > alpha:
+                alpha = score
+                best_line = [move] + line
+                if alpha >= beta:
+                    break
+
+        if table is not None:
+            if alpha >= beta:
+                bound = LOWER_BOUND
+            elif alpha > original_alpha:
+                bound = EXACT
+            else:
+                bound = UPPER_BOUND
+            stored = alpha
+            if stored >= MATE_BOUND:
+                stored += ply
+            elif stored <= -MATE_BOUND:
+                stored -= ply
+            table.store(key, depth, stored, bound, best_line[0] if best_line else None)
+        return alpha, best_line
+
+    def _quiesce(self, alpha, beta, ply):
+        self.nodes += 1
+        board = self.board
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        captures = [move for move in board._legal_move_list()
+                    if move[1] in board.pieces or move[2] == QUEEN]
+        for move in self._order_moves(captures):
+            record = board._apply_move(*move)
+            try:
+                score = -self._quiesce(-beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move(record)
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def _order_moves(self, moves, first=()):
+        """Principal variation move first, then captures by most valuable victim."""
+        pieces = self.board.pieces
+
+        def priority(move):
+            if move in first:
+                return -INFINITY
+            victim = pieces.get(move[1])
+            score = 0
+            if victim:
+                score -= 10 * PIECE_VALUES[victim.type] - PIECE_VALUES[pieces[move[0]].type]
+            if move[2]:
+                score -= PIECE_VALUES[move[2]]
+            return score
+
+        return sorted(moves, key=priority)
+
+
+class TimeManager:
+    """Decides how long to search one move on a game clock.
+
+    The planned time is a share of the remaining clock plus most of the
+    increment, scaled by the number of legal moves as a measure of how
+    complicated the position is. After each completed depth the plan is
+    stretched while the best move keeps changing or the score is falling,
+    and shrunk while it holds. A search started with ``pondering`` has no
+    limit until ``ponder_hit``; the time spent pondering counts towards the
+    plan, so a long ponder is answered at once.
+    """
+
+    def __init__(self, remaining, increment=0.0, moves_to_go=MOVES_TO_GO):
+        self.remaining = remaining
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+        self.start_time = None
+        self.optimum = self.maximum = self.soft_limit = 0.0
+        self.pondering = False
+        self.stop_now = False
+        self.best_move = None
+        self.stability = 0
+        self.last_score = None
+
+    def start(self, board, pondering=False):
+        """Plan the search of ``board``, the position about to be searched."""
+        self.start_time = time.perf_counter()
+        self.pondering = pondering
+        self.stop_now = False
+        self.best_move = None
+        self.stability = 0
+        self.last_score = None
+
+        available = max(0.0, self.remaining - MOVE_OVERHEAD)
+        mobility = len(board._legal_move_list())
+        if mobility <= 1:
+            # A forced move needs no thought beyond finding it
+            self.optimum = self.maximum = 0.0
+        else:
+            planned = available / self.moves_to_go + self.increment * INCREMENT_SHARE
+            complexity = min(1.3, max(0.7, 0.5 + mobility / (2 * AVERAGE_MOBILITY)))
+            self.optimum = min(planned * complexity, available * MAXIMUM_SHARE)
+            self.maximum = min(self.optimum * MAXIMUM_RATIO, available * MAXIMUM_SHARE)
+        self.soft_limit = self.optimum
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time if self.start_time else 0.0
+
+    def ponder_hit(self):
+        """The predicted move was played: from now on the clock is running."""
+        self.pondering = False
+        self.stop_now = self.elapsed() >= self.soft_limit
+
+    def out_of_time(self):
+        """True once the search must stop, even in the middle of a depth."""
+        return not self.pondering and (self.stop_now or self.elapsed() >= self.maximum)
+
+    def keep_searching(self, score, line):
+        """Called after each completed depth; False when the next is not worth starting."""
+        move = line[0] if line else None
+        if move == self.best_move:
+            self.stability += 1
+        else:
+            self.best_move = move
+            self.stability = 0
+        factor = STABILITY_FACTORS[min(self.stability, len(STABILITY_FACTORS) - 1)]
+        if self.last_score is not None and self.last_score - score > SCORE_DROP:
+            factor *= SCORE_DROP_FACTOR
+        self.last_score = score
+        self.soft_limit = min(self.optimum * factor, self.maximum)
+        return self.pondering or self.elapsed() < self.soft_limit
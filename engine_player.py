@@ -0,0 +1,187 @@
+
+import multiprocessing
+import threading
+import time
+
+import pygame
+
+from board import ChessBoard
+from engine import Searcher, TimeManager, format_score
+from tablebase import Tablebases
+
+# Posted to the pygame event queue when the engine has chosen its move
+ENGINE_EVENT = pygame.event.custom_type()
+
+# How often a finished ponder search checks whether its move was played
+PONDER_POLL = 0.005
+
+
+class EngineMove:
+
+    def __init__(self, fen, move, ponder, depth, score, nodes, elapsed):
+        self.fen = fen  # Position the move was chosen for
+        self.move = move  # (from, to, promotion)
+        self.ponder = ponder  # Expected reply, or None
+        self.depth = depth
+        self.score = score  # Formatted from White's point of view
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+
+def _engine_worker(jobs, results, generation, ponder_hit):
+    """Worker process: search each submitted position on the time it was given."""
+    board = ChessBoard()
+    tablebases = Tablebases()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_generation, fen, remaining, increment, pondering = job
+        if job_generation != generation.value:
+            continue  # Superseded while queued
+
+        board.set_fen(fen)
+        timer = TimeManager(remaining, increment)
+        timer.start(board, pondering)
+
+        def should_stop():
+            if generation.value != job_generation:
+                return True
+            if timer.pondering and ponder_hit.value == job_generation:
+                timer.ponder_hit()
+            return timer.out_of_time()
+
+        searcher = Searcher(board, should_stop=should_stop, tablebases=tablebases)
+        best = None
+        for depth, score, line in searcher.iterate():
+            if line:
+                best = (depth, score, line)
+            if not timer.keep_searching(score, line):
+                break
+
+        # A ponder search that ran out of depths keeps its answer until the
+        # predicted move is either played or not
+        while timer.pondering and generation.value == job_generation:
+            if ponder_hit.value == job_generation:
+                timer.ponder_hit()
+            else:
+                time.sleep(PONDER_POLL)
+        if generation.value != job_generation:
+            continue
+
+        if best is None:
+            # Stopped before the first depth completed; any legal move beats none
+            moves = board._legal_move_list()
+            if not moves:
+                continue
+            best = (0, 0, [moves[0]])
+        depth, score, line = best
+        results.put((job_generation, EngineMove(fen, line[0], line[1] if len(line) > 1 else None,
+                                                depth, format_score(score, board.side_to_move),
+                                                searcher.nodes, timer.elapsed())))
+
+
+class EnginePlayer:
+    """Chooses moves for one side of a ChessGame in a separate process.
+
+    ``play`` starts a search timed for the given clock; the move is left in
+    ``result`` and announced with an ENGINE_EVENT. ``ponder`` searches the
+    position after the expected reply while the opponent thinks: if ``play``
+    is then called on that same position, the search already under way
+    becomes the real one instead of starting over.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self._ponder_fen = None
+        self._process = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._process is not None:
+            return
+        context = multiprocessing.get_context('spawn')
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self._generation = context.Value('i', 0, lock=False)
+        self._ponder_hit = context.Value('i', 0, lock=False)
+        self._process = context.Process(target=_engine_worker,
+                                        args=(self._jobs, self._results, self._generation,
+                                              self._ponder_hit),
+                                        daemon=True)
+        self._process.start()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def play(self, fen, remaining, increment=0.0):
+        """Choose a move for ``fen`` with ``remaining`` seconds on the engine's clock."""
+        with self._lock:
+            if self._ponder_fen is not None:
+                if self._ponder_fen == fen:
+                    self._ponder_fen = None
+                    self.ponder_hits += 1
+                    self._ponder_hit.value = self._generation.value
+                    return
+                self.ponder_misses += 1
+        self._submit(fen, remaining, increment, False)
+
+    def ponder(self, fen, remaining, increment=0.0):
+        """Think about ``fen``, the position after the expected reply, on the opponent's time."""
+        self._submit(fen, remaining, increment, True)
+
+    def _submit(self, fen, remaining, increment, pondering):
+        self.start()
+        with self._lock:
+            self._generation.value += 1
+            self.result = None
+            self._ponder_fen = fen if pondering else None
+            self._jobs.put((self._generation.value, fen, remaining, increment, pondering))
+
+    def take_result(self):
+        """Return the chosen move, once, or None if there is none yet."""
+        with self._lock:
+            result, self.result = self.result, None
+            return result
+
+    def stop(self):
+        """Abandon the current search or ponder."""
+        if self._process is None:
+            return
+        with self._lock:
+            self._generation.value += 1
+            self.result = None
+            self._ponder_fen = None
+
+    def close(self):
+        if self._process is None:
+            return
+        self.stop()
+        self._jobs.put(None)
+        self._results.put(None)
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._listener.join(timeout=1.0)
+        self._process = None
+
+    def _listen(self):
+        """Move chosen moves from the worker into ``result`` and wake the UI."""
+        while True:
+            try:
+                result = self._results.get()
+            except (EOFError, OSError):
+                return
+            if result is None:
+                return
+            job_generation, move = result
+            with self._lock:
+                if job_generation != self._generation.value:
+                    continue
+                self.result = move
+            try:
+                pygame.event.post(pygame.event.Event(ENGINE_EVENT))
+            except pygame.error:
+                pass  # Display already shut down
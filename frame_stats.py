@@ -0,0 +1,44 @@
+
+import time
+from collections import deque
+
+# How often the overlay text is refreshed, in seconds
+REFRESH_INTERVAL = 0.5
+
+
+class FrameStats:
+    """Rolling per-frame cost of input handling, game logic and drawing."""
+    
+    def __init__(self, window=120):
+        self.samples = deque(maxlen=window)
+        self.text = ""
+        self._last_refresh = time.perf_counter()
+        self._last_cpu = time.process_time()
+        self._frames_since_refresh = 0
+        
+    def add_frame(self, input_time, logic_time, draw_time):
+        self.samples.append((input_time, logic_time, draw_time))
+        self._frames_since_refresh += 1
+        
+    def refresh(self):
+        """Rebuild the summary text if it is due. Returns True when it changed."""
+        now = time.perf_counter()
+        elapsed = now - self._last_refresh
+        if elapsed < REFRESH_INTERVAL:
+            return False
+            
+        cpu = time.process_time()
+        cpu_percent = 100.0 * (cpu - self._last_cpu) / elapsed
+        fps = self._frames_since_refresh / elapsed
+        self._last_refresh = now
+        self._last_cpu = cpu
+        self._frames_since_refresh = 0
+        
+        count = max(1, len(self.samples))
+        input_ms, logic_ms, draw_ms = (1000.0 * sum(sample[i] for sample in self.samples) / count
+                                       for i in range(3))
+        text = (f"input {input_ms:.2f} ms  logic {logic_ms:.2f} ms  draw {draw_ms:.2f} ms  "
+                f"{fps:.0f} fps  cpu {cpu_percent:.0f}%")
+        changed = text != self.text
+        self.text = text
+        return changed
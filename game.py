@@ -3,12 +3,18 @@ import pygame
 from board import ChessBoard
 from ui import GameUI
 from move_history import MoveHistory
+from frame_stats import FrameStats
+from analysis import AnalysisService, ANALYSIS_EVENT
+from cache import PositionCache, CACHE_PATH
+from tablebase import Tablebases, WIN, DRAW
+from clock import GameClock, CLOCK_TIME, CLOCK_INCREMENT, LOW_TIME
+from engine_player import EnginePlayer, ENGINE_EVENT
 from constants import *
 
 class ChessGame:
 
     
-    def __init__(self):
+    def __init__(self, clock_time=CLOCK_TIME, clock_increment=CLOCK_INCREMENT, ponder=True):
         try:
             self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
             pygame.display.set_caption("Chess")
@@ -30,6 +36,9 @@ class ChessGame:
         self.dragged_piece = None
         self.dragged_square = None
         self.legal_moves = []
+        # Pointer position as reported by the latest mouse event, so a
+        # replayed event stream positions the pointer the same way
+        self.mouse_pos = pygame.mouse.get_pos()
         
         self.reset_pressed = False
         self.reset_timer = 0
@@ -37,8 +46,93 @@ class ChessGame:
 
         self.promotion_active = False
         self.promotion_square = None
+        self.promotion_from = None
+        
+        # Frames are only drawn after something invalidated the picture
+        self.needs_redraw = True
+        self.show_stats = False
+        # Attacked squares, hanging and pinned pieces, toggled with T
+        self.show_threats = False
+        self.frame_stats = FrameStats()
+        
+        # Background analysis of the current position, toggled with A
+        self.analysis = AnalysisService(cache_path=CACHE_PATH)
+        self.analysis_active = False
+        
+        # Exact results for small endgames, shown in place of the analysis line
+        self.tablebases = Tablebases()
+        self.tablebase_result = None
+        
+        # Move lists and results of positions already seen, e.g. when stepping
+        # back and forth through the history
+        self.positions = PositionCache()
+        
+        # Both players' clocks, started by the first move
+        self.clock = GameClock(clock_time, clock_increment)
+        self.clock_display = self.clock.get_display()
+        
+        # Computer opponent for one side, toggled with E; while it waits for
+        # the other side it thinks about the reply it expects
+        self.engine = EnginePlayer()
+        self.engine_color = None
+        self.ponder = ponder
+        self.ponder_move = None
+        
+    def close(self):
+        """Release resources held outside pygame."""
+        self.analysis.close()
+        self.engine.close()
+        self.tablebases.close()
+        
+    def is_animating(self):
+        """Return True while the screen changes without further input."""
+        # A clock shown in tenths changes faster than the idle wake-up interval
+        running = self.clock.running
+        return self.dragging or (running is not None and not self.game_over and
+                                 self.clock.remaining(running) < LOW_TIME)
         
     def handle_event(self, event):
+        if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            self.mouse_pos = event.pos
+            
+        # Pointer movement only changes the picture while dragging or choosing a promotion
+        if event.type != pygame.MOUSEMOTION or self.dragging or self.promotion_active:
+            self.needs_redraw = True
+            
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            # The window contents were lost, so the next frame repaints everything
+            self.ui.invalidate()
+            return
+            
+        if event.type == ANALYSIS_EVENT:
+            return  # New analysis output, shown by the next draw
+            
+        if event.type == ENGINE_EVENT:
+            self._play_engine_move()
+            return
+            
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_e:
+            self.engine_color = self.current_player if self.engine_color is None else None
+            self.ponder_move = None
+            self._update_engine()
+            return
+            
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.show_stats = not self.show_stats
+            return
+            
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+            self.show_threats = not self.show_threats
+            return
+            
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+            self.analysis_active = not self.analysis_active
+            if self.analysis_active:
+                self._position_changed()
+            else:
+                self.analysis.stop()
+            return
+            
         if self.game_over and event.type == pygame.KEYDOWN and event.key == pygame.K_r:
             self.reset_game()
             return
@@ -55,26 +149,32 @@ class ChessGame:
                 self.reset_timer = pygame.time.get_ticks()
         elif event.type == pygame.KEYUP and event.key == pygame.K_r:
             self.reset_pressed = False
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
+            self._step_history(self.move_history.undo)
+            return
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
+            self._step_history(self.move_history.redo)
+            return
             
         if self.game_over:
             return
             
         if event.type == pygame.MOUSEWHEEL:
             # Modern pygame wheel event
-            mx, my = pygame.mouse.get_pos()
+            mx, my = self.mouse_pos
             if (HISTORY_X <= mx <= HISTORY_X + HISTORY_WIDTH and
                 HISTORY_Y <= my <= HISTORY_Y + HISTORY_HEIGHT):
                 pairs = self.move_history.get_move_pairs()
-                max_rows = max(1, (HISTORY_HEIGHT - 80) // 28)
+                max_rows = max(1, (HISTORY_HEIGHT - 80) // HISTORY_ROW_HEIGHT)
                 self.ui.scroll_history(event.y, total_rows=len(pairs), max_rows=max_rows)
         elif event.type == pygame.MOUSEBUTTONDOWN and event.button in (4, 5):
             # Older pygame mouse wheel emulation (button 4 = up, 5 = down)
-            mx, my = pygame.mouse.get_pos()
+            mx, my = self.mouse_pos
             if (HISTORY_X <= mx <= HISTORY_X + HISTORY_WIDTH and
                 HISTORY_Y <= my <= HISTORY_Y + HISTORY_HEIGHT):
                 delta = 1 if event.button == 4 else -1
                 pairs = self.move_history.get_move_pairs()
-                max_rows = max(1, (HISTORY_HEIGHT - 80) // 28)
+                max_rows = max(1, (HISTORY_HEIGHT - 80) // HISTORY_ROW_HEIGHT)
                 self.ui.scroll_history(delta, total_rows=len(pairs), max_rows=max_rows)
         elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self._handle_mouse_down(event)
@@ -84,11 +184,10 @@ class ChessGame:
             self._handle_mouse_motion(event)
             
     def _handle_mouse_down(self, event):
-        if self.dragging:
+        if self.dragging or self.current_player == self.engine_color:
             return
             
-        pos = pygame.mouse.get_pos()
-        square = self.ui.get_square_from_pos(pos)
+        square = self.ui.get_square_from_pos(self.mouse_pos)
         
         if square is not None:
             piece = self.board.get_piece(square)
@@ -96,22 +195,22 @@ class ChessGame:
                 self.dragging = True
                 self.dragged_piece = piece
                 self.dragged_square = square
-                self.legal_moves = self.board.get_legal_moves(square)
+                self.legal_moves = self.positions.get_legal_moves(self.board, square)
                 
     def _handle_mouse_up(self, event):
         if not self.dragging:
             return
             
-        pos = pygame.mouse.get_pos()
-        target_square = self.ui.get_square_from_pos(pos)
+        target_square = self.ui.get_square_from_pos(self.mouse_pos)
         
         if target_square is not None and target_square in self.legal_moves:
             if (self.dragged_piece.type == PAWN and 
                 ((self.dragged_piece.color == WHITE and target_square // 8 == 7) or
                  (self.dragged_piece.color == BLACK and target_square // 8 == 0))):
+                # The move is played once the promotion piece has been chosen
                 self.promotion_active = True
                 self.promotion_square = target_square
-                self.board.make_move(self.dragged_square, target_square)
+                self.promotion_from = self.dragged_square
             else:
                 self._make_move(self.dragged_square, target_square)
         else:
@@ -130,23 +229,82 @@ class ChessGame:
     def _handle_promotion_event(self, event):
         """Handle events during pawn promotion."""
         if event.type == pygame.MOUSEBUTTONDOWN:
-            pos = pygame.mouse.get_pos()
-            piece_type = self.ui.get_promotion_piece(pos)
+            piece_type = self.ui.get_promotion_piece(self.mouse_pos)
             if piece_type:
-                self.board.promote_pawn(self.promotion_square, piece_type)
                 self.promotion_active = False
+                self._make_move(self.promotion_from, self.promotion_square, piece_type)
                 self.promotion_square = None
-                self._switch_player()
+                self.promotion_from = None
                 
-    def _make_move(self, from_square, to_square):
+    def _make_move(self, from_square, to_square, promotion=None):
         """Make a move and update game state."""
-        move_notation = self.board.make_move(from_square, to_square)
+        move_notation = self.board.make_move(from_square, to_square, promotion)
         if move_notation:
-            self.move_history.add_move(move_notation, self.current_player)
+            self.move_history.add_move(move_notation, self.current_player,
+                                       self.board.last_move, self.board)
             # show latest moves after making a move
             self.ui.history_scroll = 0
+            self.clock.press(self.current_player)
             self._switch_player()
             self._check_game_state()
+            self._position_changed()
+            self._update_engine()
+            
+    def _play_engine_move(self):
+        """Play the move the engine chose, if it is still for the current position."""
+        result = self.engine.take_result()
+        if (result is None or self.game_over or self.current_player != self.engine_color or
+                result.fen != self.board.get_fen()):
+            return
+        self.ponder_move = result.ponder
+        self._make_move(*result.move)
+        
+    def _update_engine(self):
+        """Start the engine on its move, or pondering on the expected reply to it."""
+        if self.engine_color is None or self.game_over:
+            self.engine.stop()
+            return
+        remaining = self.clock.remaining(self.engine_color)
+        if self.current_player == self.engine_color:
+            self.engine.play(self.board.get_fen(), remaining, self.clock.increment)
+        elif self.ponder and self.ponder_move in self.board._legal_move_list():
+            record = self.board._apply_move(*self.ponder_move)
+            fen = self.board.get_fen()
+            self.board.unmake_move(record)
+            self.engine.ponder(fen, remaining, self.clock.increment)
+        else:
+            self.engine.stop()
+            
+    def _step_history(self, step):
+        """Undo or redo one ply and resynchronise the game state with the board."""
+        if self.dragging or not step(self.board):
+            return
+        self.current_player = self.board.side_to_move
+        self.game_over = False
+        self.winner = None
+        self.game_result = None
+        self.ui.history_scroll = 0
+        # Play resumes from the new position: the side to move's clock runs
+        # (unless back at the start, where it waits for the first move) and
+        # the engine is restarted if it is that side
+        self.engine.stop()
+        self.ponder_move = None
+        self._check_game_state()
+        if self.game_over or self.move_history.ply == 0:
+            self.clock.stop()
+        else:
+            self.clock.start(self.current_player)
+        self._position_changed()
+        self._update_engine()
+        
+    def _position_changed(self):
+        """Restart background analysis on the new position."""
+        if not self.analysis_active:
+            return
+        if self.game_over:
+            self.analysis.stop()
+        else:
+            self.analysis.analyse(self.board.get_fen())
             
     def _switch_player(self):
         """Switch to the other player."""
@@ -154,13 +312,17 @@ class ChessGame:
         
     def _check_game_state(self):
         """Check for checkmate, stalemate, or check."""
-        if self.board.is_checkmate(self.current_player):
+        status = self.positions.game_status(self.board)
+        if status == 'checkmate':
             self.game_over = True
             self.winner = BLACK if self.current_player == WHITE else WHITE
             self.game_result = 'checkmate'
-        elif self.board.is_stalemate(self.current_player):
+        elif status == 'stalemate':
             self.game_over = True
             self.game_result = 'stalemate'
+        if self.game_over:
+            self.clock.stop()
+        self.tablebase_result = None if self.game_over else self.tablebases.probe(self.board)
             
     def reset_game(self):
         """Reset the game to initial state."""
@@ -176,29 +338,68 @@ class ChessGame:
         self.legal_moves = []
         self.promotion_active = False
         self.promotion_square = None
+        self.promotion_from = None
+        self.tablebase_result = None
+        self.clock.reset()
+        self.ponder_move = None
+        self.ui.invalidate()
+        self._position_changed()
+        self._update_engine()
         
     def update(self):
         if self.reset_pressed and pygame.time.get_ticks() - self.reset_timer > 1000:
             self.reset_pressed = False
+        if self.show_stats and self.frame_stats.refresh():
+            self.needs_redraw = True
+        flagged = self.clock.flagged()
+        if flagged is not None and not self.game_over:
+            self.clock.stop()
+            self.game_over = True
+            self.game_result = 'timeout'
+            self.winner = BLACK if flagged == WHITE else WHITE
+            self.dragging = False
+            self.promotion_active = False
+            self.engine.stop()
+            self._position_changed()
+        clock_display = self.clock.get_display()
+        if clock_display != self.clock_display:
+            self.clock_display = clock_display
+            self.needs_redraw = True
             
     def draw(self):
-        self.screen.fill(BACKGROUND_COLOR)
-
-        self.ui.draw_board(self.screen, self.board)
+        if not self.needs_redraw:
+            return
+        self.needs_redraw = False
         
-        if self.dragging and self.legal_moves:
-            self.ui.draw_legal_moves(self.screen, self.legal_moves)
-            
+        dragged = None
         if self.dragging and self.dragged_piece:
-            mouse_pos = pygame.mouse.get_pos()
-            self.ui.draw_dragged_piece(self.screen, self.dragged_piece, mouse_pos)
+            dragged = (self.dragged_piece, self.mouse_pos)
             
-        self.ui.draw_move_history(self.screen, self.move_history)
+        dirty = self.ui.render(
+            self.screen, self.board, self.move_history,
+            legal_moves=self.legal_moves if self.dragging else (),
+            dragged=dragged,
+            promotion_color=self.current_player if self.promotion_active else None,
+            game_over=(self.game_result, self.winner) if self.game_over else None,
+            stats_text=self.frame_stats.text if self.show_stats else None,
+            analysis_text=self._get_analysis_text(),
+            clock_display=self.clock_display,
+            threats=self.board.get_threats() if self.show_threats else None,
+            mouse_pos=self.mouse_pos
+        )
         
-        if self.promotion_active:
-            self.ui.draw_promotion_popup(self.screen, self.current_player)
-            
-        if self.game_over:
-            self.ui.draw_game_over_popup(self.screen, self.game_result, self.winner)
+        if dirty:
+            pygame.display.update(dirty)
             
-        pygame.display.flip()
+    def _get_analysis_text(self):
+        if self.tablebase_result is not None:
+            wdl, plies = self.tablebase_result
+            if wdl == DRAW:
+                return "Tablebase: draw"
+            mover = self.board.side_to_move
+            winner = mover if wdl == WIN else (BLACK if mover == WHITE else WHITE)
+            return f"Tablebase: {'White' if winner == WHITE else 'Black'} mates in {(plies + 1) // 2}"
+        if not self.analysis_active:
+            return None
+        info = self.analysis.latest
+        return info.get_summary() if info else "Analysing..."
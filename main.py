@@ -1,8 +1,17 @@
 
+import os
 import sys
+import time
 import pygame
 
 from game import ChessGame
+from replay import EventRecorder, RECORD_ENV
+import profiling
+
+# Frame rate while a piece is dragged, and how long an idle loop sleeps
+# waiting for input before waking up for timers
+ACTIVE_FPS = 60
+IDLE_TIMEOUT_MS = 500
 
 
 def main():
@@ -11,23 +20,48 @@ def main():
 
     
     game = ChessGame()
+    # Input can be recorded for replay.py to play back headless
+    recorder = EventRecorder(game, os.environ[RECORD_ENV]) if os.environ.get(RECORD_ENV) else None
     
     
     clock = pygame.time.Clock()
     running = True
  
     while running:
-        for event in pygame.event.get():
+        # Block until something happens unless the screen is being animated
+        if game.is_animating():
+            events = pygame.event.get()
+        else:
+            event = pygame.event.wait(IDLE_TIMEOUT_MS)
+            events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+            
+        frame_start = time.perf_counter()
+        for event in events:
             if event.type == pygame.QUIT:
                 #print(" Game window closed by user")
                 running = False
             else:
                 game.handle_event(event)
+        input_done = time.perf_counter()
         
         game.update()
-        game.draw()
-        clock.tick(60)
+        logic_done = time.perf_counter()
+        
+        # A wakeup with no input that changed nothing on screen is not a
+        # frame, and would drag the frame-time averages down
+        if events or game.needs_redraw:
+            game.draw()
+            draw_done = time.perf_counter()
+            
+            game.frame_stats.add_frame(input_done - frame_start, logic_done - input_done,
+                                       draw_done - logic_done)
+        if game.is_animating():
+            clock.tick(ACTIVE_FPS)
     
+    if recorder is not None:
+        recorder.close()
+    game.close()
+    profiling.write_report()
     pygame.quit()
     sys.exit()
 
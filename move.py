@@ -0,0 +1,64 @@
+
+from constants import *
+
+# Packed move record layout (one unsigned 64-bit integer per ply):
+#
+#   bits  0-5   from square
+#   bits  6-11  to square
+#   bits 12-14  promotion piece type (PAWN/0 = no promotion)
+#   bits 15-17  captured piece type (NO_PIECE = nothing captured)
+#   bits 18-21  flags (castling, en passant, mover's first move, captured piece had moved)
+#   bits 22-25  castling rights before the move
+#   bits 26-32  en passant target before the move, plus one (0 = none)
+#   bits 33-40  halfmove clock before the move (saturates at 255)
+
+NO_PIECE = 7
+
+FLAG_CASTLING = 1
+FLAG_EN_PASSANT = 2
+FLAG_FIRST_MOVE = 4
+FLAG_CAPTURED_MOVED = 8
+
+RECORD_TYPECODE = 'Q'
+
+
+def encode_move(from_square, to_square, promotion=PAWN, captured=NO_PIECE, flags=0,
+                castling_rights=0, en_passant_target=None, halfmove_clock=0):
+    ep = 0 if en_passant_target is None else en_passant_target + 1
+    return (from_square
+            | (to_square << 6)
+            | ((promotion or PAWN) << 12)
+            | (captured << 15)
+            | (flags << 18)
+            | (castling_rights << 22)
+            | (ep << 26)
+            | (min(halfmove_clock, 255) << 33))
+
+
+def decode_move(record):
+    """Return (from, to, promotion, captured, flags, castling, en_passant, halfmove)."""
+    ep = (record >> 26) & 0x7F
+    return (record & 0x3F,
+            (record >> 6) & 0x3F,
+            (record >> 12) & 0x7,
+            (record >> 15) & 0x7,
+            (record >> 18) & 0xF,
+            (record >> 22) & 0xF,
+            ep - 1 if ep else None,
+            (record >> 33) & 0xFF)
+
+
+def move_from(record):
+    return record & 0x3F
+
+
+def move_to(record):
+    return (record >> 6) & 0x3F
+
+
+def move_promotion(record):
+    return (record >> 12) & 0x7
+
+
+def set_promotion(record, piece_type):
+    return (record & ~(0x7 << 12)) | (piece_type << 12)
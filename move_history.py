@@ -1,28 +1,97 @@
 
+from array import array
+
 from constants import *
+from move import RECORD_TYPECODE
+
+# A board snapshot is kept every CHECKPOINT_INTERVAL plies so that seeking
+# through a long game never replays more than half an interval of moves.
+CHECKPOINT_INTERVAL = 32
 
 class MoveHistory:
     
     def __init__(self):
-        self.moves = []
+        self.moves = []  # (notation, color) for every recorded ply, including undone ones
+        self.records = array(RECORD_TYPECODE)  # Packed move records parallel to moves
+        self.ply = 0  # Number of plies currently applied to the board
+        self.checkpoints = {}  # Ply -> ChessBoard.snapshot() taken after that ply
+        self.version = 0  # Bumped on every change so views can tell when to refresh
         
-    def add_move(self, move_notation, color):
+    def add_move(self, move_notation, color, record, board=None):
+        # A new move after an undo discards the redo line
+        if self.ply < len(self.moves):
+            del self.moves[self.ply:]
+            del self.records[self.ply:]
+            for ply in [ply for ply in self.checkpoints if ply > self.ply]:
+                del self.checkpoints[ply]
+                
         self.moves.append((move_notation, color))
+        self.records.append(record)
+        self.ply += 1
+        self.version += 1
+        
+        if board is not None and self.ply % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints[self.ply] = board.snapshot()
         
     def get_move_count(self):
-        return len(self.moves)
+        return self.ply
         
     def get_last_move(self):
-        if self.moves:
-            return self.moves[-1]
+        if self.ply:
+            return self.moves[self.ply - 1]
         return None
         
     def clear(self):
         self.moves = []
+        self.records = array(RECORD_TYPECODE)
+        self.ply = 0
+        self.checkpoints = {}
+        self.version += 1
+        
+    def can_undo(self):
+        return self.ply > 0
+        
+    def can_redo(self):
+        return self.ply < len(self.moves)
+        
+    def undo(self, board):
+        """Take back the last applied ply on ``board``. Returns False at the start."""
+        if not self.can_undo():
+            return False
+        self.ply -= 1
+        self.version += 1
+        board.unmake_move(self.records[self.ply])
+        return True
+        
+    def redo(self, board):
+        """Re-apply the next undone ply on ``board``. Returns False at the end."""
+        if not self.can_redo():
+            return False
+        board.replay_move(self.records[self.ply])
+        self.ply += 1
+        self.version += 1
+        return True
+        
+    def seek(self, board, ply):
+        """Bring ``board`` to the position after ``ply`` plies of the recorded game."""
+        ply = max(0, min(ply, len(self.moves)))
+        
+        # Jump to the nearest checkpoint when it is closer than the current ply
+        if self.checkpoints:
+            nearest = min(self.checkpoints, key=lambda checkpoint: abs(checkpoint - ply))
+            if abs(nearest - ply) < abs(self.ply - ply):
+                board.restore(self.checkpoints[nearest])
+                self.ply = nearest
+                self.version += 1
+                
+        while self.ply > ply:
+            self.undo(board)
+        while self.ply < ply:
+            self.redo(board)
         
     def get_moves_for_color(self, color):
         # return moves only for the specified color
-        return [move for (move, move_color) in self.moves if move_color == color]
+        return [move for (move, move_color) in self.moves[:self.ply] if move_color == color]
         
     def get_move_pair(self, move_number):
         # return the (white_move, black_move) tuple for the given 1-based move_number
@@ -36,7 +105,7 @@ class MoveHistory:
         pairs = []
         white = None
         black = None
-        for move, color in self.moves:
+        for move, color in self.moves[:self.ply]:
             if color == WHITE:
                 if white is not None:
                     # consecutive white move (shouldn't normally happen) -> flush previous
@@ -68,4 +137,4 @@ class MoveHistory:
         return " ".join(pgn_moves)
         
     def is_empty(self):
-        return len(self.moves) == 0
+        return self.ply == 0
@@ -0,0 +1,147 @@
+
+from constants import *
+
+MASK_64 = (1 << 64) - 1
+RANK_MASKS = [RANK_1, RANK_2, RANK_3, RANK_4, RANK_5, RANK_6, RANK_7, RANK_8]
+
+# Entries in the pawn hash table; a power of two
+PAWN_TABLE_SIZE = 1 << 14
+
+# Evaluation terms in centipawns, per pawn
+PASSED_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]  # By rank counted from the pawn's own side
+ISOLATED_PENALTY = 15
+DOUBLED_PENALTY = 10
+BACKWARD_PENALTY = 8
+
+
+def _north_fill(bb):
+    bb |= bb << 8
+    bb |= bb << 16
+    bb |= bb << 32
+    return bb & MASK_64
+
+
+def _south_fill(bb):
+    bb |= bb >> 8
+    bb |= bb >> 16
+    bb |= bb >> 32
+    return bb
+
+
+def _east(bb):
+    return (bb & ~FILE_H) << 1 & MASK_64
+
+
+def _west(bb):
+    return (bb & ~FILE_A) >> 1
+
+
+def _front_spans(pawns, color):
+    """Squares in front of each pawn on its own file."""
+    if color == WHITE:
+        return _north_fill(pawns) << 8 & MASK_64
+    return _south_fill(pawns) >> 8
+
+
+def _pawn_attacks(pawns, color):
+    if color == WHITE:
+        return _east(pawns) << 8 & MASK_64 | _west(pawns) << 8 & MASK_64
+    return _east(pawns) >> 8 | _west(pawns) >> 8
+
+
+def _popcount(bb):
+    return bin(bb).count('1')
+
+
+class PawnStructure:
+    """Pawn features of one pawn placement, as bitboards per colour.
+
+    Everything is derived with whole-board shifts and masks, so the cost
+    does not depend on the number of pawns.
+    """
+
+    def __init__(self, white_pawns, black_pawns):
+        pawns = {WHITE: white_pawns, BLACK: black_pawns}
+        self.front_spans = {}
+        self.passed = {}
+        self.isolated = {}
+        self.doubled = {}
+        self.backward = {}
+        self.half_open_files = {}  # File bitmask (bit 0 = a-file) without own pawns
+
+        files_with_pawns = {}
+        for color in (WHITE, BLACK):
+            self.front_spans[color] = _front_spans(pawns[color], color)
+            # One bit per file that holds a pawn of this colour
+            files_with_pawns[color] = _south_fill(pawns[color]) & RANK_1
+
+        for color in (WHITE, BLACK):
+            enemy = BLACK if color == WHITE else WHITE
+            own, theirs = pawns[color], pawns[enemy]
+            enemy_spans = self.front_spans[enemy]
+            # Passed: no enemy pawn ahead on this or an adjacent file
+            self.passed[color] = own & ~(enemy_spans | _east(enemy_spans) | _west(enemy_spans))
+
+            own_files = _north_fill(files_with_pawns[color])
+            self.isolated[color] = own & ~(_east(own_files) | _west(own_files))
+            # Doubled: every pawn with another friendly pawn in front of it,
+            # i.e. lying in the backward spans of its own pawns
+            self.doubled[color] = own & _front_spans(own, enemy)
+
+            # Backward: the stop square is covered by an enemy pawn and no
+            # friendly pawn on an adjacent file can still come up to support it
+            spans = self.front_spans[color]
+            support = _east(spans) | _west(spans)
+            stops = own << 8 & MASK_64 if color == WHITE else own >> 8
+            blocked = stops & _pawn_attacks(theirs, enemy) & ~support
+            self.backward[color] = (blocked >> 8 if color == WHITE else blocked << 8 & MASK_64) & own
+
+            self.half_open_files[color] = ~files_with_pawns[color] & 0xFF
+
+        self.open_files = self.half_open_files[WHITE] & self.half_open_files[BLACK]
+        self.score = self._score()
+
+    def _score(self):
+        """Pawn structure score in centipawns from White's point of view."""
+        score = 0
+        for color, sign in ((WHITE, 1), (BLACK, -1)):
+            passed = self.passed[color]
+            for rank in range(1, 7):
+                count = _popcount(passed & RANK_MASKS[rank if color == WHITE else 7 - rank])
+                score += sign * PASSED_BONUS[rank] * count
+            score -= sign * ISOLATED_PENALTY * _popcount(self.isolated[color])
+            score -= sign * DOUBLED_PENALTY * _popcount(self.doubled[color])
+            score -= sign * BACKWARD_PENALTY * _popcount(self.backward[color])
+        return score
+
+
+class PawnHashTable:
+    """Direct-mapped cache of PawnStructure keyed only by pawn placement."""
+
+    def __init__(self, size=PAWN_TABLE_SIZE):
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, bitboard):
+        white_pawns = bitboard.boards[WHITE][PAWN]
+        black_pawns = bitboard.boards[BLACK][PAWN]
+        index = hash((white_pawns, black_pawns)) & self.mask
+        entry = self.entries[index]
+        if entry is not None and entry[0] == white_pawns and entry[1] == black_pawns:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        structure = PawnStructure(white_pawns, black_pawns)
+        self.entries[index] = (white_pawns, black_pawns, structure)
+        return structure
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,180 @@
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+from board import ChessBoard
+from engine import Searcher, INFINITY
+from constants import *
+
+
+def perft(board, depth):
+    """Count the leaf nodes of the legal move tree ``depth`` plies below ``board``."""
+    moves = board._legal_move_list()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        record = board._apply_move(*move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(record)
+    return nodes
+
+
+def divide(board, depth):
+    """Return {root move: leaf count} for a ``depth``-ply perft."""
+    counts = {}
+    for move in list(board._legal_move_list()):
+        record = board._apply_move(*move)
+        counts[move] = perft(board, depth - 1)
+        board.unmake_move(record)
+    return counts
+
+
+def split_tasks(board, depth, split_depth=1):
+    """Return the move paths ``split_depth`` plies deep that together cover the tree.
+
+    Splitting two plies deep gives many smaller tasks, which balances the
+    load better than the 20-40 root moves alone.
+    """
+    paths = [()]
+    for _ in range(min(split_depth, depth - 1)):
+        deeper = []
+        for path in paths:
+            records = [board._apply_move(*move) for move in path]
+            deeper.extend(path + (move,) for move in board._legal_move_list())
+            for record in reversed(records):
+                board.unmake_move(record)
+        paths = deeper
+    return paths
+
+
+def _task_size(board, path):
+    # Branching factor below the task, as a cheap estimate of its cost
+    records = [board._apply_move(*move) for move in path]
+    size = len(board._legal_move_list())
+    for record in reversed(records):
+        board.unmake_move(record)
+    return size
+
+
+def _perft_task(job):
+    fen, path, depth = job
+    board = ChessBoard()
+    board.set_fen(fen)
+    for move in path:
+        board._apply_move(*move)
+    return path, perft(board, depth - len(path))
+
+
+def _search_task(job):
+    fen, move, depth = job
+    board = ChessBoard()
+    board.set_fen(fen)
+    board._apply_move(*move)
+    searcher = Searcher(board)
+    # Searched from ply 1, so mate distances count the root move as in a
+    # serial search; depth 0 is the quiescence search
+    line = []
+    for child_depth in range(depth):
+        score, line = searcher._search(child_depth, -INFINITY, INFINITY, 1, line)
+    return move, -score, [move] + line
+
+
+def _run(task, jobs, workers):
+    if workers == 1:
+        return [task(job) for job in jobs]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers) as pool:
+        # One job at a time: a worker that finishes early takes the next
+        # waiting subtree instead of sitting idle behind a fixed share
+        return list(pool.imap_unordered(task, jobs, chunksize=1))
+
+
+def parallel_perft(board, depth, workers=None, split_depth=2):
+    """Perft of ``board`` with the subtrees spread over a process pool.
+
+    Returns (total nodes, {root move: nodes}). The counts do not depend on
+    the number of workers or the order in which subtrees finish.
+    """
+    if depth < 2:
+        return perft(board, depth), {}
+    fen = board.get_fen()
+    paths = split_tasks(board, depth, split_depth)
+    # Largest subtrees first, so none is left running alone at the end
+    paths.sort(key=lambda path: _task_size(board, path), reverse=True)
+    results = _run(_perft_task, [(fen, path, depth) for path in paths], workers)
+
+    by_root = {}
+    for path, nodes in sorted(results):
+        by_root[path[0]] = by_root.get(path[0], 0) + nodes
+    return sum(by_root.values()), by_root
+
+
+def parallel_search(board, depth, workers=None):
+    """Fixed-depth search with each root move searched in its own process.
+
+    Returns (score, principal variation) from the side to move's point of
+    view. Ties go to the earliest root move in generation order, so the
+    result is the same for any number of workers.
+    """
+    moves = list(board._legal_move_list())
+    if not moves:
+        return Searcher(board).search(depth)
+    fen = board.get_fen()
+    results = {move: (score, line)
+               for move, score, line in _run(_search_task, [(fen, move, depth) for move in moves],
+                                             workers)}
+    best_score, best_line = -INFINITY - 1, []
+    for move in moves:
+        score, line = results[move]
+        if score > best_score:
+            best_score, best_line = score, line
+    return best_score, best_line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count or search the move tree in parallel.")
+    parser.add_argument('depth', type=int)
+    parser.add_argument('--fen', default=INITIAL_FEN)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--split', type=int, default=2, choices=(1, 2),
+                        help="plies to split the tree at")
+    parser.add_argument('--divide', action='store_true', help="print the count per root move")
+    parser.add_argument('--serial', action='store_true', help="also time the serial perft")
+    parser.add_argument('--search', action='store_true',
+                        help="run a fixed-depth search split at the root instead")
+    args = parser.parse_args()
+
+    board = ChessBoard()
+    board.set_fen(args.fen)
+
+    start = time.perf_counter()
+    if args.search:
+        score, line = parallel_search(board, args.depth, args.workers)
+        elapsed = time.perf_counter() - start
+        pv = []
+        for move in line:
+            pv.append(board.get_san(*move))
+            board._apply_move(*move)
+        print(f"score {score} pv {' '.join(pv)} in {elapsed:.2f} s")
+        return 0
+
+    nodes, by_root = parallel_perft(board, args.depth, args.workers, args.split)
+    elapsed = time.perf_counter() - start
+    if args.divide:
+        for move, count in sorted(by_root.items()):
+            print(f"{board.get_san(*move)}: {count}")
+    print(f"nodes {nodes} in {elapsed:.2f} s ({nodes / elapsed:.0f} nodes/s)")
+    if args.serial:
+        start = time.perf_counter()
+        serial_nodes = perft(board, args.depth)
+        serial = time.perf_counter() - start
+        print(f"serial {serial_nodes} in {serial:.2f} s, speedup {serial / elapsed:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
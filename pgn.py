@@ -0,0 +1,167 @@
+
+import mmap
+import re
+from array import array
+
+from board import ChessBoard
+from move import RECORD_TYPECODE
+from constants import *
+
+# Tags that every exported game carries, in the order the PGN standard requires
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+TAG_DEFAULTS = {'Date': '????.??.??', 'Result': '*'}
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+LINE_WIDTH = 79
+
+TAG_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_RE = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|[()]|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{}();$.]+')
+
+
+class PGNGame:
+    
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else []  # SAN strings of the main line
+        self.result = result
+        self.records = array(RECORD_TYPECODE)  # Packed move records, filled when resolved
+        self.error = None  # Description of the first move that could not be resolved
+        
+    def is_valid(self):
+        return self.error is None
+        
+    def get_start_fen(self):
+        if self.headers.get('SetUp') == '1' and 'FEN' in self.headers:
+            return self.headers['FEN']
+        return INITIAL_FEN
+
+
+def read_games(path, resolve=True):
+    """Yield the games in a PGN file one at a time.
+
+    The file is memory-mapped and scanned line by line, so only the game being
+    parsed is held in memory. With ``resolve`` every SAN move is replayed on a
+    single reused ChessBoard and the packed move records are attached.
+    """
+    with open(path, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return
+            
+        with data:
+            board = ChessBoard() if resolve else None
+            for headers, movetext in _scan_games(data):
+                game = _parse_movetext(headers, movetext)
+                if board is not None:
+                    resolve_game(game, board)
+                yield game
+
+
+def _scan_games(data):
+    headers = {}
+    movetext = []
+    for raw_line in iter(data.readline, b''):
+        line = raw_line.decode('utf-8', 'replace').strip()
+        if not line or line.startswith('%'):
+            continue
+            
+        if line.startswith('['):
+            match = TAG_RE.match(line)
+            if match:
+                # A tag after movetext starts the next game
+                if movetext:
+                    yield headers, ' '.join(movetext)
+                    headers = {}
+                    movetext = []
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+                continue
+                
+        movetext.append(line)
+        
+    if headers or movetext:
+        yield headers, ' '.join(movetext)
+
+
+def _parse_movetext(headers, movetext):
+    game = PGNGame(headers, result=headers.get('Result', '*'))
+    variation_depth = 0
+    for token in TOKEN_RE.findall(movetext):
+        first = token[0]
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth or first in '{;$' or first.isdigit() and token.endswith('.'):
+            continue
+        elif token in RESULTS:
+            game.result = token
+        else:
+            game.moves.append(token)
+    return game
+
+
+def resolve_game(game, board):
+    """Replay ``game`` on ``board`` from its start position, recording each move."""
+    try:
+        board.set_fen(game.get_start_fen())
+    except ValueError as e:
+        game.error = str(e)
+        return False
+        
+    for ply, san in enumerate(game.moves):
+        record = board.make_san_move(san)
+        if record is None:
+            game.error = f"Illegal or ambiguous move {san!r} at ply {ply + 1}"
+            return False
+        game.records.append(record)
+    return True
+
+
+def write_game(stream, moves, headers=None, result=None):
+    """Write one game with its tag pairs to an open text stream."""
+    headers = dict(headers or {})
+    if result is not None:
+        headers['Result'] = result
+    result = headers.get('Result', '*')
+    
+    for tag in SEVEN_TAG_ROSTER:
+        stream.write(_format_tag(tag, headers.get(tag, TAG_DEFAULTS.get(tag, '?'))))
+    for tag, value in headers.items():
+        if tag not in SEVEN_TAG_ROSTER:
+            stream.write(_format_tag(tag, value))
+    stream.write('\n')
+    
+    # Games set up from a FEN keep that position's move number and side to move
+    move_number, color = 1, WHITE
+    fen = headers.get('FEN')
+    if fen:
+        fields = fen.split()
+        color = BLACK if len(fields) > 1 and fields[1] == 'b' else WHITE
+        move_number = int(fields[5]) if len(fields) > 5 else 1
+        
+    tokens = []
+    for index, san in enumerate(moves):
+        if color == WHITE:
+            tokens.append(f"{move_number}.")
+        elif index == 0:
+            tokens.append(f"{move_number}...")
+        tokens.append(san)
+        if color == BLACK:
+            move_number += 1
+        color = BLACK if color == WHITE else WHITE
+    tokens.append(result)
+    
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_WIDTH:
+            stream.write(line + '\n')
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    stream.write(line + '\n\n')
+
+
+def _format_tag(tag, value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{tag} "{value}"]\n'
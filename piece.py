@@ -1,4 +1,6 @@
 
+import os
+
 from constants import *
 
 try:
@@ -8,6 +10,9 @@ except (ImportError, OSError) as e:
     print(f"Pygame not available: {e}")
     PYGAME_AVAILABLE = False
 
+# Piece PNGs live alongside this module
+PIECE_IMAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Piece:
     
     def __init__(self, color, piece_type):
@@ -23,7 +28,7 @@ class Piece:
         color_name = "white" if self.color == WHITE else "black"
         piece_names = {PAWN: "pawn", ROOK: "rook", KNIGHT: "knight", 
                       BISHOP: "bishop", QUEEN: "queen", KING: "king"}
-        return f"assets/pieces/{color_name}_{piece_names[self.type]}.png"        
+        return os.path.join(PIECE_IMAGE_DIR, f"{color_name}_{piece_names[self.type]}.png")        
             
     def get_legal_moves(self, square, board):
         return []
@@ -200,34 +205,16 @@ class King(Piece):
         if self.has_moved:
             return moves
             
-        if self.color == WHITE and (board.castling_rights & WHITE_KINGSIDE):
-            if (not board.is_square_occupied(5) and 
-                not board.is_square_occupied(6) and
-                not board._square_under_attack(5, BLACK) and
-                not board._square_under_attack(6, BLACK)):
-                moves.append(6)
-                
-        if self.color == WHITE and (board.castling_rights & WHITE_QUEENSIDE):
-            if (not board.is_square_occupied(1) and 
-                not board.is_square_occupied(2) and
-                not board.is_square_occupied(3) and
-                not board._square_under_attack(2, BLACK) and
-                not board._square_under_attack(3, BLACK)):
-                moves.append(2)
-                
-        if self.color == BLACK and (board.castling_rights & BLACK_KINGSIDE):
-            if (not board.is_square_occupied(61) and 
-                not board.is_square_occupied(62) and
-                not board._square_under_attack(61, WHITE) and
-                not board._square_under_attack(62, WHITE)):
-                moves.append(62)
-                
-        if self.color == BLACK and (board.castling_rights & BLACK_QUEENSIDE):
-            if (not board.is_square_occupied(57) and 
-                not board.is_square_occupied(58) and
-                not board.is_square_occupied(59) and
-                not board._square_under_attack(58, WHITE) and
-                not board._square_under_attack(59, WHITE)):
-                moves.append(58)
+        # Castling out of check is never allowed
+        enemy_attacks = board.bitboard.attack_map(BLACK if self.color == WHITE else WHITE)
+        if enemy_attacks >> square & 1:
+            return moves
+            
+        # The board works out each right's paths when it is set up
+        occupied = board.bitboard.all_pieces
+        for right, king_from, destination, _, _, _, empty, safe in board.castling_paths[self.color]:
+            if (board.castling_rights & right and square == king_from and
+                    not occupied & empty and not enemy_attacks & safe):
+                moves.append(destination)
                 
         return moves
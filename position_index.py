@@ -0,0 +1,313 @@
+
+import argparse
+import bisect
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from archive import GameArchive
+from board import ChessBoard
+from zobrist import polyglot_hash, pawn_hash
+from constants import *
+
+# One posting file per kind of key, next to the index path:
+#   .positions  Polyglot key of every position reached
+#   .material   material signature (see material_signature)
+#   .pawns      key of the pawn placement alone
+KINDS = ('positions', 'material', 'pawns')
+
+# Posting file layout: header (key count, posting count), the postings
+# themselves (u32 game numbers grouped by key, ascending within a key),
+# padding to 8 bytes, the sorted u64 keys, then key count + 1 u64 offsets
+# into the postings. All native byte order.
+HEADER = struct.Struct('=QQ')
+RUN_ENTRY = struct.Struct('=QI')
+
+# Keys of one kind buffered per sorted run while building; bounds the
+# builder's memory
+RUN_ENTRIES = 1 << 20
+
+# Piece counts packed four bits each, White's then Black's
+MATERIAL_PIECES = (PAWN, KNIGHT, BISHOP, ROOK, QUEEN)
+MATERIAL_LETTERS = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN}
+
+
+def material_signature(board):
+    """Pack the number of each piece type per side into one integer."""
+    signature = 0
+    for color in (WHITE, BLACK):
+        boards = board.bitboard.boards[color]
+        for piece_type in MATERIAL_PIECES:
+            signature = signature << 4 | min(bin(boards[piece_type]).count('1'), 15)
+    return signature
+
+
+def parse_material(text):
+    """Return the signature of material written like 'KRPvKR' (White first)."""
+    sides = text.upper().split('V')
+    if len(sides) != 2:
+        raise ValueError(f"Material must look like KRPvKR, not {text!r}")
+    signature = 0
+    for side in sides:
+        counts = dict.fromkeys(MATERIAL_PIECES, 0)
+        for letter in side.replace('K', ''):
+            if letter not in MATERIAL_LETTERS:
+                raise ValueError(f"Unknown piece {letter!r} in {text!r}")
+            counts[MATERIAL_LETTERS[letter]] += 1
+        for piece_type in MATERIAL_PIECES:
+            signature = signature << 4 | min(counts[piece_type], 15)
+    return signature
+
+
+def position_keys(board):
+    """Return the (position, material, pawns) keys of the position on ``board``."""
+    return polyglot_hash(board), material_signature(board), pawn_hash(board)
+
+
+def build_index(archive_path, index_path, run_entries=RUN_ENTRIES):
+    """Replay every archived game and write the posting lists; returns the game count.
+
+    Keys are collected in typed buffers until one kind holds ``run_entries``
+    of them, then sorted and spilled to a temporary run file. The runs are
+    merged at the end and streamed to the output, so memory stays bounded
+    however large the archive is.
+    """
+    board = ChessBoard()
+    with GameArchive(archive_path) as archive, \
+            tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(index_path))) as tmp:
+        runs = {kind: [] for kind in KINDS}
+        pending = {kind: (array('Q'), array('I')) for kind in KINDS}
+        for game in range(len(archive)):
+            board.reset()
+            found = [set(), set(), set()]
+            for key, keys in zip(position_keys(board), found):
+                keys.add(key)
+            for record in archive.moves(game):
+                board.replay_move(record)
+                for key, keys in zip(position_keys(board), found):
+                    keys.add(key)
+            for kind, keys in zip(KINDS, found):
+                pending_keys, pending_games = pending[kind]
+                pending_keys.extend(keys)
+                pending_games.extend(array('I', (game,)) * len(keys))
+                # Runs end on game boundaries, so each covers its own game range
+                if len(pending_keys) >= run_entries:
+                    _spill(kind, pending[kind], runs, tmp)
+        for kind in KINDS:
+            _spill(kind, pending[kind], runs, tmp)
+
+        for kind in KINDS:
+            _merge_runs(runs[kind], f"{index_path}.{kind}", tmp)
+        return len(archive)
+
+
+def _spill(kind, entries, runs, directory):
+    keys, games = entries
+    if not keys:
+        return
+    # Games were appended in ascending order and the sort is stable, so
+    # sorting on the key alone leaves each key's games in order
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    path = os.path.join(directory, f"{kind}.{len(runs[kind])}")
+    with open(path, 'wb') as fp:
+        for start in range(0, len(order), 4096):
+            fp.write(b''.join(RUN_ENTRY.pack(keys[index], games[index])
+                              for index in order[start:start + 4096]))
+    runs[kind].append(path)
+    del keys[:]
+    del games[:]
+
+
+def _read_run(path):
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(RUN_ENTRY.size * 4096)
+            if not data:
+                return
+            yield from RUN_ENTRY.iter_unpack(data)
+
+
+def _merge_runs(run_paths, path, directory):
+    # Runs cover disjoint, increasing game ranges, so merging on (key, game)
+    # leaves every key's postings in game order. Postings go straight to the
+    # output; keys and offsets, which follow them, go to temporary files that
+    # are appended once the postings are complete.
+    keys = array('Q')
+    offsets = array('Q')
+    postings = array('I')
+    key_count = 0
+    last_key = None
+    with open(path, 'wb') as fp, \
+            tempfile.TemporaryFile(dir=directory) as keys_fp, \
+            tempfile.TemporaryFile(dir=directory) as offsets_fp:
+        fp.write(HEADER.pack(0, 0))
+        count = 0
+        for key, game in heapq.merge(*(_read_run(run) for run in run_paths)):
+            if key != last_key:
+                keys.append(key)
+                offsets.append(count)
+                key_count += 1
+                last_key = key
+                if len(keys) >= 1 << 16:
+                    keys_fp.write(keys.tobytes())
+                    offsets_fp.write(offsets.tobytes())
+                    del keys[:]
+                    del offsets[:]
+            postings.append(game)
+            count += 1
+            if len(postings) >= 1 << 16:
+                fp.write(postings.tobytes())
+                del postings[:]
+        fp.write(postings.tobytes())
+        offsets.append(count)
+        keys_fp.write(keys.tobytes())
+        offsets_fp.write(offsets.tobytes())
+        fp.write(bytes(-fp.tell() % 8))
+        for part in (keys_fp, offsets_fp):
+            part.seek(0)
+            shutil.copyfileobj(part, fp)
+        fp.seek(0)
+        fp.write(HEADER.pack(key_count, count))
+
+
+class PostingFile:
+    """Sorted posting lists of one kind of key, memory-mapped."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        key_count, posting_count = HEADER.unpack_from(self._data)
+        view = memoryview(self._data)
+        start = HEADER.size
+        self._postings = view[start:start + 4 * posting_count].cast('I')
+        start += 4 * posting_count
+        start += -start % 8
+        self._keys = view[start:start + 8 * key_count].cast('Q')
+        start += 8 * key_count
+        self._offsets = view[start:start + 8 * (key_count + 1)].cast('Q')
+
+    def __len__(self):
+        return len(self._keys)
+
+    def games(self, key):
+        """Return the ascending game numbers filed under ``key``, as a memoryview."""
+        index = bisect.bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            return self._postings[0:0]
+        return self._postings[self._offsets[index]:self._offsets[index + 1]]
+
+    def close(self):
+        for view in (self._postings, self._keys, self._offsets):
+            view.release()
+        self._data.close()
+
+
+def intersect(postings):
+    """Return the game numbers common to all the ascending lists in ``postings``."""
+    postings = sorted(postings, key=len)
+    if not postings:
+        return []
+    result = list(postings[0])
+    for other in postings[1:]:
+        # Probe the longer list by binary search from where the last match was
+        matches = []
+        low = 0
+        for game in result:
+            low = bisect.bisect_left(other, game, low)
+            if low == len(other):
+                break
+            if other[low] == game:
+                matches.append(game)
+        result = matches
+        if not result:
+            break
+    return result
+
+
+class PositionIndex:
+    """Answers 'which games reached ...' queries from prebuilt posting lists."""
+
+    def __init__(self, index_path):
+        self.files = {kind: PostingFile(f"{index_path}.{kind}") for kind in KINDS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def games_with_position(self, board):
+        return list(self.files['positions'].games(polyglot_hash(board)))
+
+    def games_with_material(self, material):
+        """``material`` is a board or a signature, e.g. from parse_material('KRvKR')."""
+        if not isinstance(material, int):
+            material = material_signature(material)
+        return list(self.files['material'].games(material))
+
+    def games_with_pawns(self, board):
+        return list(self.files['pawns'].games(pawn_hash(board)))
+
+    def query(self, position=None, material=None, pawns=None):
+        """Return the games matching every criterion given, in ascending order.
+
+        ``position`` and ``pawns`` are boards; ``material`` is a board or a
+        signature.
+        """
+        postings = []
+        if position is not None:
+            postings.append(self.files['positions'].games(polyglot_hash(position)))
+        if material is not None:
+            if not isinstance(material, int):
+                material = material_signature(material)
+            postings.append(self.files['material'].games(material))
+        if pawns is not None:
+            postings.append(self.files['pawns'].games(pawn_hash(pawns)))
+        return intersect(postings)
+
+    def close(self):
+        for posting_file in self.files.values():
+            posting_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index archived games by the positions they reach.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="index a game archive")
+    build.add_argument('archive')
+    build.add_argument('index')
+    query = commands.add_parser('query', help="list the games matching a position or pattern")
+    query.add_argument('index')
+    query.add_argument('--fen', help="games reaching this exact position")
+    query.add_argument('--pawns', help="games reaching the pawn structure of this FEN")
+    query.add_argument('--material', help="games reaching this material, e.g. KRPvKR")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_index(args.archive, args.index)
+        print(f"Indexed {count} games into {args.index}")
+        return 0
+
+    position = pawns = None
+    if args.fen:
+        position = ChessBoard()
+        position.set_fen(args.fen)
+    if args.pawns:
+        pawns = ChessBoard()
+        pawns.set_fen(args.pawns)
+    material = parse_material(args.material) if args.material else None
+    if position is None and pawns is None and material is None:
+        parser.error("give at least one of --fen, --pawns and --material")
+    with PositionIndex(args.index) as index:
+        games = index.query(position, material, pawns)
+    print(f"{len(games)} games: {' '.join(map(str, games[:100]))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+
+import json
+import os
+import sys
+import time
+from functools import wraps
+
+# Set to 1 to print a report on exit, or to a path ending in .json to dump there
+PROFILE_ENV = 'CHESS_PROFILE'
+
+# Decided once at import: when off, profiled() hands back the bare function
+ENABLED = os.environ.get(PROFILE_ENV, '') not in ('', '0')
+
+# name -> [calls, cumulative seconds]
+_stats = {}
+
+
+def profiled(name):
+    """Count calls to the decorated function and time them under ``name``.
+
+    Timings are inclusive, so a hook that calls another hooked function
+    also counts the inner call's time.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        entry = _stats.setdefault(name, [0, 0.0])
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+
+        return wrapper
+
+    return decorate
+
+
+def reset():
+    for entry in _stats.values():
+        entry[0] = 0
+        entry[1] = 0.0
+
+
+def get_stats():
+    """Return {name: {'calls', 'total_ms', 'mean_us'}} for every hook that ran."""
+    stats = {}
+    for name, (calls, total) in _stats.items():
+        if calls:
+            stats[name] = {'calls': calls,
+                           'total_ms': round(total * 1000, 3),
+                           'mean_us': round(total / calls * 1e6, 3)}
+    return stats
+
+
+def dump_json(stream):
+    json.dump(get_stats(), stream, indent=2, sort_keys=True)
+    stream.write('\n')
+
+
+def format_report():
+    stats = sorted(get_stats().items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    lines = [f"{'hook':<36}{'calls':>10}{'total ms':>12}{'mean us':>10}"]
+    for name, entry in stats:
+        lines.append(f"{name:<36}{entry['calls']:>10}{entry['total_ms']:>12.1f}"
+                     f"{entry['mean_us']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def write_report():
+    """Write the collected statistics where the environment variable asks for them."""
+    if not ENABLED:
+        return
+    target = os.environ[PROFILE_ENV]
+    if target.endswith('.json'):
+        with open(target, 'w') as fp:
+            dump_json(fp)
+    else:
+        print(format_report(), file=sys.stderr)
@@ -0,0 +1,304 @@
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import pygame
+
+from board import ChessBoard
+from constants import *
+
+# Set to a file path to record every event ChessGame handles while playing
+RECORD_ENV = 'CHESS_RECORD'
+
+RECORDING_VERSION = 1
+
+# Event attributes that can be written out; anything else (window handles,
+# custom objects) is dropped
+SIMPLE_TYPES = (int, float, str, bool, type(None))
+
+# Synthetic benchmark game: pointer steps per drag, and how often and how far
+# the history panel is scrolled
+DRAG_STEPS = 6
+SCROLL_EVERY = 20
+SCROLL_ROWS = 12
+
+
+def _encode_value(value):
+    if isinstance(value, SIMPLE_TYPES):
+        return value
+    if isinstance(value, (tuple, list)) and all(isinstance(item, SIMPLE_TYPES) for item in value):
+        return list(value)
+    raise TypeError
+
+
+def encode_event(event, frame, timestamp):
+    """Return a JSON-ready dict of ``event``, or None for events that cannot be replayed."""
+    if event.type >= pygame.USEREVENT:
+        return None  # Background results depend on processes that are not replayed
+    attributes = {}
+    for name, value in event.dict.items():
+        try:
+            attributes[name] = _encode_value(value)
+        except TypeError:
+            continue
+    return {'frame': frame, 'time': round(timestamp, 6), 'type': event.type,
+            'name': pygame.event.event_name(event.type), 'attributes': attributes}
+
+
+def decode_event(entry):
+    attributes = {name: tuple(value) if isinstance(value, list) else value
+                  for name, value in entry['attributes'].items()}
+    return pygame.event.Event(entry['type'], attributes)
+
+
+class EventRecorder:
+    """Writes every event a ChessGame handles to a file, one JSON line each.
+
+    ``handle_event`` and ``draw`` are wrapped on the game instance: events
+    are stamped with the time since recording began and with the number of
+    the frame they arrived in, so a replay hands them over in the same
+    batches between draws.
+    """
+
+    def __init__(self, game, path):
+        self.game = game
+        self.path = path
+        self.frame = 0
+        self.count = 0
+        self.start = time.perf_counter()
+        self._fp = open(path, 'w')
+        self._fp.write(json.dumps({'version': RECORDING_VERSION, 'pygame': pygame.version.ver,
+                                   'window': [WINDOW_WIDTH, WINDOW_HEIGHT]}) + '\n')
+        self._handle_event = game.handle_event
+        self._draw = game.draw
+        game.handle_event = self.handle_event
+        game.draw = self.draw
+
+    def handle_event(self, event):
+        entry = encode_event(event, self.frame, time.perf_counter() - self.start)
+        if entry is not None:
+            self._fp.write(json.dumps(entry) + '\n')
+            self.count += 1
+        self._handle_event(event)
+
+    def draw(self):
+        self._draw()
+        self.frame += 1
+
+    def close(self):
+        if self._fp is None:
+            return
+        self.game.handle_event = self._handle_event
+        self.game.draw = self._draw
+        self._fp.close()
+        self._fp = None
+
+
+def read_recording(path):
+    """Return the header and the recorded events of ``path`` grouped by frame."""
+    with open(path) as fp:
+        header = json.loads(fp.readline())
+        if header.get('version') != RECORDING_VERSION:
+            raise ValueError(f"{path} is not a version {RECORDING_VERSION} recording")
+        frames = []
+        last_frame = None
+        for line in fp:
+            entry = json.loads(line)
+            if entry['frame'] != last_frame:
+                frames.append([])
+                last_frame = entry['frame']
+            frames[-1].append(entry)
+    return header, frames
+
+
+def _square_center(square):
+    rank, file = square // 8, square % 8
+    return (BOARD_X + file * SQUARE_SIZE + SQUARE_SIZE // 2,
+            BOARD_Y + (7 - rank) * SQUARE_SIZE + SQUARE_SIZE // 2)
+
+
+# Centre of the queen button in the promotion popup (see GameUI.get_promotion_piece)
+PROMOTION_QUEEN = ((WINDOW_WIDTH - 200) // 2 + 35, (WINDOW_HEIGHT - 100) // 2 + 45)
+HISTORY_POINT = (HISTORY_X + HISTORY_WIDTH // 2, HISTORY_Y + HISTORY_HEIGHT // 2)
+
+
+def generate_game(path, plies=300, seed=0):
+    """Write a recording of a random ``plies``-ply game played by dragging pieces.
+
+    Moves that would end the game are avoided while others exist, so the
+    game normally runs its full length. Every SCROLL_EVERY plies the history
+    panel is scrolled back and forth. Returns the number of plies played.
+    """
+    rng = random.Random(seed)
+    board = ChessBoard()
+    frames = []
+
+    def mouse(event_type, pos, **attributes):
+        attributes['pos'] = pos
+        frames.append([(event_type, attributes)])
+
+    played = 0
+    for ply in range(plies):
+        moves = board._legal_move_list()
+        if not moves:
+            break
+        candidates = list(moves)
+        rng.shuffle(candidates)
+        move = candidates[0]
+        for candidate in candidates:
+            record = board._apply_move(*candidate)
+            ongoing = board.get_game_status() in ('ongoing', 'check')
+            board.unmake_move(record)
+            if ongoing:
+                move = candidate
+                break
+        from_square, to_square, promotion = move
+        start, end = _square_center(from_square), _square_center(to_square)
+        mouse(pygame.MOUSEMOTION, start, rel=(0, 0), buttons=(0, 0, 0))
+        mouse(pygame.MOUSEBUTTONDOWN, start, button=1)
+        for step in range(1, DRAG_STEPS + 1):
+            pos = (start[0] + (end[0] - start[0]) * step // DRAG_STEPS,
+                   start[1] + (end[1] - start[1]) * step // DRAG_STEPS)
+            mouse(pygame.MOUSEMOTION, pos, rel=(0, 0), buttons=(1, 0, 0))
+        mouse(pygame.MOUSEBUTTONUP, end, button=1)
+        if promotion is not None:
+            move = (from_square, to_square, QUEEN)  # The popup is answered with a queen
+            mouse(pygame.MOUSEBUTTONDOWN, PROMOTION_QUEEN, button=1)
+            mouse(pygame.MOUSEBUTTONUP, PROMOTION_QUEEN, button=1)
+        board.make_move(*move)
+        played += 1
+
+        if played % SCROLL_EVERY == 0:
+            mouse(pygame.MOUSEMOTION, HISTORY_POINT, rel=(0, 0), buttons=(0, 0, 0))
+            for delta in [1] * SCROLL_ROWS + [-1] * SCROLL_ROWS:
+                frames.append([(pygame.MOUSEWHEEL, {'x': 0, 'y': delta, 'flipped': False})])
+
+    with open(path, 'w') as fp:
+        fp.write(json.dumps({'version': RECORDING_VERSION, 'pygame': pygame.version.ver,
+                             'window': [WINDOW_WIDTH, WINDOW_HEIGHT], 'plies': played}) + '\n')
+        for frame, events in enumerate(frames):
+            for event_type, attributes in events:
+                fp.write(json.dumps({'frame': frame, 'time': 0.0, 'type': event_type,
+                                     'name': pygame.event.event_name(event_type),
+                                     'attributes': attributes}) + '\n')
+    return played
+
+
+class ReplayStats:
+
+    def __init__(self):
+        self.event_times = {}  # Event name -> [seconds per event]
+        self.draw_times = []  # Seconds per frame that repainted
+        self.frames = 0
+        self.elapsed = 0.0
+
+    def add_event(self, name, seconds):
+        self.event_times.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        """Return {'events': {name: timings}, 'draw': timings, ...}; timings in ms."""
+        return {'frames': self.frames, 'drawn': len(self.draw_times),
+                'elapsed_s': round(self.elapsed, 3),
+                'events': {name: _timings(times) for name, times in sorted(self.event_times.items())},
+                'draw': _timings(self.draw_times)}
+
+
+def _timings(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {'count': len(samples),
+            'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+            'median_ms': round(statistics.median(samples) * 1000, 4),
+            'p95_ms': round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 4),
+            'max_ms': round(ordered[-1] * 1000, 4)}
+
+
+def replay(path, game=None, realtime=False):
+    """Feed a recording to a ChessGame frame by frame and time it; returns ReplayStats.
+
+    Each frame's events are handled one by one, then the game is updated
+    and drawn, as in the main loop. With ``realtime`` the original pauses
+    between events are kept; otherwise frames follow each other at once.
+    """
+    _, frames = read_recording(path)
+    if game is None:
+        from game import ChessGame
+        game = ChessGame()
+    stats = ReplayStats()
+    start = time.perf_counter()
+    for events in frames:
+        for entry in events:
+            if realtime:
+                delay = entry['time'] - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            event = decode_event(entry)
+            event_start = time.perf_counter()
+            game.handle_event(event)
+            stats.add_event(entry['name'], time.perf_counter() - event_start)
+        game.update()
+        drawing = game.needs_redraw
+        draw_start = time.perf_counter()
+        game.draw()
+        if drawing:
+            stats.draw_times.append(time.perf_counter() - draw_start)
+        stats.frames += 1
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def format_summary(summary):
+    lines = [f"{summary['frames']} frames ({summary['drawn']} drawn) in {summary['elapsed_s']:.2f} s"]
+    rows = [(f"event {name}", timings) for name, timings in summary['events'].items()]
+    rows.append(("draw", summary['draw']))
+    lines.append(f"{'':24} {'count':>7} {'mean ms':>9} {'median':>9} {'p95':>9} {'max':>9}")
+    for label, timings in rows:
+        if timings['count']:
+            lines.append(f"{label:24} {timings['count']:7d} {timings['mean_ms']:9.3f} "
+                         f"{timings['median_ms']:9.3f} {timings['p95_ms']:9.3f} "
+                         f"{timings['max_ms']:9.3f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded input into a headless ChessGame "
+                                                 "and time event handling and drawing.")
+    parser.add_argument('recording', help=f"file written with {RECORD_ENV} set, or by --generate")
+    parser.add_argument('--generate', type=int, metavar='PLIES',
+                        help="first write a synthetic game of this many plies with scrolling")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--realtime', action='store_true', help="keep the recorded timing")
+    parser.add_argument('--json', help="also write the timings to this file")
+    args = parser.parse_args()
+
+    # Headless: nothing is shown and no window system is needed
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.init()
+    if args.generate:
+        plies = generate_game(args.recording, args.generate, args.seed)
+        print(f"Wrote a {plies}-ply game to {args.recording}")
+
+    from game import ChessGame
+    game = ChessGame()
+    try:
+        stats = replay(args.recording, game, args.realtime)
+    finally:
+        game.close()
+        pygame.quit()
+    summary = stats.summary()
+    print(format_summary(summary))
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(summary, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
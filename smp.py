@@ -0,0 +1,202 @@
+
+import argparse
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+from board import ChessBoard
+from engine import Searcher, SearchAborted, INFINITY, format_score
+from constants import *
+
+# Entries in the shared transposition table; a power of two
+TABLE_SIZE = 1 << 20
+
+# Entry layout: two u64 words, (key ^ data, data), where data packs
+#   bits  0-14  best move: from (6), to (6), promotion (3); 0 = none
+#   bits 15-16  bound (0 = empty slot)
+#   bits 17-24  depth
+#   bits 25-46  score + SCORE_OFFSET
+# A reader only accepts an entry whose first word XOR its second gives the
+# key, so an entry torn by two processes writing at once reads as a miss
+# and no lock is needed.
+SCORE_OFFSET = 1 << 21
+MASK_64 = (1 << 64) - 1
+
+
+def _pack_move(move):
+    if move is None:
+        return 0
+    from_square, to_square, promotion = move
+    return from_square | to_square << 6 | (promotion or 0) << 12
+
+
+def _unpack_move(packed):
+    if not packed:
+        return None
+    promotion = packed >> 12 & 0x7
+    return (packed & 0x3F, packed >> 6 & 0x3F, promotion or None)
+
+
+class SharedTranspositionTable:
+    """Always-replace transposition table in a shared memory block.
+
+    Created once by the parent and attached to by name in each worker, so
+    every search process reads and writes the same entries.
+    """
+
+    def __init__(self, size=TABLE_SIZE, name=None):
+        self.size = size
+        self.mask = size - 1
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=size * 16)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.words = self.memory.buf.cast('Q')
+        self.hits = 0
+        self.probes = 0
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) stored for ``key``, or None."""
+        self.probes += 1
+        index = (key & self.mask) * 2
+        data = self.words[index + 1]
+        if not data or self.words[index] ^ data != key:
+            return None
+        self.hits += 1
+        return (data >> 17 & 0xFF, (data >> 25 & 0x3FFFFF) - SCORE_OFFSET,
+                data >> 15 & 0x3, _unpack_move(data & 0x7FFF))
+
+    def store(self, key, depth, score, bound, move):
+        data = (_pack_move(move) | bound << 15 | min(depth, 0xFF) << 17 |
+                (score + SCORE_OFFSET) << 25)
+        index = (key & self.mask) * 2
+        self.words[index] = (key ^ data) & MASK_64
+        self.words[index + 1] = data
+
+    def clear(self):
+        self.memory.buf[:] = bytes(len(self.memory.buf))
+
+    def close(self):
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _worker_depths(worker, depth):
+    # Odd-numbered helpers run one ply ahead of the others, so the table is
+    # filled with deeper results before the main worker gets there
+    offset = worker % 2
+    return range(1 + offset, depth + 1 + offset)
+
+
+def _smp_worker(worker, fen, depth, table_name, table_size, stop, results):
+    table = SharedTranspositionTable(table_size, name=table_name)
+    board = ChessBoard()
+    board.set_fen(fen)
+    searcher = Searcher(board, should_stop=lambda: stop.value, transposition_table=table)
+    start = time.perf_counter()
+    completed = None
+    line = []
+    try:
+        for current in _worker_depths(worker, depth):
+            score, line = searcher._search(current, -INFINITY, INFINITY, 0, line)
+            completed = (current, score, line, time.perf_counter() - start)
+            if current >= depth:
+                stop.value = 1  # Every other worker can give up now
+                break
+    except SearchAborted:
+        pass
+    results.put((worker, completed, searcher.nodes, time.perf_counter() - start,
+                 table.hits, table.probes))
+    del searcher
+    table.close()
+
+
+class SMPResult:
+
+    def __init__(self, depth, score, line, elapsed, workers):
+        self.depth = depth
+        self.score = score  # Side to move's point of view
+        self.line = line
+        self.elapsed = elapsed  # Wall seconds until the target depth was reached
+        self.workers = workers  # [(worker, nodes, seconds, table hit rate)]
+
+    def nodes(self):
+        return sum(nodes for _, nodes, _, _ in self.workers)
+
+
+def lazy_smp_search(board, depth, workers=None, table_size=TABLE_SIZE):
+    """Search ``board`` to ``depth`` with several processes sharing one table.
+
+    Every worker searches the whole tree; they only cooperate through the
+    shared transposition table. The search stops as soon as any worker
+    completes ``depth``, and the deepest completed result wins, the lowest
+    worker number breaking ties.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    table = SharedTranspositionTable(table_size)
+    stop = context.Value('b', 0, lock=False)
+    results = context.Queue()
+    fen = board.get_fen()
+    start = time.perf_counter()
+    processes = [context.Process(target=_smp_worker,
+                                 args=(worker, fen, depth, table.name, table_size, stop, results))
+                 for worker in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        table.close()
+
+    best = None
+    worker_stats = []
+    for worker, completed, nodes, seconds, hits, probes in sorted(reports, key=lambda r: r[0]):
+        worker_stats.append((worker, nodes, seconds, hits / probes if probes else 0.0))
+        if completed is not None and (best is None or completed[0] > best[0]):
+            best = completed
+    if best is None:
+        return SMPResult(0, 0, [], time.perf_counter() - start, worker_stats)
+    completed_depth, score, line, _ = best
+    return SMPResult(completed_depth, score, line, time.perf_counter() - start, worker_stats)
+
+
+def format_report(result, board, baseline=None):
+    lines = [f"depth {result.depth} score {format_score(result.score, board.side_to_move)} "
+             f"in {result.elapsed:.2f} s, {result.nodes() / result.elapsed:.0f} nodes/s"]
+    for worker, nodes, seconds, hit_rate in result.workers:
+        lines.append(f"  worker {worker}: {nodes} nodes, {nodes / seconds if seconds else 0:.0f} "
+                     f"nodes/s, table hits {hit_rate:.1%}")
+    if baseline is not None:
+        lines.append(f"effective speedup {baseline.elapsed / result.elapsed:.2f}x "
+                     f"over 1 worker ({baseline.elapsed:.2f} s)")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lazy SMP search with a shared transposition table.")
+    parser.add_argument('depth', type=int)
+    parser.add_argument('--fen', default=INITIAL_FEN)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="search processes (default: one per CPU)")
+    parser.add_argument('--compare', action='store_true',
+                        help="also search with one worker and report the speedup")
+    args = parser.parse_args()
+
+    board = ChessBoard()
+    board.set_fen(args.fen)
+    baseline = lazy_smp_search(board, args.depth, 1) if args.compare else None
+    result = lazy_smp_search(board, args.depth, args.workers)
+    print(format_report(result, board, baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+
+import mmap
+import os
+import sys
+from itertools import product
+
+from bitboard import KING_TARGETS, KING_MASKS, attacks_from
+from constants import *
+
+TABLEBASE_DIR = 'tablebases'
+
+# Supported material sets: the stronger side's pieces besides its king, against a lone king
+ENDGAMES = {
+    'KQK': (QUEEN,),
+    'KRK': (ROOK,),
+    'KPK': (PAWN,),
+    'KBNK': (BISHOP, KNIGHT),
+}
+
+# Tables a pawn can promote into, which must be generated first
+PROMOTION_TABLES = {QUEEN: 'KQK', ROOK: 'KRK'}
+
+# One byte per position, from the side to move's point of view:
+#   DRAW     draw, or not won by either side
+#   ILLEGAL  impossible position, or a symmetric duplicate that is never probed
+#   other    distance to mate in plies plus one; an odd distance is a win for
+#            the side to move, an even one a loss
+DRAW = 0
+ILLEGAL = 255
+
+WIN = 1
+LOSS = -1
+
+# Move count marking a lone-king position that can escape to a draw
+ESCAPE = 255
+
+
+def _unmove_origins(piece_type, square, occupied):
+    """Squares a white piece now on ``square`` could have moved from."""
+    if piece_type == PAWN:
+        origins = []
+        if square >= 16 and not occupied >> (square - 8) & 1:
+            origins.append(square - 8)
+            if square // 8 == 3 and not occupied >> (square - 16) & 1:
+                origins.append(square - 16)
+        return origins
+    mask = attacks_from(piece_type, WHITE, square, occupied) & ~occupied
+    return [s for s in range(64) if mask >> s & 1]
+
+
+def _build_symmetries():
+    # The eight board symmetries, as square maps, made of file flips,
+    # rank flips and transposition
+    transforms = []
+    for flip_file, flip_rank, transpose in product((False, True), repeat=3):
+        table = []
+        for square in range(64):
+            file, rank = square % 8, square // 8
+            if transpose:
+                file, rank = rank, file
+            if flip_file:
+                file = 7 - file
+            if flip_rank:
+                rank = 7 - rank
+            table.append(rank * 8 + file)
+        transforms.append(table)
+    return transforms
+
+
+SYMMETRIES = _build_symmetries()
+
+# Without pawns the white king is mapped into the a1-d1-d4 triangle
+TRIANGLE = [A1, B1, C1, D1, B1 + 8, C1 + 8, D1 + 8, C1 + 16, D1 + 16, D1 + 24]
+DIAGONAL = [A1, B1 + 8, C1 + 16, D1 + 24]
+TRIANGLE_SYMMETRIES = [[t for t in SYMMETRIES if t[square] in TRIANGLE] for square in range(64)]
+
+
+class EndgameLayout:
+    """Maps positions of one material set to table indices.
+
+    A position is (side to move, white king, black king, white piece squares)
+    with White as the stronger side. Symmetric positions share one index, so
+    the table holds one byte per position up to symmetry.
+    """
+
+    def __init__(self, piece_types):
+        self.piece_types = piece_types
+        self.has_pawns = PAWN in piece_types
+        if self.has_pawns:
+            # Pawns only allow the left-right mirror, so the white king keeps to files a-d
+            self.king_squares = [square for square in range(64) if square % 8 < 4]
+        else:
+            self.king_squares = TRIANGLE
+        self.king_index = {square: i for i, square in enumerate(self.king_squares)}
+        self.half = len(self.king_squares) * 64 ** (len(piece_types) + 1)
+        self.size = 2 * self.half
+
+    def index(self, side_to_move, white_king, black_king, squares):
+        if self.has_pawns:
+            if white_king % 8 > 3:
+                white_king ^= 7
+                black_king ^= 7
+                squares = [square ^ 7 for square in squares]
+        else:
+            best = None
+            # A king on the triangle's diagonal fits two symmetries; take the smaller image
+            for table in TRIANGLE_SYMMETRIES[white_king]:
+                image = (table[black_king], [table[square] for square in squares])
+                if best is None or image < best:
+                    best = image
+            white_king = TRIANGLE_SYMMETRIES[white_king][0][white_king]
+            black_king, squares = best
+
+        index = side_to_move * len(self.king_squares) + self.king_index[white_king]
+        for square in squares:
+            index = index * 64 + square
+        return index * 64 + black_king
+
+    def decode(self, index):
+        black_king = index % 64
+        index //= 64
+        squares = []
+        for _ in self.piece_types:
+            squares.append(index % 64)
+            index //= 64
+        squares.reverse()
+        side_to_move, king = divmod(index, len(self.king_squares))
+        return side_to_move, self.king_squares[king], black_king, squares
+
+
+def generate(name, directory=TABLEBASE_DIR):
+    """Solve the ``name`` endgame by retrograde analysis and save its table."""
+    piece_types = ENDGAMES[name]
+    layout = EndgameLayout(piece_types)
+    values = bytearray([ILLEGAL]) * layout.size
+    move_counts = bytearray(layout.size)
+    frontier = []
+    # White wins reached by promoting, bucketed by distance to mate
+    promotions = {}
+
+    promotion_tables = {}
+    if PAWN in piece_types:
+        for promotion, table_name in PROMOTION_TABLES.items():
+            promotion_tables[promotion] = Tablebase(table_name, directory)
+
+    for white_king in layout.king_squares:
+        for squares in product(range(64), repeat=len(piece_types)):
+            if white_king in squares or len(set(squares)) < len(squares):
+                continue
+            if any(piece_type == PAWN and square // 8 in (0, 7)
+                   for piece_type, square in zip(piece_types, squares)):
+                continue
+
+            white_occupied = 1 << white_king
+            for square in squares:
+                white_occupied |= 1 << square
+            # The black king is left out of the occupancy, so lines through it stay attacked
+            attacked = KING_MASKS[white_king]
+            for piece_type, square in zip(piece_types, squares):
+                attacked |= attacks_from(piece_type, WHITE, square, white_occupied)
+
+            for black_king in range(64):
+                if white_occupied >> black_king & 1 or KING_MASKS[white_king] >> black_king & 1:
+                    continue
+                white_index = layout.index(WHITE, white_king, black_king, squares)
+                if (white_king in DIAGONAL and
+                        layout.decode(white_index)[2:] != (black_king, list(squares))):
+                    continue  # Symmetric duplicate stored under its mirror image
+                black_index = white_index + layout.half
+                in_check = attacked >> black_king & 1
+
+                if not in_check:
+                    values[white_index] = DRAW
+                    if PAWN in piece_types:
+                        _seed_promotions(promotions, promotion_tables, white_index, white_king,
+                                         black_king, squares, white_occupied | 1 << black_king)
+
+                values[black_index] = DRAW
+                successors = set()
+                for target in KING_TARGETS[black_king]:
+                    if attacked >> target & 1:
+                        continue
+                    if white_occupied >> target & 1:
+                        # Taking an undefended piece leaves too little material to mate
+                        successors = None
+                        break
+                    successors.add(layout.index(WHITE, white_king, target, squares))
+
+                if successors is None:
+                    move_counts[black_index] = ESCAPE
+                elif successors:
+                    move_counts[black_index] = len(successors)
+                elif in_check:
+                    values[black_index] = 1  # Checkmated
+                    frontier.append(black_index)
+                else:
+                    move_counts[black_index] = ESCAPE  # Stalemate
+
+    plies = 0
+    while frontier or promotions:
+        next_frontier = []
+        if plies % 2 == 0:
+            # Black positions lost in `plies`: any White move into them wins
+            for index in frontier:
+                _, white_king, black_king, squares = layout.decode(index)
+                occupied = 1 << white_king | 1 << black_king
+                for square in squares:
+                    occupied |= 1 << square
+                pieces = [(KING, white_king)] + list(zip(piece_types, squares))
+                for i, (piece_type, square) in enumerate(pieces):
+                    for origin in _unmove_origins(piece_type, square, occupied):
+                        if i == 0:
+                            previous = layout.index(WHITE, origin, black_king, squares)
+                        else:
+                            moved = list(squares)
+                            moved[i - 1] = origin
+                            previous = layout.index(WHITE, white_king, black_king, moved)
+                        if values[previous] == DRAW:
+                            values[previous] = plies + 2
+                            next_frontier.append(previous)
+        else:
+            # White positions won in `plies`: Black positions are lost once every move leads to one
+            for index in frontier:
+                _, white_king, black_king, squares = layout.decode(index)
+                occupied = 1 << white_king
+                for square in squares:
+                    occupied |= 1 << square
+                previous_positions = set()
+                for origin in KING_TARGETS[black_king]:
+                    if not occupied >> origin & 1:
+                        previous_positions.add(layout.index(BLACK, white_king, origin, squares))
+                for previous in previous_positions:
+                    if values[previous] != DRAW or move_counts[previous] == ESCAPE:
+                        continue
+                    move_counts[previous] -= 1
+                    if move_counts[previous] == 0:
+                        values[previous] = plies + 2
+                        next_frontier.append(previous)
+
+        plies += 1
+        for index in promotions.pop(plies, ()):
+            if values[index] == DRAW:
+                values[index] = plies + 1
+                next_frontier.append(index)
+        frontier = next_frontier
+
+    for table in promotion_tables.values():
+        table.close()
+    os.makedirs(directory, exist_ok=True)
+    with open(_table_path(name, directory), 'wb') as fp:
+        fp.write(values)
+    return values
+
+
+def _seed_promotions(promotions, promotion_tables, index, white_king, black_king, squares,
+                     occupied):
+    # A pawn on the seventh promotes into KQK or KRK with Black to move
+    pawn = squares[0]
+    if pawn // 8 != 6 or occupied >> (pawn + 8) & 1:
+        return
+    for table in promotion_tables.values():
+        value = table.probe_squares(BLACK, white_king, black_king, [pawn + 8])
+        if value not in (DRAW, ILLEGAL) and (value - 1) % 2 == 0:
+            promotions.setdefault(value, []).append(index)
+
+
+def _table_path(name, directory):
+    return os.path.join(directory, name + '.tb')
+
+
+class Tablebase:
+    """One solved endgame, memory-mapped from disk."""
+
+    def __init__(self, name, directory=TABLEBASE_DIR):
+        self.name = name
+        self.layout = EndgameLayout(ENDGAMES[name])
+        with open(_table_path(name, directory), 'rb') as fp:
+            self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) != self.layout.size:
+            self._data.close()
+            raise ValueError(f"Tablebase {name} has the wrong size")
+
+    def close(self):
+        self._data.close()
+
+    def probe_squares(self, side_to_move, white_king, black_king, squares):
+        """Return the raw table byte for a position with White as the stronger side."""
+        return self._data[self.layout.index(side_to_move, white_king, black_king, squares)]
+
+
+class Tablebases:
+    """Probes whichever endgame tables are present in ``directory``.
+
+    Tables are opened on first use; a missing table simply makes its
+    positions unknown.
+    """
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self._tables = {}
+
+    def close(self):
+        for table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables.clear()
+
+    def probe(self, board):
+        """Return (WIN/DRAW/LOSS, plies to mate or None) for the side to move, or None."""
+        bitboard = board.bitboard
+        piece_count = bin(bitboard.all_pieces).count('1')
+        if board.castling_rights or piece_count > 4:
+            return None
+
+        for strong in (WHITE, BLACK):
+            weak = BLACK if strong == WHITE else WHITE
+            weak_pieces = bitboard.white_pieces if weak == WHITE else bitboard.black_pieces
+            if weak_pieces != bitboard.boards[weak][KING]:
+                continue
+            boards = bitboard.boards[strong]
+            others = [piece_type for piece_type in (PAWN, ROOK, KNIGHT, BISHOP, QUEEN)
+                      if boards[piece_type]]
+            if not others or (others in ([KNIGHT], [BISHOP]) and piece_count == 3):
+                return (DRAW, None)  # Bare kings or a lone minor piece cannot mate
+
+            for name, piece_types in ENDGAMES.items():
+                if sorted(piece_types) != others:
+                    continue
+                squares = [_single_square(boards[piece_type]) for piece_type in piece_types]
+                if None in squares:
+                    break
+                table = self._get_table(name)
+                if table is None:
+                    return None
+                white_king = _single_square(boards[KING])
+                black_king = _single_square(bitboard.boards[weak][KING])
+                if white_king is None or black_king is None:
+                    return None
+                side_to_move = WHITE if board.side_to_move == strong else BLACK
+                if strong == BLACK:
+                    # Mirror the ranks so the stronger side plays up the board as White
+                    white_king ^= 56
+                    black_king ^= 56
+                    squares = [square ^ 56 for square in squares]
+                return _decode_value(table.probe_squares(side_to_move, white_king,
+                                                         black_king, squares))
+            return None
+        return None
+
+    def best_move(self, board):
+        """Return the (from, to, promotion) move that keeps the best tablebase result, or None."""
+        if self.probe(board) is None:
+            return None
+        best, best_key = None, None
+        for move in board._legal_move_list():
+            record = board._apply_move(*move)
+            result = self.probe(board) or (DRAW, None)
+            board.unmake_move(record)
+            # Prefer the opponent's fastest loss, then a draw, then the slowest win for them
+            wdl, plies = result
+            key = (wdl, plies if wdl == LOSS else -(plies or 0))
+            if best_key is None or key < best_key:
+                best, best_key = move, key
+        return best
+
+    def _get_table(self, name):
+        if name not in self._tables:
+            try:
+                self._tables[name] = Tablebase(name, self.directory)
+            except (OSError, ValueError):
+                self._tables[name] = None
+        return self._tables[name]
+
+
+def _single_square(bitboard):
+    if bitboard == 0 or bitboard & (bitboard - 1):
+        return None
+    return bitboard.bit_length() - 1
+
+
+def _decode_value(value):
+    if value == DRAW or value == ILLEGAL:
+        return (DRAW, None)
+    plies = value - 1
+    return (WIN if plies % 2 else LOSS, plies)
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(ENDGAMES)
+    # Promotion targets go first so KPK can look them up
+    for name in sorted(names, key=lambda name: name == 'KPK'):
+        generate(name)
+        print(f"Generated {name}")
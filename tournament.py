@@ -0,0 +1,241 @@
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+
+from board import ChessBoard
+from engine import Searcher, evaluate, MATE_SCORE
+from move_history import MoveHistory
+from pgn import write_game
+from zobrist import polyglot_hash
+from constants import *
+
+# Games still running after this many plies are adjudicated as draws
+MAX_PLIES = 300
+
+
+class RandomPlayer:
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_move(self, board):
+        return self.rng.choice(board._legal_move_list())
+
+
+class GreedyPlayer:
+    """Plays the move with the best static evaluation one ply ahead, mates first."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_move(self, board):
+        best_moves, best_score = [], None
+        for move in board._legal_move_list():
+            record = board._apply_move(*move)
+            status = board.get_game_status()
+            if status == 'checkmate':
+                score = MATE_SCORE
+            elif status == 'stalemate':
+                score = 0
+            else:
+                score = -evaluate(board)
+            board.unmake_move(record)
+            if best_score is None or score > best_score:
+                best_moves, best_score = [move], score
+            elif score == best_score:
+                best_moves.append(move)
+        return self.rng.choice(best_moves)
+
+
+class SearchPlayer:
+
+    def __init__(self, rng, depth):
+        self.rng = rng
+        self.depth = depth
+
+    def choose_move(self, board):
+        _, line = Searcher(board).search(self.depth)
+        return line[0] if line else self.rng.choice(board._legal_move_list())
+
+
+def make_player(spec, rng):
+    """Build a player from 'random', 'greedy' or 'search:<depth>'."""
+    name, _, argument = spec.partition(':')
+    if name == 'random':
+        return RandomPlayer(rng)
+    if name == 'greedy':
+        return GreedyPlayer(rng)
+    if name == 'search':
+        return SearchPlayer(rng, int(argument or 2))
+    raise ValueError(f"Unknown player {spec!r}")
+
+
+class GameRecord:
+
+    def __init__(self, number, white, black, result, termination, moves, think_time,
+                 white_is_a=True):
+        self.number = number
+        self.white = white
+        self.black = black
+        # Which tournament player had White; the specs alone cannot tell
+        # when both players use the same one
+        self.white_is_a = white_is_a
+        self.result = result
+        self.termination = termination
+        self.moves = moves  # SAN strings
+        self.think_time = think_time  # Seconds spent choosing moves, per colour
+
+
+def play_game(number, white, black, seed, max_plies=MAX_PLIES, white_is_a=True):
+    """Play one game between two player specs and return its GameRecord."""
+    rng = random.Random(seed)
+    players = {WHITE: make_player(white, rng), BLACK: make_player(black, rng)}
+    board = ChessBoard()
+    history = MoveHistory()
+    think_time = {WHITE: 0.0, BLACK: 0.0}
+    repetitions = {polyglot_hash(board): 1}
+
+    while True:
+        status = board.get_game_status()
+        color = board.side_to_move
+        if status == 'checkmate':
+            result, termination = ('0-1' if color == WHITE else '1-0'), 'checkmate'
+            break
+        if status == 'stalemate':
+            result, termination = '1/2-1/2', 'stalemate'
+            break
+        if board.bitboard.halfmove_clock >= 100:
+            result, termination = '1/2-1/2', 'fifty-move rule'
+            break
+        if max(repetitions.values()) >= 3:
+            result, termination = '1/2-1/2', 'threefold repetition'
+            break
+        if _insufficient_material(board):
+            result, termination = '1/2-1/2', 'insufficient material'
+            break
+        if history.get_move_count() >= max_plies:
+            result, termination = '1/2-1/2', 'move limit'
+            break
+
+        start = time.perf_counter()
+        from_square, to_square, promotion = players[color].choose_move(board)
+        think_time[color] += time.perf_counter() - start
+
+        notation = board.make_move(from_square, to_square, promotion)
+        history.add_move(notation, color, board.last_move, board)
+        key = polyglot_hash(board)
+        repetitions[key] = repetitions.get(key, 0) + 1
+
+    moves = [notation for notation, _ in history.moves[:history.ply]]
+    return GameRecord(number, white, black, result, termination, moves, think_time, white_is_a)
+
+
+def _insufficient_material(board):
+    # Bare kings, or a single minor piece against a bare king
+    others = [piece.type for piece in board.pieces.values() if piece.type != KING]
+    return not others or (len(others) == 1 and others[0] in (KNIGHT, BISHOP))
+
+
+def _play_game(job):
+    return play_game(*job)
+
+
+def run_tournament(player_a, player_b, games, workers=None, seed=0, max_plies=MAX_PLIES):
+    """Play ``games`` games with alternating colours and return their GameRecords.
+
+    Games are spread over ``workers`` processes (one per CPU by default) and
+    returned in game order.
+    """
+    jobs = []
+    for number in range(games):
+        white_is_a = number % 2 == 0
+        white, black = (player_a, player_b) if white_is_a else (player_b, player_a)
+        jobs.append((number + 1, white, black, seed + number, max_plies, white_is_a))
+
+    if workers == 1:
+        return [_play_game(job) for job in jobs]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers) as pool:
+        records = list(pool.imap_unordered(_play_game, jobs))
+    return sorted(records, key=lambda record: record.number)
+
+
+def write_pgn(path, records):
+    with open(path, 'w') as fp:
+        for record in records:
+            headers = {'Event': 'Self-play tournament', 'Round': str(record.number),
+                       'White': record.white, 'Black': record.black,
+                       'Termination': record.termination}
+            write_game(fp, record.moves, headers, record.result)
+
+
+def summarize(records, player_a, player_b, wall_time):
+    """Return a text report of results and speed from ``player_a``'s point of view."""
+    wins = losses = draws = 0
+    plies = 0
+    think = {True: [0.0, 0], False: [0.0, 0]}  # Keyed by whether the player is A
+    terminations = {}
+    for record in records:
+        a_color = WHITE if record.white_is_a else BLACK
+        if record.result == '1/2-1/2':
+            draws += 1
+        elif (record.result == '1-0') == (a_color == WHITE):
+            wins += 1
+        else:
+            losses += 1
+        plies += len(record.moves)
+        terminations[record.termination] = terminations.get(record.termination, 0) + 1
+        for color in (WHITE, BLACK):
+            is_a = color == a_color
+            think[is_a][0] += record.think_time[color]
+            # White moves first, so it has the extra ply in odd-length games
+            think[is_a][1] += (len(record.moves) + (color == WHITE)) // 2
+
+    games = len(records)
+    score = (wins + draws / 2) / games if games else 0.0
+    lines = [f"{player_a} vs {player_b}: +{wins} -{losses} ={draws} "
+             f"({score:.1%} for {player_a}) over {games} games",
+             f"Average game length: {plies / games if games else 0:.1f} plies",
+             "Terminations: " + ', '.join(f"{name} {count}"
+                                          for name, count in sorted(terminations.items()))]
+    for is_a, spec in ((True, player_a), (False, player_b)):
+        seconds, moves = think[is_a]
+        if moves:
+            label = spec if player_a != player_b else f"{spec} ({'A' if is_a else 'B'})"
+            lines.append(f"{label}: {moves / seconds if seconds else 0:.1f} moves/s, "
+                         f"{seconds / moves * 1000:.2f} ms per move")
+    lines.append(f"Wall time: {wall_time:.1f} s")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engine self-play matches.")
+    parser.add_argument('player_a', help="random, greedy or search:<depth>")
+    parser.add_argument('player_b')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--pgn', help="write the games to this PGN file")
+    args = parser.parse_args()
+
+    # Reject bad player names before starting any processes
+    for spec in (args.player_a, args.player_b):
+        make_player(spec, random.Random())
+
+    start = time.perf_counter()
+    records = run_tournament(args.player_a, args.player_b, args.games, args.workers,
+                             args.seed, args.max_plies)
+    wall_time = time.perf_counter() - start
+    if args.pgn:
+        write_pgn(args.pgn, records)
+    print(summarize(records, args.player_a, args.player_b, wall_time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,8 @@
 
+import os
+from collections import OrderedDict
+
+from bitboard import iter_squares
 from constants import *
 
 try:
@@ -7,6 +11,26 @@ try:
 except ImportError:
     PYGAME_AVAILABLE = False
 
+# The piece images sit next to the modules, wherever the game is started from
+PIECE_IMAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Number of rendered text surfaces kept by GameUI._render_text
+TEXT_CACHE_SIZE = 512
+
+# The window is split into two columns: the board with its coordinate labels,
+# and the move history panel
+BOARD_REGION = (0, 0, HISTORY_X, WINDOW_HEIGHT)
+HISTORY_REGION = (HISTORY_X, 0, WINDOW_WIDTH - HISTORY_X, WINDOW_HEIGHT)
+
+# Frame-time overlay, in the strip above the board
+STATS_RECT = (BOARD_X, 8, BOARD_SIZE, 24)
+
+# Engine analysis line, in the strip above the history panel
+ANALYSIS_RECT = (HISTORY_X, 8, HISTORY_WIDTH, 24)
+
+# Both players' clocks, in the strip below the history panel
+CLOCK_RECT = (HISTORY_X, HISTORY_Y + HISTORY_HEIGHT + 8, HISTORY_WIDTH, 28)
+
 class GameUI:
     
     def __init__(self):
@@ -23,6 +47,64 @@ class GameUI:
         # History scroll: number of rows scrolled up from the bottom (0 = show most recent page)
         self.history_scroll = 0
         
+        # What is currently on screen, so render() can repaint only what changed
+        self._full_redraw = True
+        self._drawn_pieces = {}
+        self._drawn_highlights = frozenset()
+        self._drag_rect = None
+        self._drawn_history_frame = None
+        self._drawn_history_rows = []
+        self._history_version = None
+        self._history_scroll = None
+        self._drawn_promotion = None
+        self._drawn_game_over = None
+        self._drawn_stats = None
+        self._drawn_analysis = None
+        self._drawn_clock = None
+        self._drawn_threats = None
+        
+        # Threat overlay of the current position, rebuilt only when it changes
+        self._threat_surface = None
+        self._threat_key = None
+        
+        # Surfaces that never change are built once and blitted from then on
+        self._text_cache = OrderedDict()
+        self._background = None
+        self._highlight = None
+        if PYGAME_AVAILABLE:
+            self._build_static_surfaces()
+        
+    def _build_static_surfaces(self):
+        """Pre-render the board squares, coordinate labels and history panel frame."""
+        self._background = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+        if pygame.display.get_surface() is not None:
+            self._background = self._background.convert()
+        self._background.fill(BACKGROUND_COLOR)
+        
+        for square in range(64):
+            rank, file = square // 8, square % 8
+            color = BOARD_LIGHT if (file + rank) % 2 == 0 else BOARD_DARK
+            pygame.draw.rect(self._background, color, self._get_square_rect(square))
+        self._draw_labels(self._background)
+        self._draw_history_frame(self._background)
+        
+        self._highlight = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
+        self._highlight.set_alpha(128)
+        self._highlight.fill(HIGHLIGHT_LEGAL)
+        
+    def _render_text(self, text, font, color):
+        """Return a rendered text surface, reusing it from an LRU cache."""
+        key = (text, font, color)
+        surface = self._text_cache.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self._text_cache[key] = surface
+            if len(self._text_cache) > TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
+        else:
+            self._text_cache.move_to_end(key)
+        return surface
+        
     def _load_piece_images(self):
         piece_types = [PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING]
         colors = [WHITE, BLACK]
@@ -44,65 +126,200 @@ class GameUI:
         color_name = "white" if color == WHITE else "black"
         piece_names = {PAWN: "pawn", ROOK: "rook", KNIGHT: "knight", 
                       BISHOP: "bishop", QUEEN: "queen", KING: "king"}
-        return f"assets/pieces/{color_name}_{piece_names[piece_type]}.png"
+        return os.path.join(PIECE_IMAGE_DIR, f"{color_name}_{piece_names[piece_type]}.png")
                 
-    def draw_board(self, screen, board):
-        for rank in range(8):
-            for file in range(8):
-                display_rank = 7 - rank
-                square_rect = pygame.Rect(
-                    BOARD_X + file * SQUARE_SIZE,
-                    BOARD_Y + display_rank * SQUARE_SIZE,
-                    SQUARE_SIZE,
-                    SQUARE_SIZE
-                )
+    def invalidate(self):
+        """Force the next render() to repaint the whole window."""
+        self._full_redraw = True
+        
+    def render(self, screen, board, move_history, legal_moves=(), dragged=None,
+               promotion_color=None, game_over=None, stats_text=None, analysis_text=None,
+               clock_display=None, threats=None, mouse_pos=None):
+        """Repaint only the regions that changed since the previous call.
+
+        ``dragged`` is a (piece, mouse_pos) pair while a piece is being dragged,
+        ``game_over`` a (game_result, winner) pair once the game has ended.
+        ``stats_text`` is shown in the frame-time overlay and ``analysis_text``
+        above the history panel when given. ``clock_display`` is the (white
+        time, black time, running color) triple shown below it. ``threats``
+        is the board's Threats, drawn as an overlay under the pieces.
+        ``mouse_pos`` is the pointer position, read from pygame if not given.
+        Returns the list of dirty rects for pygame.display.update().
+        """
+        dirty = []
+        if mouse_pos is None:
+            mouse_pos = pygame.mouse.get_pos()
+        
+        pieces = {square: (piece.color, piece.type) for square, piece in board.pieces.items()}
+        for square in pieces.keys() | self._drawn_pieces.keys():
+            if pieces.get(square) != self._drawn_pieces.get(square):
+                dirty.append(self._get_square_rect(square))
                 
-                if (file + rank) % 2 == 0:
-                    color = BOARD_LIGHT
-                else:
-                    color = BOARD_DARK
-                    
-                pygame.draw.rect(screen, color, square_rect)
+        highlights = frozenset(legal_moves)
+        for square in highlights ^ self._drawn_highlights:
+            dirty.append(self._get_square_rect(square))
+            
+        drag_rect = None
+        if dragged:
+            piece_image = self.piece_images.get((dragged[0].color, dragged[0].type))
+            if piece_image:
+                drag_rect = piece_image.get_rect(center=dragged[1])
+        if drag_rect != self._drag_rect:
+            # Old and new positions usually overlap, so repaint them as one trail
+            if drag_rect and self._drag_rect and drag_rect.colliderect(self._drag_rect):
+                dirty.append(drag_rect.union(self._drag_rect))
+            else:
+                dirty.extend(rect for rect in (drag_rect, self._drag_rect) if rect)
+                
+        history_frame, history_rows = self._get_history_state(move_history)
+        if history_frame != self._drawn_history_frame:
+            dirty.append(pygame.Rect(HISTORY_X, HISTORY_Y, HISTORY_WIDTH, HISTORY_HEIGHT))
+        else:
+            for idx, row in enumerate(history_rows):
+                if idx >= len(self._drawn_history_rows) or self._drawn_history_rows[idx] != row:
+                    dirty.append(self._get_history_row_rect(idx))
+            for idx in range(len(history_rows), len(self._drawn_history_rows)):
+                dirty.append(self._get_history_row_rect(idx))
                 
-                square = rank * 8 + file
-                piece = board.get_piece(square)
-                if piece:
-                    piece_image = self.piece_images.get((piece.color, piece.type))
-                    if piece_image:
-                        piece_rect = piece_image.get_rect(center=square_rect.center)
-                        screen.blit(piece_image, piece_rect)
-                        
-        self._draw_labels(screen)
+        promotion_state = None
+        if promotion_color is not None:
+            promotion_state = (promotion_color, self.get_promotion_piece(mouse_pos))
+        if promotion_state != self._drawn_promotion:
+            dirty.append(self._get_popup_rect(200, 100))
+        if game_over != self._drawn_game_over:
+            # The result text may be wider than the popup itself
+            popup_rect = self._get_popup_rect(300, 150)
+            dirty.append(pygame.Rect(0, popup_rect.y, WINDOW_WIDTH, popup_rect.height))
+        if stats_text != self._drawn_stats:
+            dirty.append(pygame.Rect(STATS_RECT))
+        if analysis_text != self._drawn_analysis:
+            dirty.append(pygame.Rect(ANALYSIS_RECT))
+        if clock_display != self._drawn_clock:
+            dirty.append(pygame.Rect(CLOCK_RECT))
+        threat_key = threats.key() if threats is not None else None
+        if threat_key != self._drawn_threats:
+            dirty.append(pygame.Rect(BOARD_X, BOARD_Y, BOARD_SIZE, BOARD_SIZE))
+            if threats is not None and threat_key != self._threat_key:
+                self._threat_surface = self._build_threat_surface(threats)
+                self._threat_key = threat_key
+            
+        if self._full_redraw:
+            dirty = [screen.get_rect()]
+            
+        for area in dirty:
+            self._repaint(screen, area, board, move_history, highlights, dragged,
+                          promotion_color, game_over, stats_text, analysis_text, clock_display,
+                          threats is not None, mouse_pos)
+                          
+        self._full_redraw = False
+        self._drawn_pieces = pieces
+        self._drawn_highlights = highlights
+        self._drag_rect = drag_rect
+        self._drawn_history_frame = history_frame
+        self._drawn_history_rows = history_rows
+        self._drawn_promotion = promotion_state
+        self._drawn_game_over = game_over
+        self._drawn_stats = stats_text
+        self._drawn_analysis = analysis_text
+        self._drawn_clock = clock_display
+        self._drawn_threats = threat_key
+        return dirty
+        
+    def _repaint(self, screen, area, board, move_history, highlights, dragged,
+                 promotion_color, game_over, stats_text=None, analysis_text=None,
+                 clock_display=None, show_threats=False, mouse_pos=None):
+        """Redraw every layer of the scene, clipped to ``area``."""
+        screen.set_clip(area)
+        self.draw_board(screen, board, area, self._threat_surface if show_threats else None)
+        if highlights:
+            self.draw_legal_moves(screen, highlights, area)
+        if dragged:
+            self.draw_dragged_piece(screen, dragged[0], dragged[1])
+        if area.colliderect(HISTORY_REGION):
+            self.draw_move_history(screen, move_history, area)
+        if promotion_color is not None:
+            self.draw_promotion_popup(screen, promotion_color, mouse_pos)
+        if game_over:
+            self.draw_game_over_popup(screen, *game_over)
+        if stats_text and area.colliderect(STATS_RECT):
+            self.draw_stats_overlay(screen, stats_text)
+        if analysis_text and area.colliderect(ANALYSIS_RECT):
+            self.draw_analysis(screen, analysis_text)
+        if clock_display and area.colliderect(CLOCK_RECT):
+            self.draw_clocks(screen, *clock_display)
+        screen.set_clip(None)
+        
+    def _get_square_rect(self, square):
+        rank, file = square // 8, square % 8
+        display_rank = 7 - rank
+        return pygame.Rect(
+            BOARD_X + file * SQUARE_SIZE,
+            BOARD_Y + display_rank * SQUARE_SIZE,
+            SQUARE_SIZE,
+            SQUARE_SIZE
+        )
+        
+    def _get_popup_rect(self, popup_width, popup_height):
+        return pygame.Rect((WINDOW_WIDTH - popup_width) // 2, (WINDOW_HEIGHT - popup_height) // 2,
+                           popup_width, popup_height)
+                
+    def draw_board(self, screen, board, area=None, overlay=None):
+        region = pygame.Rect(BOARD_REGION)
+        if area is not None:
+            region = region.clip(area)
+        screen.blit(self._background, region, region)
+        if overlay is not None:
+            board_rect = pygame.Rect(BOARD_X, BOARD_Y, BOARD_SIZE, BOARD_SIZE)
+            visible = board_rect.clip(region)
+            screen.blit(overlay, visible, visible.move(-BOARD_X, -BOARD_Y))
+        
+        for square, piece in board.pieces.items():
+            square_rect = self._get_square_rect(square)
+            if not square_rect.colliderect(region):
+                continue
+            piece_image = self.piece_images.get((piece.color, piece.type))
+            if piece_image:
+                piece_rect = piece_image.get_rect(center=square_rect.center)
+                screen.blit(piece_image, piece_rect)
+        
+    def _build_threat_surface(self, threats):
+        """Pre-render the threat overlay for the board area."""
+        surface = pygame.Surface((BOARD_SIZE, BOARD_SIZE), pygame.SRCALPHA)
+        white, black = threats.attacked[WHITE], threats.attacked[BLACK]
+        for square in iter_squares(white | black):
+            if white >> square & 1 and black >> square & 1:
+                tint = THREAT_BOTH
+            else:
+                tint = THREAT_WHITE if white >> square & 1 else THREAT_BLACK
+            surface.fill(tint, self._get_square_rect(square).move(-BOARD_X, -BOARD_Y))
+        for square in iter_squares(threats.hanging):
+            rect = self._get_square_rect(square).move(-BOARD_X, -BOARD_Y)
+            pygame.draw.rect(surface, THREAT_HANGING, rect.inflate(-4, -4), 4, border_radius=6)
+        for square in iter_squares(threats.pinned):
+            rect = self._get_square_rect(square).move(-BOARD_X, -BOARD_Y)
+            pygame.draw.circle(surface, THREAT_PINNED, (rect.right - 12, rect.top + 12), 7)
+        return surface
         
     def _draw_labels(self, screen):
 
         for i, file in enumerate(FILES):
-            text = self.font.render(file, True, (255, 255, 255))
+            text = self._render_text(file, self.font, (255, 255, 255))
             text_rect = text.get_rect(center=(BOARD_X + i * SQUARE_SIZE + SQUARE_SIZE // 2,
                                             BOARD_Y + BOARD_SIZE + 10))
             screen.blit(text, text_rect)
             
         for i, rank in enumerate(RANKS):
-            text = self.font.render(rank, True, (255, 255, 255))
+            text = self._render_text(rank, self.font, (255, 255, 255))
             text_rect = text.get_rect(center=(BOARD_X - 15,
                                             BOARD_Y + i * SQUARE_SIZE + SQUARE_SIZE // 2))
             screen.blit(text, text_rect)
             
-    def draw_legal_moves(self, screen, legal_moves):
+    def draw_legal_moves(self, screen, legal_moves, area=None):
         for square in legal_moves:
-            rank, file = square // 8, square % 8
-            display_rank = 7 - rank
-            square_rect = pygame.Rect(
-                BOARD_X + file * SQUARE_SIZE,
-                BOARD_Y + display_rank * SQUARE_SIZE,
-                SQUARE_SIZE,
-                SQUARE_SIZE
-            )
-            
-            overlay = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-            overlay.set_alpha(128)
-            overlay.fill(HIGHLIGHT_LEGAL)
-            screen.blit(overlay, square_rect)
+            square_rect = self._get_square_rect(square)
+            if area is not None and not square_rect.colliderect(area):
+                continue
+            screen.blit(self._highlight, square_rect)
             
     def draw_dragged_piece(self, screen, piece, mouse_pos):
         piece_image = self.piece_images.get((piece.color, piece.type))
@@ -110,7 +327,40 @@ class GameUI:
             piece_rect = piece_image.get_rect(center=mouse_pos)
             screen.blit(piece_image, piece_rect)
             
-    def draw_move_history(self, screen, move_history):
+    def _get_history_layout(self, move_history):
+        """Return (pairs, start_idx, end_idx, max_rows) for the visible history page."""
+        pairs = move_history.get_move_pairs()
+        total_rows = len(pairs)
+        max_rows = max(1, (HISTORY_HEIGHT - 80) // HISTORY_ROW_HEIGHT)
+
+        # Compute start index so that history_scroll==0 shows the last page
+        max_scroll = max(0, total_rows - max_rows)
+        scroll = max(0, min(self.history_scroll, max_scroll))
+        start_idx = max(0, total_rows - max_rows - scroll)
+        end_idx = min(total_rows, start_idx + max_rows)
+        return pairs, start_idx, end_idx, max_rows
+        
+    def _get_history_state(self, move_history):
+        """Summarise what the history panel shows, to detect which parts changed.
+
+        The frame covers everything that moves when the page scrolls; the rows
+        are the (number, white, black) texts of each visible row.
+        """
+        if move_history.version == self._history_version and self.history_scroll == self._history_scroll:
+            return self._drawn_history_frame, self._drawn_history_rows
+        self._history_version = move_history.version
+        self._history_scroll = self.history_scroll
+        
+        pairs, start_idx, end_idx, max_rows = self._get_history_layout(move_history)
+        frame = (start_idx, len(pairs) > max_rows and (start_idx, len(pairs)), end_idx < len(pairs))
+        rows = [(start_idx + idx + 1,) + tuple(pair) for idx, pair in enumerate(pairs[start_idx:end_idx])]
+        return frame, rows
+        
+    def _get_history_row_rect(self, idx):
+        return pygame.Rect(HISTORY_X + 10, HISTORY_Y + 60 + idx * HISTORY_ROW_HEIGHT,
+                           HISTORY_WIDTH - 20, HISTORY_ROW_HEIGHT - 4)
+            
+    def _draw_history_frame(self, screen):
         history_rect = pygame.Rect(HISTORY_X, HISTORY_Y, HISTORY_WIDTH, HISTORY_HEIGHT)
         
         pygame.draw.rect(screen, (30, 30, 35), history_rect, border_radius=12)
@@ -123,23 +373,22 @@ class GameUI:
         title_rect = pygame.Rect(HISTORY_X + 15, HISTORY_Y + 15, HISTORY_WIDTH - 30, 30)
         pygame.draw.rect(screen, (45, 45, 50), title_rect, border_radius=8)
         
-        title_text = self.font.render("MOVE HISTORY", True, (180, 180, 190))
+        title_text = self._render_text("MOVE HISTORY", self.font, (180, 180, 190))
         title_text_rect = title_text.get_rect(center=title_rect.center)
         screen.blit(title_text, title_text_rect)
+            
+    def draw_move_history(self, screen, move_history, area=None):
+        region = pygame.Rect(HISTORY_REGION)
+        if area is not None:
+            region = region.clip(area)
+        screen.blit(self._background, region, region)
         
         # Render move pairs (white / black) in two columns, make scrollable
-        row_height = 28
+        row_height = HISTORY_ROW_HEIGHT
         y_offset = 60
 
-        pairs = move_history.get_move_pairs()
+        pairs, start_idx, end_idx, max_rows = self._get_history_layout(move_history)
         total_rows = len(pairs)
-        max_rows = max(1, (HISTORY_HEIGHT - 80) // row_height)
-
-        # Compute start index so that history_scroll==0 shows the last page
-        max_scroll = max(0, total_rows - max_rows)
-        scroll = max(0, min(self.history_scroll, max_scroll))
-        start_idx = max(0, total_rows - max_rows - scroll)
-        end_idx = start_idx + max_rows
 
         visible_pairs = pairs[start_idx:end_idx]
 
@@ -151,6 +400,9 @@ class GameUI:
         for idx, (white_move, black_move) in enumerate(visible_pairs):
             if y_offset + row_height > HISTORY_Y + HISTORY_HEIGHT - 20:
                 break
+            if area is not None and not self._get_history_row_rect(idx).colliderect(area):
+                y_offset += row_height
+                continue
 
             move_num = start_idx + idx + 1
 
@@ -158,7 +410,7 @@ class GameUI:
             num_rect = pygame.Rect(HISTORY_X + 10, HISTORY_Y + y_offset, num_w, row_height - 4)
             pygame.draw.rect(screen, (35, 35, 40), num_rect, border_radius=6)
             pygame.draw.rect(screen, (60, 60, 70), num_rect, 1, border_radius=6)
-            num_text = self.font.render(f"{move_num}.", True, (180, 180, 190))
+            num_text = self._render_text(f"{move_num}.", self.font, (180, 180, 190))
             num_text_rect = num_text.get_rect(center=num_rect.center)
             screen.blit(num_text, num_text_rect)
 
@@ -166,15 +418,15 @@ class GameUI:
             white_rect = pygame.Rect(white_col_x + num_w + 5, HISTORY_Y + y_offset, HISTORY_WIDTH // 2 - num_w - 30, row_height - 4)
             pygame.draw.rect(screen, (40, 40, 45), white_rect, border_radius=6)
             pygame.draw.rect(screen, (70, 70, 80), white_rect, 1, border_radius=6)
-            white_text = self.font.render(white_move if white_move else "", True, (220, 220, 230))
+            white_text = self._render_text(white_move if white_move else "", self.font, (220, 220, 230))
             white_text_rect = white_text.get_rect(center=white_rect.center)
             screen.blit(white_text, white_text_rect)
 
             # Black move box
-            black_rect = pygame.Rect(HISTORY_X + HISTORY_WIDTH // 2 + 5, HISTORY_Y + y_offset, HISTORY_WIDTH // 2 - 15, row_height - 4)
+            black_rect = pygame.Rect(black_col_x, HISTORY_Y + y_offset, HISTORY_WIDTH // 2 - 15, row_height - 4)
             pygame.draw.rect(screen, (35, 35, 40), black_rect, border_radius=6)
             pygame.draw.rect(screen, (60, 60, 70), black_rect, 1, border_radius=6)
-            black_text = self.font.render(black_move if black_move else "", True, (180, 180, 190))
+            black_text = self._render_text(black_move if black_move else "", self.font, (180, 180, 190))
             black_text_rect = black_text.get_rect(center=black_rect.center)
             screen.blit(black_text, black_text_rect)
 
@@ -192,14 +444,44 @@ class GameUI:
 
         # Show '...' when there are off-screen rows above or below
         if start_idx > 0:
-            up_text = self.font.render("^", True, (150, 150, 160))
+            up_text = self._render_text("^", self.font, (150, 150, 160))
             up_rect = up_text.get_rect(center=(HISTORY_X + HISTORY_WIDTH // 2, HISTORY_Y + 45))
             screen.blit(up_text, up_rect)
         if end_idx < total_rows:
-            down_text = self.font.render("v", True, (150, 150, 160))
+            down_text = self._render_text("v", self.font, (150, 150, 160))
             down_rect = down_text.get_rect(center=(HISTORY_X + HISTORY_WIDTH // 2, HISTORY_Y + HISTORY_HEIGHT - 15))
             screen.blit(down_text, down_rect)
 
+    def draw_stats_overlay(self, screen, stats_text):
+        stats_rect = pygame.Rect(STATS_RECT)
+        pygame.draw.rect(screen, (30, 30, 35), stats_rect, border_radius=6)
+        text = self._render_text(stats_text, self.font, (120, 220, 120))
+        screen.blit(text, text.get_rect(midleft=(stats_rect.x + 8, stats_rect.centery)))
+        
+    def draw_analysis(self, screen, analysis_text):
+        analysis_rect = pygame.Rect(ANALYSIS_RECT)
+        pygame.draw.rect(screen, (30, 30, 35), analysis_rect, border_radius=6)
+        text = self._render_text(analysis_text, self.font, (220, 200, 120))
+        # Long lines are cut at the panel edge rather than spilling over it
+        screen.blit(text, text.get_rect(midleft=(analysis_rect.x + 8, analysis_rect.centery)),
+                    pygame.Rect(0, 0, analysis_rect.width - 16, text.get_height()))
+        
+    def draw_clocks(self, screen, white_time, black_time, running):
+        clock_rect = pygame.Rect(CLOCK_RECT)
+        half = clock_rect.width // 2
+        for index, (color, name, remaining) in enumerate(((WHITE, "White", white_time),
+                                                          (BLACK, "Black", black_time))):
+            rect = pygame.Rect(clock_rect.x + index * half, clock_rect.y, half - 4, clock_rect.height)
+            active = color == running
+            pygame.draw.rect(screen, (60, 60, 70) if active else (30, 30, 35), rect, border_radius=6)
+            # Times shown in tenths are running low
+            text_color = (230, 90, 90) if '.' in remaining else (
+                (240, 240, 245) if active else (150, 150, 160))
+            label = self._render_text(name, self.font, text_color)
+            screen.blit(label, label.get_rect(midleft=(rect.x + 8, rect.centery)))
+            text = self._render_text(remaining, self.font, text_color)
+            screen.blit(text, text.get_rect(midright=(rect.right - 8, rect.centery)))
+        
     def scroll_history(self, delta, total_rows=None, max_rows=None):
         """Adjust history scroll. delta is positive to scroll up (older moves)."""
         if total_rows is None:
@@ -209,13 +491,15 @@ class GameUI:
         max_scroll = max(0, total_rows - max_rows)
         self.history_scroll = max(0, min(self.history_scroll + delta, max_scroll))
                 
-    def draw_promotion_popup(self, screen, color):
+    def draw_promotion_popup(self, screen, color, mouse_pos=None):
         popup_width = 200
         popup_height = 100
         popup_x = (WINDOW_WIDTH - popup_width) // 2
         popup_y = (WINDOW_HEIGHT - popup_height) // 2
         
         popup_rect = pygame.Rect(popup_x, popup_y, popup_width, popup_height)
+        if mouse_pos is None:
+            mouse_pos = pygame.mouse.get_pos()
         pygame.draw.rect(screen, PROMOTION_BG, popup_rect, border_radius=10)
         pygame.draw.rect(screen, (100, 100, 100), popup_rect, 2, border_radius=10)
         
@@ -230,13 +514,12 @@ class GameUI:
                 30
             )
             
-            mouse_pos = pygame.mouse.get_pos()
             if piece_rect.collidepoint(mouse_pos):
                 pygame.draw.rect(screen, PROMOTION_HOVER, piece_rect, border_radius=5)
             else:
                 pygame.draw.rect(screen, (150, 150, 150), piece_rect, border_radius=5)
                 
-            text = self.font.render(piece_names[piece_type], True, (255, 255, 255))
+            text = self._render_text(piece_names[piece_type], self.font, (255, 255, 255))
             text_rect = text.get_rect(center=piece_rect.center)
             screen.blit(text, text_rect)
             
@@ -251,11 +534,13 @@ class GameUI:
         pygame.draw.rect(screen, (100, 100, 100), popup_rect, 3, border_radius=10)
         
         if game_result == 'checkmate':
-            text = f"Checkmate! {winner.title()} wins!"
+            text = f"Checkmate! {'White' if winner == WHITE else 'Black'} wins!"
+        elif game_result == 'timeout':
+            text = f"Time! {'White' if winner == WHITE else 'Black'} wins!"
         else:  # stalemate
             text = "Stalemate! No winner."
             
-        text_surface = self.times_font.render(text, True, (255, 255, 255))
+        text_surface = self._render_text(text, self.times_font, (255, 255, 255))
         text_rect = text_surface.get_rect(center=(popup_x + popup_width // 2,
                                                 popup_y + popup_height // 2))
         screen.blit(text_surface, text_rect)
@@ -0,0 +1,262 @@
+
+import argparse
+import json
+import sys
+
+from bitboard import KING_MASKS
+from board import ChessBoard
+from constants import *
+
+# Games validated per chunk; results are handed back chunk by chunk, so memory
+# stays flat however long the input stream is
+CHUNK_SIZE = 1000
+
+# Longest move list accepted from a client
+MAX_PLIES = 2000
+
+PROMOTION_LETTERS = {'q': QUEEN, 'r': ROOK, 'b': BISHOP, 'n': KNIGHT}
+
+
+def _build_uci_table():
+    """Map every well-formed coordinate move, e.g. 'e2e4' or 'e7e8q', to (from, to, promotion)."""
+    names = [file + rank for rank in '12345678' for file in FILES]
+    table = {}
+    for from_square, from_name in enumerate(names):
+        for to_square, to_name in enumerate(names):
+            if from_square == to_square:
+                continue
+            table[from_name + to_name] = (from_square, to_square, None)
+            if to_square // 8 in (0, 7) and abs(from_square % 8 - to_square % 8) <= 1:
+                for letter, piece_type in PROMOTION_LETTERS.items():
+                    table[from_name + to_name + letter] = (from_square, to_square, piece_type)
+    return table
+
+
+# Built once and shared by every game validated in this process
+UCI_MOVES = _build_uci_table()
+
+
+class GameValidation:
+    """Outcome of replaying one game's move list.
+
+    A valid game has its final ``fen``, ``status`` and ``san`` moves.
+    Otherwise ``illegal_ply`` is the 1-based ply of the first move that
+    could not be played (0 when the start position itself is bad), ``san``
+    holds the moves before it and ``error`` says what went wrong.
+    """
+
+    def __init__(self, index, fen=None, status=None, san=None, illegal_ply=None, error=None):
+        self.index = index  # Position of the game in the batch
+        self.fen = fen
+        self.status = status
+        self.san = san if san is not None else []
+        self.illegal_ply = illegal_ply
+        self.error = error
+
+    def is_valid(self):
+        return self.error is None
+
+    def to_dict(self):
+        if self.is_valid():
+            return {'index': self.index, 'valid': True, 'fen': self.fen,
+                    'status': self.status, 'san': self.san}
+        return {'index': self.index, 'valid': False, 'illegal_ply': self.illegal_ply,
+                'error': self.error, 'san': self.san}
+
+
+def parse_move(board, text):
+    """Resolve a coordinate or SAN move to a legal (from, to, promotion), or None."""
+    if not isinstance(text, str):
+        return None
+    move = UCI_MOVES.get(text.strip().lower())
+    if move is not None:
+        return move if move in board._legal_move_list() else None
+    return board.parse_san(text.strip())
+
+
+# Pawns can never stand on the first or eighth rank
+BACK_RANKS = 0xFF | 0xFF << 56
+
+
+def start_position_error(board, fen):
+    """Return why ``fen``, as set up on ``board``, cannot start a game, or None if it can."""
+    fields = fen.split()
+    if len(fields) != 6:
+        return f"a FEN has 6 fields, not {len(fields)}"
+    if fields[1] not in ('w', 'b'):
+        return f"side to move must be 'w' or 'b', not {fields[1]!r}"
+    if board.bitboard.halfmove_clock < 0:
+        return "the halfmove clock is negative"
+    if board.bitboard.fullmove_number < 1:
+        return "the move number is not positive"
+
+    kings = {}
+    for color, name in ((WHITE, "White"), (BLACK, "Black")):
+        king_board = board.bitboard.boards[color][KING]
+        if bin(king_board).count('1') != 1:
+            return f"{name} does not have exactly one king"
+        kings[color] = king_board
+        if board.bitboard.boards[color][PAWN] & BACK_RANKS:
+            return f"{name} has a pawn on the first or eighth rank"
+    if KING_MASKS[kings[WHITE].bit_length() - 1] & kings[BLACK]:
+        return "the kings are touching"
+    if board.bitboard.is_king_in_check(BLACK if board.side_to_move == WHITE else WHITE):
+        return "the side not to move is in check"
+
+    target = board.en_passant_target
+    if target is not None:
+        # The pawn that just moved two squares stands in front of the target,
+        # and the square it came from, behind the target, is empty
+        if board.side_to_move == WHITE:
+            rank, pawn_square, origin = 5, target - 8, target + 8
+        else:
+            rank, pawn_square, origin = 2, target + 8, target - 8
+        pawn = board.pieces.get(pawn_square) if 0 <= target < 64 else None
+        if (len(fields[3]) != 2 or target // 8 != rank or target in board.pieces or origin in board.pieces or
+                pawn is None or pawn.type != PAWN or pawn.color == board.side_to_move):
+            return "the en passant square is not behind a pawn that just moved two squares"
+    return None
+
+
+class BatchValidator:
+    """Validates (start FEN, move list) pairs on one reused board.
+
+    Each game is played forward with the low-level make/unmake calls and
+    then taken back move by move, which leaves the board on the start
+    position again. Within a chunk games are grouped by start position, so
+    the board is only set up from a FEN when the start changes.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_plies=MAX_PLIES):
+        self.chunk_size = chunk_size
+        self.max_plies = max_plies
+        self.board = ChessBoard()
+        self._start = INITIAL_FEN  # Position the board is on between games
+        self._start_error = None  # Why that position cannot start a game, if it cannot
+        self.games = 0
+        self.setups = 0
+
+    def validate(self, games):
+        """Yield a GameValidation for each (start FEN, moves) pair, in input order.
+
+        ``games`` may be any iterable, including a generator over a stream;
+        only one chunk of it is held at a time. A start of None means the
+        standard initial position.
+        """
+        chunk = []
+        for game in games:
+            chunk.append(game)
+            if len(chunk) >= self.chunk_size:
+                yield from self._validate_chunk(chunk)
+                chunk = []
+        yield from self._validate_chunk(chunk)
+
+    def _validate_chunk(self, chunk):
+        offset = self.games
+        self.games += len(chunk)
+        results = [None] * len(chunk)
+        starts = [_start_fen(game) for game in chunk]
+        for position in sorted(range(len(chunk)), key=lambda position: str(starts[position])):
+            results[position] = self.validate_game(offset + position, starts[position],
+                                                   _move_list(chunk[position]))
+        return results
+
+    def validate_game(self, index, start, moves):
+        """Replay one game and return its GameValidation."""
+        board = self.board
+        if not isinstance(start, str):
+            return GameValidation(index, illegal_ply=0, error="start position is not a FEN string")
+        if start != self._start:
+            try:
+                self._start = None  # Unknown until set_fen succeeds
+                board.set_fen(start)
+            except (ValueError, IndexError, KeyError) as e:
+                return GameValidation(index, illegal_ply=0, error=f"bad start position: {e}")
+            self._start = start
+            self._start_error = start_position_error(board, start)
+            self.setups += 1
+        if self._start_error is not None:
+            return GameValidation(index, illegal_ply=0,
+                                  error=f"bad start position: {self._start_error}")
+        if not isinstance(moves, (list, tuple)):
+            return GameValidation(index, illegal_ply=0, error="moves are not a list")
+
+        records = []
+        san = []
+        error = None
+        try:
+            for ply, text in enumerate(moves[:self.max_plies + 1], 1):
+                if ply > self.max_plies:
+                    error = f"more than {self.max_plies} plies"
+                    break
+                move = parse_move(board, text)
+                if move is None:
+                    error = f"illegal or unreadable move {text!r}"
+                    break
+                from_square, to_square, promotion = move
+                notation = board._get_move_notation(from_square, to_square,
+                                                    board.pieces[from_square], promotion,
+                                                    board._legal_move_list())
+                records.append(board._apply_move(from_square, to_square, promotion))
+                # The suffix needs the new position's status, which the next
+                # ply reuses for its own legal moves
+                san.append(notation + board._check_suffix())
+
+            if error is not None:
+                return GameValidation(index, san=san, illegal_ply=len(san) + 1, error=error)
+            return GameValidation(index, board.get_fen(), board.get_game_status(), san)
+        finally:
+            for record in reversed(records):
+                board.unmake_move(record)
+
+
+def _start_fen(game):
+    start = game[0] if isinstance(game, (list, tuple)) and game else None
+    return INITIAL_FEN if start in (None, '', 'startpos') else start
+
+
+def _move_list(game):
+    return game[1] if isinstance(game, (list, tuple)) and len(game) > 1 else None
+
+
+def validate_games(games, chunk_size=CHUNK_SIZE):
+    """Validate an iterable of (start FEN, moves) pairs; returns a list of GameValidation."""
+    return list(BatchValidator(chunk_size).validate(games))
+
+
+def _read_requests(stream):
+    # One JSON object per line: {"fen": optional start FEN, "moves": [...]}
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            request = None
+        if not isinstance(request, dict):
+            yield (None, None)
+        else:
+            yield (request.get('fen'), request.get('moves'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate move lists read as JSON lines "
+                                                 "({\"fen\": ..., \"moves\": [...]}).")
+    parser.add_argument('input', nargs='?', help="request file (default: standard input)")
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="games per chunk")
+    args = parser.parse_args()
+
+    stream = open(args.input) if args.input else sys.stdin
+    validator = BatchValidator(args.chunk)
+    try:
+        for result in validator.validate(_read_requests(stream)):
+            print(json.dumps(result.to_dict()))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())